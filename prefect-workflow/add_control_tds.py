@@ -7,9 +7,10 @@ the "auto_add_data_tds_{datetime}.log" file through
 running the "generate_auto_add_data_tds.py" script.
 
 Steps:
-1. The new added index is generated from 
+1. The new added index of all datasets is generated in-process by
+src/createCTL.py (`fetch_all_control_records`, two dssdb queries in total), same as
 ```
-python src/createCTL.py <dsid>
+python src/createCTL.py --log <log_file>
 ```
 
 2. Generate the original control file through
@@ -25,37 +26,42 @@ dsrqst -sc -ds <dsid> -if <control_file> -md -nc
 """
 import argparse
 import os
-import requests
+import sys
 import subprocess
 from datetime import datetime
 from prefect import flow, task
+from prefect.cache_policies import NO_CACHE
 from prefect.logging import get_run_logger
 
 # Get the directory of this script and the project root
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)  # Project root directory
 
+# shared helpers in src/
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'src'))
+from check_urls import check_urls, status_is_ok
+from createCTL import ControlRecord, connect_dssdb, fetch_all_control_records, load_env
+
 @task
-def url_is_ok(url):
+def check_control_urls(urls: list[str]) -> dict:
     """
-    Check if a URL is reachable (status code 200-399).
+    Check the URLs of control entries concurrently.
+
+    One keep-alive connection pool, bounded concurrency under the ingress
+    rate limit, HEAD with GET fallback and retry with backoff
+    (see src/check_urls.py).
 
     Parameters
     ----------
-    url : str
-        The URL to check.
+    urls : list[str]
+        The URLs to check.
 
     Returns
     -------
-    bool
-        True if the URL is reachable (status code 200-399), False otherwise.
+    dict
+        URL to HTTP status code (None if unreachable).
     """
-    try:
-        response = requests.get(url, timeout=10)
-        return response.ok  # True if status_code is 200-399
-    except Exception as e:
-        print(f"Error: {e}")
-        return False
+    return check_urls(urls)
 
 @task
 def parse_log_file(log_file: str) -> list[str]:
@@ -108,35 +114,26 @@ def get_control_file(dsid: str) -> str:
         print(f"STDERR: {err_result.stderr}")
         return err_result
 
-@task
-def create_ctl(dataset_id: str):
-    """Create CTL file for the dataset using the existing script.
+@task(cache_policy=NO_CACHE)
+def create_ctl(dataset_ids: list[str], conn) -> dict:
+    """Create the CTL entries for the datasets with createCTL.py.
     Parameters
     ----------
-    dataset_id : str
-        The dataset ID to create CTL for. 
+    dataset_ids : list[str]
+        The dataset IDs to create CTL for, fetched with two queries in total.
+    conn : psycopg2 connection
+        Connection to rdadb as dssdb (see `connect_dssdb`).
 
     Returns
     -------
-        standard output from the createCTL.py
+    dict
+        dsid to the list[ControlRecord] of its TDS link entries
+        (datasets without a specialist in dsowner are left out).
     """
-    command = ["python", os.path.join(PROJECT_ROOT,'src','createCTL.py'), dataset_id]
-    try:
-        result = subprocess.run(
-            command,
-            check=True,
-            capture_output=True,
-            text=True
-        )
-
-        # store standard output lines
-        control_lines = result.stdout.strip().splitlines()
-        return control_lines
-    except subprocess.CalledProcessError as e:
-        raise e
+    return fetch_all_control_records(conn, dataset_ids)
 
 @task
-def create_control_file(dsid: str) -> str:
+def create_control_file(dsid: str, new_control_records: list[ControlRecord]) -> str:
     """Create the new control file for the given dataset ID.
     this add the new TDS URL entry on the original control file.
     Currently set output directory to prefect-workflow/
@@ -145,26 +142,23 @@ def create_control_file(dsid: str) -> str:
     ----------
     dsid : str
         Dataset ID.
-    control_lines : list[str]
-        Original control file lines.
+    new_control_records : list[ControlRecord]
+        The TDS link entries of the dataset (see `create_ctl`).
 
     Returns
     -------
     str
         Path to the new control file.
     """
-    # use createCTL.py to generate the new control file lines
-    new_control_lines = create_ctl(dsid)
-
-    # test the new control lines for URL validity
+    # test the new control lines for URL validity, all URLs at once
+    statuses = check_control_urls([record.url for record in new_control_records])
     tested_new_control_lines = []
-    for line in new_control_lines:
-        infos = line.strip().split('<:>')
-        url = infos[9]
+    for record in new_control_records:
         # skip the TDS url if URL not working
-        if not url_is_ok(url):
+        if not status_is_ok(statuses[record.url]):
+            print(f"Skip unreachable TDS URL ({statuses[record.url]}): {record.url}")
             continue
-        tested_new_control_lines.append(line)
+        tested_new_control_lines.append(record.to_line())
 
     # get original control file
     old_control_lines = get_control_file(dsid)
@@ -225,10 +219,21 @@ def main(log_file_name: str):
     dsids = parse_log_file(data_log_file)
     logger.info(f"Total dataset IDs to process: {len(dsids)}")
 
+    # use createCTL.py to generate the new control entries of all datasets at once
+    load_env()
+    conn = connect_dssdb()
+    try:
+        records_by_dsid = create_ctl(dsids, conn)
+    finally:
+        conn.close()
+
     for dsid in dsids:
         logger.info(f"Processing dataset ID: {dsid}")
+        if dsid not in records_by_dsid:
+            logger.error(f"Failed to create control entries for {dsid}: no specialist in dsowner.")
+            continue
         # create new control file with TDS URL entry
-        new_control_file = create_control_file(dsid)
+        new_control_file = create_control_file(dsid, records_by_dsid[dsid])
         logger.info(f"New control file created at: {new_control_file}")
         # add TDS URL entry using the new control file
         dsrqst_result = add_tds_url(dsid, new_control_file)
@@ -2,14 +2,21 @@
 A Prefect flow to add new datasets to the THREDDS Data Server (TDS) catalog.
 
 The flow performs the following steps:
-1. Retrieves all dataset IDs from the metadata database.
+1. Takes a metadata snapshot (titles, summaries, formats, data types,
+   contributors and projects) of all datasets in the metadata database
+   using one set-based query per table.
 2. Retrieves all dataset IDs currently listed in the TDS catalog XML file.
 3. For each dataset ID in the database:
    a. If it is already in the catalog, skip it.
-   b. Check if its format is supported by TDS (netcdf, grib1, grib2).
-   c. If supported:
-      - Create XML for the dataset using an existing script.
-      - Add it to the catalog in alphabetical order by title.
+   b. Vet it: format supported by TDS (netcdf, grib1, grib2), not excluded,
+      has data files, no CDF5 files. Datasets are vetted concurrently on a
+      bounded thread pool (TDS_VET_WORKERS, default 8). Rejected datasets are
+      remembered in a local cache (vet_cache.py) and skipped while their data
+      directory mtime and metadata rows are unchanged.
+   c. If accepted (applied serially in sorted order):
+      - Create XML for the dataset with createXML.write_catalog.
+      - Add it to the catalog in alphabetical order by title (all additions
+        of the run are applied with one parse/write of catalog.xml).
 
 Environment variables loaded from local .env file
 """
@@ -18,11 +25,10 @@ Environment variables loaded from local .env file
 import os
 import sys
 import json
-import subprocess
 from datetime import datetime
-import psycopg2 as sql
 from prefect import flow, task
 from prefect.logging import get_run_logger
+from prefect.task_runners import ThreadPoolTaskRunner
 import xml.etree.ElementTree as ET
 
 # Get the directory of this script and the project root
@@ -30,6 +36,15 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)  # Project root directory
 GDEX_DATA_ROOT = os.path.normpath('/gdex/data')
 
+# shared helper modules live in src/
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'src'))
+from dataset_metadata import connect_metadata_db, fetch_metadata
+from createXML import MixedDataTypeError, create_catalogs, write_catalog
+from scan_datafiles import ScanSummary, scan_data_dir
+from sniff_format import cdf5_fraction, classify_files
+from vet_cache import VetCache, dir_mtime_ns
+from catalog_editor import CatalogEditor
+
 # for reading local .env file
 try:
     # Load environment variables from .env file (searches up directory tree)
@@ -43,35 +58,29 @@ except ImportError:
 os.environ['PYTHONWARNINGS'] = 'ignore::UserWarning:pydantic._internal._generate_schema'
 ##########################################
 
+# number of datasets vetted concurrently (checks are I/O bound: GLADE walks, file probes)
+VET_WORKERS = int(os.getenv('TDS_VET_WORKERS', '8'))
 
 
 @task
-def get_all_db_dsid():
-    """Get all dataset IDs from the database.
-    
+def get_metadata_snapshot() -> dict:
+    """Get the catalog metadata of all datasets from the database.
+
+    One connection and one set-based query per table
+    (see `dataset_metadata.fetch_metadata`).
+
     Returns
     -------
-    list
-        List of all dataset IDs from the database.
+    dict
+        Dataset ID to `DatasetMetadata` for all datasets in the database.
     """
-    # Get password from environment variable or prompt the user
-    pw = os.getenv('META')
-    if pw is None:
-        pw = input("Enter metadata pw: ")
-
-    # New Connection to search db
-    conn = sql.connect(user='metadata', password=pw, host='rda-db.ucar.edu', database='rdadb')
-    cursor = conn.cursor()
-
-    # Query all dataset IDs
-    query = "select dsid from search.datasets order by dsid"
-    cursor.execute(query)
-    dataset_ids = [row[0] for row in cursor.fetchall()]
-
-    cursor.close()
-    conn.close()
+    conn = connect_metadata_db()
+    try:
+        snapshot = fetch_metadata(conn)
+    finally:
+        conn.close()
 
-    return dataset_ids
+    return snapshot
 
 @task
 def get_all_tds_dsid(catalog_file: str):
@@ -115,37 +124,21 @@ def get_all_tds_dsid(catalog_file: str):
     return dataset_ids
 
 @task
-def check_format(dataset_id: str) -> bool:
+def check_format(data_formats: list[str]) -> bool:
     """Check if format is supported by TDS.
     currently supported formats: netcdf, grib1, grib2
 
     Parameters
     ----------
-    dataset_id : str
-        The dataset ID to check.
+    data_formats : list[str]
+        The format keywords of the dataset (from the metadata snapshot).
     
     Returns
     -------
     bool
         True if format is supported by TDS, False otherwise.
     """
-    # Get password from environment variable or prompt the user
-    pw = os.getenv('META')
-    if pw is None:
-        pw = input("Enter metadata pw: ")
-
-    # New Connection to search db
-    conn = sql.connect(user = 'metadata', password=pw, host = 'rda-db.ucar.edu', database='rdadb')
-    cursor = conn.cursor()
-
-    # Get format
-    query = "select keyword from search.formats where dsid='"+dataset_id+"'"
-    cursor.execute(query)
-    all_rows = cursor.fetchall()
-    data_formats = [row[0].lower() for row in all_rows]
-
-    cursor.close()
-    conn.close()
+    data_formats = [data_format.lower() for data_format in data_formats]
 
     # currently supported formats
     supported_formats = ['netcdf', 'grib1', 'grib2']
@@ -156,65 +149,64 @@ def check_format(dataset_id: str) -> bool:
     return False
 
 @task
-def check_cdf5(dataset_id: str, sample_size: int = 10) -> bool:
-    """Check if dataset has CDF5 data files by sampling a subset of files.
+def scan_dataset(dataset_id: str, sample_size: int = 10, classify_all: bool = False) -> ScanSummary:
+    """Walk the dataset data directory once (see `scan_data_dir`).
 
     Parameters
     ----------
     dataset_id : str
-        The dataset ID to check.
+        The dataset ID to scan.
     sample_size : int
-        Number of files to randomly sample (default 10).
+        Number of NetCDF files to randomly sample (default 10).
+    classify_all : bool
+        Classify every NetCDF file from its header bytes instead of only
+        the sample (default False).
 
     Returns
     -------
-    bool
-        True if any sampled file is CDF5, False otherwise.
+    ScanSummary
+        Data file counts per extension, total bytes and the NetCDF sample,
+        consumed by `check_datafiles` and `check_cdf5`.
     """
-    import random
-
     data_dir = os.path.join(GDEX_DATA_ROOT, dataset_id)
+    return scan_data_dir(data_dir, sample_size=sample_size, classify=classify_all)
 
-    nc_files = [
-        os.path.join(dirpath, file)
-        for dirpath, _, files in os.walk(data_dir)
-        for file in files
-        if file.endswith(('.nc', '.nc4'))
-    ]
-
-    for filepath in random.sample(nc_files, min(sample_size, len(nc_files))):
-        nctype = subprocess.run(
-            ['ncdump', '-k', filepath],
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        if 'cdf5' in nctype.stdout.lower():
-            return True
-    return False
+@task
+def check_cdf5(summary: ScanSummary) -> tuple[float, int]:
+    """Fraction of CDF5 data files in the dataset.
+
+    The files are classified from their magic bytes (see `sniff_format`).
+    Uses the kinds of all NetCDF files when the scan classified them,
+    otherwise the sampled files.
+
+    Parameters
+    ----------
+    summary : ScanSummary
+        The data directory scan of the dataset.
+
+    Returns
+    -------
+    tuple
+        (fraction of CDF5 files, number of files probed).
+    """
+    kind_counts = summary.kind_counts or classify_files(summary.sample_paths)
+    return cdf5_fraction(kind_counts), sum(kind_counts.values())
 
 @task
-def check_datafiles(dataset_id: str) -> bool:
+def check_datafiles(summary: ScanSummary) -> bool:
     """Check if dataset has data files with supported format.
     
     Parameters
     ----------
-    dataset_id : str
-        The dataset ID to check.
+    summary : ScanSummary
+        The data directory scan of the dataset.
     
     Returns
     -------
     bool
         True if dataset has data files, False otherwise.
     """
-    # doing walk in the data directory to see if any of the format files exist
-    data_dir = os.path.join(GDEX_DATA_ROOT, dataset_id)
-
-    for _, _, files in os.walk(data_dir):
-        for file in files:
-            if file.endswith(('.nc', '.grb', '.grb2','.nc4')):
-                return True
-    return False
+    return summary.has_datafiles
 
 
 @task
@@ -243,176 +235,154 @@ def check_exclude(dataset_id: str) -> bool:
         return False
 
 @task
-def create_xml(dataset_id: str):
-    """Create XML for the dataset using the existing script.
+def create_xml(record):
+    """Create XML for the dataset in-process with `createXML.write_catalog`.
     Parameters
     ----------
-    dataset_id : str
-        The dataset ID to create XML for. 
+    record : DatasetMetadata
+        The metadata of the dataset to create XML for (from the snapshot).
         Currently set output directory to rda-tds/content/
 
     Returns
     -------
-    None
+    tuple
+        (True, "") if the XML is written, (False, error message) otherwise.
     """
 
     try:
-        subprocess.run([
-            os.path.join(PROJECT_ROOT, "src/createXML.py"),
-            dataset_id,
-            os.path.join(PROJECT_ROOT, "rda-tds/content/")
-        ], check=True)
+        write_catalog(record, os.path.join(PROJECT_ROOT, "rda-tds/content/"))
         err_msg = ""
         return True, err_msg
-    except subprocess.CalledProcessError as e:
-        if e.returncode == 250:
-            err_msg = f"dataset {dataset_id}: has different datatypes, skipping"
-            return False, err_msg
-        else:
-            raise
+    except MixedDataTypeError:
+        err_msg = f"dataset {record.dsid}: has different datatypes, skipping"
+        return False, err_msg
 
 @task
-def add_catalog_ref_sorted(catalog_file: str, new_dsid: str, new_title: str):
-    """
-    Add a new catalogRef to the catalog while maintaining alphabetical order by title.
-    
+def sync_xml(records: list) -> tuple[list, dict]:
+    """Regenerate the existing dataset XMLs whose metadata changed.
+
+    Only catalogs whose metadata fingerprint differs from the one recorded
+    in rda-tds/content/catalog_fingerprints.json are rebuilt
+    (see `createXML.create_catalogs`).
+
     Parameters
     ----------
-    catalog_file : str
-        Path to the catalog XML file.
-    new_dsid : str
-        The dataset ID for the new catalogRef.
-    new_title : str
-        The title for the new catalogRef.
-    
+    records : list[DatasetMetadata]
+        The metadata of the datasets already in TDS (from the snapshot).
+
     Returns
     -------
-    None
-
-    Usage
-    -----
-    add_catalog_ref_sorted(
-        'rda-tds/content/catalog.xml',
-        'd123456',
-        'Example New Dataset Title for Testing'
-    )
+    tuple
+        (dataset IDs whose XML changed, dataset ID to error of the skipped ones)
     """
-    # Register namespaces
-    ET.register_namespace('', 'http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0')
-    ET.register_namespace('xlink', 'http://www.w3.org/1999/xlink')
-
-    # Parse the XML
-    tree = ET.parse(catalog_file)
-    root = tree.getroot()
-
-    xmlns = 'http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0'
-    xmlns_xlink = 'http://www.w3.org/1999/xlink'
-
-    # Define namespace map for finding elements
-    namespaces = {
-        'thredds': xmlns,
-        'xlink': xmlns_xlink
-    }
-
-    # Create the new catalogRef element
-    new_ref = ET.Element('catalogRef')
-    new_ref.set('{'+xmlns_xlink+'}href', f'catalog_{new_dsid}.xml')
-    new_ref.set('{'+xmlns_xlink+'}title', f'{new_dsid} {new_title}')
-    new_ref.set('name', '')
-    new_ref.tail = '\n    ' #indentation and newline for pretty print
-
-    # Collect all existing catalogRef elements - default namespace
-    # not showing up in findall without prefix
-    # using the 'thredds' prefix defined in namespaces
-    catalog_refs = list(root.findall('thredds:catalogRef', namespaces))
-
-    # Add the new element to the list
-    catalog_refs.append(new_ref)
-
-    # Sort by xlink:title attribute (case-insensitive)
-    def get_title(elem):
-        title = elem.get('{'+xmlns_xlink+'}title', '')
-        return title.lower()
-
-    catalog_refs.sort(key=get_title)
-
-    # Remove all existing catalogRef elements from root
-    for ref in list(root):
-        if ref.tag == '{'+xmlns+'}catalogRef':
-            root.remove(ref)
-
-    # Add sorted catalogRef elements back to root
-    for ref in catalog_refs:
-        root.append(ref)
-
-    # Write the updated XML back to file
-    tree.write(catalog_file, encoding='utf-8', xml_declaration=True)
-    # print(f"Added {new_dsid} to catalog in sorted position")
-
+    return create_catalogs(records, os.path.join(PROJECT_ROOT, "rda-tds/content/"), sync=True)
 
 @task
-def add2catalog(dataset_id: str):
-    """Add the dataset to the catalog.xml file in sorted order.
+def add2catalog(new_datasets: list[tuple[str, str]]):
+    """Add the datasets to the catalog.xml file in sorted order.
 
-    Utilizes `add_catalog_ref_sorted` to maintain alphabetical order by title.
+    Utilizes `CatalogEditor` to parse the catalog once, insert every
+    catalogRef at its alphabetical position by title and write once.
     
     Parameters
     ----------
-    dataset_id : str
-        The dataset ID to add to the catalog.
+    new_datasets : list[tuple[str, str]]
+        (dataset ID, title) of the datasets to add to the catalog.
     
     Returns
     -------
     None
 
     """
-
-    # Get password from environment variable or prompt the user
-    pw = os.getenv('META')
-    if pw is None:
-        pw = input("Enter metadata pw: ")
-
-    # New Connection to search db
-    conn = sql.connect(user = 'metadata', password=pw, host = 'rda-db.ucar.edu', database='rdadb')
-    cursor = conn.cursor()
-
-    # Get title
-    query = "select title from search.datasets where dsid='"+dataset_id+"'"
-    cursor.execute(query)
-    title, = cursor.fetchall()[0]
-
-    cursor.close()
-    conn.close()
-
     # Add title and catalogRef to catalog.xml
     catalog_file = os.path.join(
         PROJECT_ROOT,
         'rda-tds/content/catalog.xml'
     )
-    add_catalog_ref_sorted(
-        catalog_file,
-        dataset_id,
-        title
-    )
+    editor = CatalogEditor(catalog_file)
+    editor.apply(additions=new_datasets)
+    editor.write()
+
+@task
+def vet_dataset(record, classify_all: bool = False):
+    """Run the per-dataset check chain and return the verdict.
+
+    The checks are ordered cheapest first so rejected datasets
+    do not pay for the GLADE walk. The exclude list is checked by the
+    flow beforehand since its verdict is not cached.
+
+    Parameters
+    ----------
+    record : DatasetMetadata
+        The metadata of the dataset to check (from the snapshot).
+    classify_all : bool
+        Classify all NetCDF files for the CDF5 check instead of a sample.
 
-@flow(timeout_seconds=60*10,log_prints=True)
-def add_data2tds():
+    Returns
+    -------
+    tuple
+        (dataset ID, reason). reason is None if the dataset can be added to TDS,
+        otherwise the reason for skipping it.
+    """
+    dsid = record.dsid
+
+    # check if format is supported by TDS
+    if not check_format(record.formats):
+        return dsid, "format not supported by TDS"
+
+    # single walk of the data directory shared by the two checks below
+    summary = scan_dataset(dsid, classify_all=classify_all)
+
+    # check if there are datafiles in the data directory
+    #  cloud object storage may have dataset folder without data files
+    #  data in cold storage/tape/quasar have dataset folder without data files
+    if not check_datafiles(summary):
+        return dsid, "no data files found on GLADE"
+
+    # check if dataset has CDF5 data files
+    fraction, n_probed = check_cdf5(summary)
+    if fraction > 0:
+        return dsid, f"CDF5 data files ({fraction:.0%} of {n_probed} probed files)"
+
+    return dsid, None
+
+@flow(
+    timeout_seconds=60*10,
+    log_prints=True,
+    task_runner=ThreadPoolTaskRunner(max_workers=VET_WORKERS)
+)
+def add_data2tds(concurrent: bool = True, classify_all: bool = False, sync: bool = False):
     """The main prefect flow to add new dataset to TDS.
     Steps:
-    1. Get all dataset IDs from the database.
+    1. Get the metadata snapshot of all datasets in the database.
     2. Get all dataset IDs from the catalog.xml file.
-    3. For each dataset ID in the database:
-       a. If it is already in the catalog, skip it.
-       b. Check if its format is supported by TDS.
-       c. If supported
-            - create XML for the dataset
-            - add it to the catalog.
+    3. For each dataset ID in the database not yet in the catalog,
+       vet it (exclude list, format, data files, CDF5). Rejections of
+       unchanged datasets are reused from the vetting cache. With `concurrent`
+       the vetting runs on the flow's thread pool (`TDS_VET_WORKERS` workers).
+    4. For each accepted dataset, in sorted order:
+        - create XML for the dataset
+    5. Add all created datasets to the catalog in one write.
+    6. With `sync`, regenerate the stale XMLs of datasets already in TDS.
+
+    Parameters
+    ----------
+    concurrent : bool
+        Vet datasets concurrently (default True). False runs the checks
+        one dataset at a time.
+    classify_all : bool
+        Classify every NetCDF file of a dataset from its header bytes for
+        the CDF5 check instead of a 10 file sample (default False).
+    sync : bool
+        Also regenerate the XMLs of datasets already in TDS whose metadata
+        (title, summary, contributors, ...) changed (default False).
     """
     # set up logger from prefect
     logger = get_run_logger()
 
-    # Get all dataset IDs in the database
-    all_dsids = get_all_db_dsid()
+    # Get the metadata of all datasets in the database (feeds all checks below)
+    snapshot = get_metadata_snapshot()
+    all_dsids = list(snapshot)
     logger_info = f"Total datasets in database: {len(all_dsids)}"
     logger.info(logger_info)
 
@@ -421,48 +391,68 @@ def add_data2tds():
         PROJECT_ROOT,
         'rda-tds/content/catalog.xml'
     )
-    tds_dsids = get_all_tds_dsid(catalog_file)
+    tds_dsids = set(get_all_tds_dsid(catalog_file))
     logger_info = f"Total datasets in TDS: {len(tds_dsids)}"
     logger.info(logger_info)
 
-    # loop over dataset IDs in the database
-    new_datasets_add = []
+    # datasets in the database but not in the catalog
+    candidates = []
     for dsid in all_dsids:
         if dsid in tds_dsids:
             logger_warning = f"Skipping {dsid}: already in catalog"
             logger.warning(logger_warning)
             continue
-
-        # check if format is supported by TDS
-        tds_compatible = check_format(dsid)
-
-        if not tds_compatible:
-            logger_warning = f"Skipping {dsid}: format not supported by TDS"
-            logger.warning(logger_warning)
+        candidates.append(dsid)
+
+    # reuse the verdicts of datasets rejected before whose data directory
+    # mtime and metadata rows are unchanged (see vet_cache.py)
+    verdicts = {}
+    cache_keys = {}
+    to_vet = []
+    cache = VetCache()
+    for dsid in candidates:
+        # check if dataset is in the exclude list
+        if check_exclude(dsid):
+            verdicts[dsid] = "dataset is in the exclude list"
             continue
-
-        # check if dataset has CDF5 data files
-        has_cdf5 = check_cdf5(dsid)
-        if has_cdf5:
-            logger_warning = f"Skipping {dsid}: too many CDF5 data files (random sample 10 files)"
-            logger.warning(logger_warning)
+        cache_keys[dsid] = (
+            dir_mtime_ns(os.path.join(GDEX_DATA_ROOT, dsid)),
+            snapshot[dsid].fingerprint()
+        )
+        cached_reason = cache.lookup(dsid, *cache_keys[dsid])
+        if cached_reason is not None:
+            verdicts[dsid] = f"{cached_reason} (cached)"
             continue
+        to_vet.append(dsid)
+    logger_info = f"Vetting cache: {cache.hits} hit(s), {cache.misses} miss(es)"
+    logger.info(logger_info)
 
-        # check if there are datafiles in the data directory
-        #  cloud object storage may have dataset folder without data files
-        #  data in cold storage/tape/quasar have dataset folder without data files
-        has_datafiles = check_datafiles(dsid)
-
-        if not has_datafiles:
-            logger_warning = f"Skipping {dsid}: no data files found on GLADE"
-            logger.warning(logger_warning)
-            continue
+    # vet the remaining candidates, concurrently on the task runner pool or one by one
+    failed = set()
+    if concurrent:
+        futures = {dsid: vet_dataset.submit(snapshot[dsid], classify_all) for dsid in to_vet}
+        for dsid, future in futures.items():
+            try:
+                verdicts[dsid] = future.result()[1]
+            except Exception as e:
+                verdicts[dsid] = f"check failed ({e})"
+                failed.add(dsid)
+    else:
+        for dsid in to_vet:
+            verdicts[dsid] = vet_dataset(snapshot[dsid], classify_all)[1]
 
-        # check if dataset is in the exclude list
-        is_excluded = check_exclude(dsid)
+    # remember the new rejections for the next run
+    for dsid in to_vet:
+        if verdicts[dsid] is not None and dsid not in failed:
+            cache.store(dsid, verdicts[dsid], *cache_keys[dsid])
+    cache.close()
 
-        if is_excluded:
-            logger_warning = f"Skipping {dsid}: dataset is in the exclude list"
+    # apply catalog mutations serially in sorted order
+    new_datasets_add = []
+    for dsid in sorted(verdicts):
+        reason = verdicts[dsid]
+        if reason is not None:
+            logger_warning = f"Skipping {dsid}: {reason}"
             logger.warning(logger_warning)
             continue
 
@@ -475,22 +465,33 @@ def add_data2tds():
             continue
 
         # create XML for the dataset
-        state, err = create_xml(dsid)
+        state, err = create_xml(snapshot[dsid])
 
         if not state:
             logger_error = f"Failed to create XML for {dsid}: {err}"
             logger.error(logger_error)
             continue
 
-        # add to catalog.xml
-        add2catalog(dsid)
-
         # add new dataset to logger and data logging list
         logger_info = f"Adding {dsid} to TDS"
         logger.info(logger_info)
         # store data id for data logging
         new_datasets_add.append(dsid)
+
+    # add all new datasets to catalog.xml in one parse/write
+    if new_datasets_add:
+        add2catalog([(dsid, snapshot[dsid].title) for dsid in new_datasets_add])
     
+    # refresh existing dataset XMLs whose metadata changed
+    if sync:
+        records = [snapshot[dsid] for dsid in sorted(tds_dsids) if dsid in snapshot]
+        changed, skipped = sync_xml(records)
+        for dsid, err in sorted(skipped.items()):
+            logger_error = f"Failed to sync XML for {dsid}: {err}"
+            logger.error(logger_error)
+        logger_info = f"Synced dataset XMLs: {len(changed)} changed {changed}"
+        logger.info(logger_info)
+
     # final log of new datasets added to TDS
     date_data_info = datetime.now().strftime("%Y-%m-%d-%H_%M_%S")
     if new_datasets_add:
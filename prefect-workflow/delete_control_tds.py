@@ -25,7 +25,8 @@ dsrqst -sc -ds <dsid> -if <control_file> -md -nc
 """
 import os
 import subprocess
-from add_control_tds import get_control_file, parse_log_file, url_is_ok
+from add_control_tds import check_control_urls, get_control_file, parse_log_file, status_is_ok
+from createCTL import ControlRecord
 
 # setup log file name to be read
 LOG_FILE_NAME = "auto_add_data_tds_2025-11-14-12_31_54.log"
@@ -55,32 +56,23 @@ def delete_breaking_control(dsid: str) -> str:
     # get original control file
     old_control_lines = get_control_file(dsid)
 
-    # modify the origin control lines
-    remain_control_lines = [old_control_lines[0]]
+    # TDS control lines, their URLs are checked all at once
+    tds_control_lines = []
     for line in old_control_lines[1:]:
-        infos = line.strip().split('<:>')
-        control_index = infos[0]
-        url = infos[9]
-
+        record = ControlRecord.from_line(line)
         # TDS condition
-        RequestType = 'N'
-        ControlMode = 'A'
-        TarFlag = 'N'
-        ProcessCommand = ''
-        EmptyOutput = 'N'
-        HostName = ''
-        if (RequestType != infos[3] or
-            ControlMode != infos[4] or
-            TarFlag != infos[5] or
-            ProcessCommand != infos[7] or
-            EmptyOutput != infos[8] or
-            HostName != infos[10]):
+        if not record.is_tds_link():
             # skip the TDS url modification
             continue
+        tds_control_lines.append((line, record))
+    statuses = check_control_urls([record.url for _, record in tds_control_lines])
 
+    # modify the origin control lines
+    remain_control_lines = [old_control_lines[0]]
+    for line, record in tds_control_lines:
         # remove the control index if URL not working
-        if not url_is_ok(url):
-            delete_tds_url(dsid,control_index)
+        if not status_is_ok(statuses[record.url]):
+            delete_tds_url(dsid,record.control_index)
             continue
 
         remain_control_lines.append(line)
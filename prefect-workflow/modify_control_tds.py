@@ -26,6 +26,7 @@ dsrqst -sc -ds <dsid> -if <control_file> -md -nc
 import os
 import subprocess
 from add_control_tds import create_ctl, get_control_file, parse_log_file
+from createCTL import ControlRecord, connect_dssdb, load_env
 
 # setup log file name to be read
 LOG_FILE_NAME = "auto_add_data_tds_2025-11-14-12_31_54.log"
@@ -35,7 +36,7 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)  # Project root directory
 
 
-def modify_control_file(dsid: str) -> str:
+def modify_control_file(dsid: str, new_control_records: list[ControlRecord]) -> str:
     """Create the new control file for the given dataset ID.
     this add the new TDS URL entry on the original control file.
     Currently set output directory to prefect-workflow/
@@ -44,49 +45,30 @@ def modify_control_file(dsid: str) -> str:
     ----------
     dsid : str
         Dataset ID.
-    control_lines : list[str]
-        Original control file lines.
+    new_control_records : list[ControlRecord]
+        The TDS link entries generated by createCTL.py (see `create_ctl`).
 
     Returns
     -------
     str
         Path to the new control file.
     """
-    # use createCTL.py to generate the new control file lines
-    new_control_lines = create_ctl(dsid)
-
     # get original control file
     old_control_lines = get_control_file(dsid)
 
     # modify the origin control lines
     modified_control_lines = [old_control_lines[0]]
     for line in old_control_lines[1:]:
-        infos = line.strip().split('<:>')
-        group_index = infos[2]
-        url = infos[9]
+        record = ControlRecord.from_line(line)
         # TDS condition
-        RequestType = 'N'
-        ControlMode = 'A'
-        TarFlag = 'N'
-        ProcessCommand = ''
-        EmptyOutput = 'N'
-        HostName = ''
-        if (RequestType != infos[3] or
-            ControlMode != infos[4] or
-            TarFlag != infos[5] or
-            ProcessCommand != infos[7] or
-            EmptyOutput != infos[8] or
-            HostName != infos[10]):
+        if not record.is_tds_link():
             # skip the TDS url modification
             continue
 
-        for new_line in new_control_lines:
-            new_infos = new_line.strip().split('<:>')
-            new_group_index = new_infos[2]
-            new_url = new_infos[9]
-            if group_index == new_group_index:
+        for new_record in new_control_records:
+            if record.group_index == new_record.group_index:
                 # update the url
-                line = line.replace(url, new_url)
+                line = line.replace(record.url, new_record.url)
                 modified_control_lines.append(line)
                 break
 
@@ -100,8 +82,6 @@ def modify_control_file(dsid: str) -> str:
 
     return control_file_path
 
-modify_control_file(dsid="d734000")
-
 def modify_tds_url(dsid: str, new_control_file: str):
     """Modify the TDS URL entry to the dataset page using the control file.
 
@@ -139,10 +119,19 @@ def main():
     data_log_file = os.path.join(PROJECT_ROOT,'prefect-workflow',LOG_FILE_NAME)
     dsids = parse_log_file(data_log_file)
 
+    # use createCTL.py to generate the new control entries of all datasets at once
+    load_env()
+    conn = connect_dssdb()
+    records_by_dsid = create_ctl(dsids, conn)
+    conn.close()
+
     for dsid in dsids:
         print(f"Processing dataset ID: {dsid}")
+        if dsid not in records_by_dsid:
+            print(f"Failed to create control entries for {dsid}: no specialist in dsowner.")
+            continue
         # moddify control file with TDS URL entry
-        new_control_file = modify_control_file(dsid)
+        new_control_file = modify_control_file(dsid, records_by_dsid[dsid])
         print(f"Modified control file created at: {new_control_file}")
         # modify TDS URL entry using the new control file
         dsrqst_result = modify_tds_url(dsid, new_control_file)
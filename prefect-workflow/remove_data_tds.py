@@ -18,12 +18,15 @@ import json
 from datetime import datetime
 from prefect import flow, task
 from prefect.logging import get_run_logger
-import xml.etree.ElementTree as ET
 
 # Get the directory of this script and the project root
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)  # Project root directory
 
+# shared helper modules live in src/
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'src'))
+from catalog_editor import CatalogEditor
+
 # for reading local .env file
 try:
     # Load environment variables from .env file (searches up directory tree)
@@ -41,56 +44,28 @@ os.environ['PYTHONWARNINGS'] = 'ignore::UserWarning:pydantic._internal._generate
 @task
 def remove_catalog_ref_sorted(catalog_file: str, remove_dsids: list[str]):
     """
-    Remove a catalogRef from the catalog while maintaining alphabetical order by title.
+    Remove catalogRefs from the catalog while maintaining alphabetical order by title.
+
+    The catalog is parsed once, catalogRefs are looked up by dsid
+    (see `CatalogEditor`) and the file is written once.
 
     Parameters
     ----------
     catalog_file : str
         Path to the catalog XML file.
-    remove_dsid : str
-        The dataset ID to remove from the catalog.
+    remove_dsids : list[str]
+        The dataset IDs to remove from the catalog.
     
     Returns
     -------
-    None
+    list[str]
+        The dataset IDs that were not in the catalog.
 
     """
-    # Register namespaces
-    ET.register_namespace('', 'http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0')
-    ET.register_namespace('xlink', 'http://www.w3.org/1999/xlink')
-
-    # Parse the XML
-    tree = ET.parse(catalog_file)
-    root = tree.getroot()
-
-    xmlns = 'http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0'
-    xmlns_xlink = 'http://www.w3.org/1999/xlink'
-
-    # Define namespace map for finding elements
-    namespaces = {
-        'thredds': xmlns,
-        'xlink': xmlns_xlink
-    }
-
-    # Collect all existing catalogRef elements - 
-    # default namespace not showing up in findall without prefix
-    # using the 'thredds' prefix defined in namespaces
-    catalog_refs = list(root.findall('thredds:catalogRef', namespaces))
-
-
-    # Remove catalogRef  with title including remove_dsids elements from root
-    # TODO: optimize needed to avoid nested loop
-    for remove_dsid in remove_dsids:
-        for ref in list(root):
-            href_value = f"catalog_{remove_dsid}.xml"
-            cond1 = (ref.tag == '{'+xmlns+'}catalogRef')
-            cond2 = (ref.attrib.get('{http://www.w3.org/1999/xlink}href') == href_value)
-            if cond1 and cond2:
-                root.remove(ref)
-
-    # Write the updated XML back to file
-    tree.write(catalog_file, encoding='utf-8', xml_declaration=True)
-    # print(f"Added {new_dsid} to catalog in sorted position")
+    editor = CatalogEditor(catalog_file)
+    missing = editor.apply(removals=remove_dsids)
+    editor.write()
+    return missing
 
 @flow(timeout_seconds=60*10,log_prints=True)
 def remove_data():
@@ -115,7 +90,9 @@ def remove_data():
     )
 
     # remove data in catalog.xml
-    remove_catalog_ref_sorted(main_catalog_file, all_remove_dsids)
+    missing_dsids = remove_catalog_ref_sorted(main_catalog_file, all_remove_dsids)
+    for dsid in missing_dsids:
+        logger.warning(f"{dsid} not found in catalog.xml")
 
     # remove individual dataset XML files
     for dsid in all_remove_dsids:
@@ -0,0 +1,135 @@
+"""
+Persistent cache of the auto-add vetting verdicts.
+
+Datasets rejected by `add_data2tds` (no data files, CDF5 files, unsupported
+format) are recorded with the reason, the mtime of their top level data
+directory and the fingerprint of their metadata rows. On the next run a
+dataset whose directory mtime and fingerprint are unchanged reuses the
+cached verdict instead of walking GLADE again.
+
+NOTE: only the top level directory mtime is compared, so files added deeper
+in an existing subdirectory are not noticed until the entry is invalidated.
+
+The cache is a local SQLite file (TDS_VET_CACHE in .env, default
+prefect-workflow/vet_cache.sqlite).
+
+Usage:
+    python vet_cache.py list
+    python vet_cache.py show <dsid>
+    python vet_cache.py invalidate <dsid> [<dsid> ...]
+    python vet_cache.py clear
+"""
+import os
+import sqlite3
+import argparse
+from datetime import datetime
+
+# Get the directory of this script
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_FILE = os.path.join(SCRIPT_DIR, 'vet_cache.sqlite')
+
+COLUMNS = ('dsid', 'reason', 'dir_mtime_ns', 'fingerprint', 'checked_at')
+
+
+def dir_mtime_ns(data_dir: str) -> int:
+    """mtime (ns) of the data directory, -1 if it does not exist."""
+    try:
+        return os.stat(data_dir).st_mtime_ns
+    except OSError:
+        return -1
+
+
+class VetCache:
+    """SQLite backed store of the rejected dataset verdicts.
+
+    Parameters
+    ----------
+    cache_file : str, optional
+        Path of the SQLite file. Default is TDS_VET_CACHE or
+        prefect-workflow/vet_cache.sqlite.
+    """
+
+    def __init__(self, cache_file: str = None):
+        self.cache_file = cache_file or os.getenv('TDS_VET_CACHE', DEFAULT_CACHE_FILE)
+        self.conn = sqlite3.connect(self.cache_file)
+        self.conn.execute(
+            "create table if not exists vet_cache ("
+            "dsid text primary key, reason text not null, "
+            "dir_mtime_ns integer not null, fingerprint text not null, "
+            "checked_at text not null)"
+        )
+        self.conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, dsid: str, mtime_ns: int, fingerprint: str):
+        """Return the cached reason if the dataset is unchanged, None otherwise.
+
+        Counts a hit or a miss.
+        """
+        row = self.conn.execute(
+            "select reason from vet_cache where dsid = ? and dir_mtime_ns = ? and fingerprint = ?",
+            (dsid, mtime_ns, fingerprint)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def store(self, dsid: str, reason: str, mtime_ns: int, fingerprint: str):
+        """Record the rejection reason of a dataset."""
+        self.conn.execute(
+            "insert or replace into vet_cache values (?, ?, ?, ?, ?)",
+            (dsid, reason, mtime_ns, fingerprint, datetime.now().isoformat(timespec='seconds'))
+        )
+        self.conn.commit()
+
+    def invalidate(self, dsids: list[str]) -> int:
+        """Drop the cached verdicts of the datasets, returns the number removed."""
+        cursor = self.conn.executemany("delete from vet_cache where dsid = ?", [(dsid,) for dsid in dsids])
+        self.conn.commit()
+        return cursor.rowcount
+
+    def clear(self):
+        """Drop all cached verdicts."""
+        self.conn.execute("delete from vet_cache")
+        self.conn.commit()
+
+    def rows(self, dsid: str = None) -> list[tuple]:
+        """Cached rows (all or for one dataset) ordered by dsid."""
+        query = f"select {', '.join(COLUMNS)} from vet_cache"
+        if dsid is None:
+            return self.conn.execute(query + " order by dsid").fetchall()
+        return self.conn.execute(query + " where dsid = ?", (dsid,)).fetchall()
+
+    def close(self):
+        """Close the SQLite connection."""
+        self.conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the auto-add vetting cache.")
+    parser.add_argument("--cache-file", default=None, help="SQLite cache file (default TDS_VET_CACHE or vet_cache.sqlite)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="List all cached verdicts")
+    show_parser = subparsers.add_parser("show", help="Show the cached verdict of a dataset")
+    show_parser.add_argument("dsid")
+    invalidate_parser = subparsers.add_parser("invalidate", help="Drop the cached verdict of datasets")
+    invalidate_parser.add_argument("dsids", nargs="+")
+    subparsers.add_parser("clear", help="Drop all cached verdicts")
+    args = parser.parse_args()
+
+    cache = VetCache(args.cache_file)
+    if args.command in ("list", "show"):
+        rows = cache.rows(args.dsid if args.command == "show" else None)
+        for dsid, reason, mtime_ns, fingerprint, checked_at in rows:
+            print(f"{dsid}  {checked_at}  mtime_ns={mtime_ns}  fingerprint={fingerprint[:12]}  {reason}")
+        if not rows:
+            print("No cached verdicts.")
+    elif args.command == "invalidate":
+        print(f"Removed {cache.invalidate(args.dsids)} cached verdict(s)")
+    elif args.command == "clear":
+        cache.clear()
+        print("Cleared the vetting cache")
+    cache.close()
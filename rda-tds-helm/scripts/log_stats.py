@@ -1,10 +1,34 @@
 """
 This is the script will 
 1. summarized the daily TDS usage statistics from the Tomcat access logs.
-2. check the existing CSV file and only process the missing dates.
-3. append the new statistics to the existing CSV file.
+2. check the manifest of the stats store and only process the missing dates.
+3. append the new statistics of finished (sealed) days to the stats store and
+   to the CSV files (kept as export for backwards compatibility).
 4. The script will read the Tomcat access logs from the /usr/local/tomcat/logs.
-5. The script will be run as a cron job to update the statistics daily.
+5. The script will be run as a cron job every 15 minutes.
+
+Each run resumes every log from the byte offset recorded in
+access_log_stats.checkpoint.json (inode, offset and partial stats per log)
+and only reads the complete lines appended since the last run. The partial
+stats of the days still being logged are rewritten to
+access_log_stats_current.txt every run. A past day is sealed (appended to
+the CSV file and dropped from the checkpoint) once its logs were read to
+the end and have not been modified for --seal-after seconds.
+
+Log lines are parsed with str.split on the fixed fields of the Tomcat "common"
+pattern (regex only as fallback) and the service is taken from the path prefix
+after /thredds/ (see test/bench_log_stats.py for the parser benchmark).
+
+Log files are processed in a process pool (one task per file) and the per
+file stats are merged per date, rows are written in date order. The number
+of workers comes from --workers, the LOG_STATS_WORKERS environment variable
+(set from the cronjob CPU limit) or the CPUs available to the process.
+Rotated logs compressed with gzip (localhost_access_log.<date>.txt.gz) are
+read transparently.
+
+Usage:
+    python log_stats.py [--workers N] [--log-dir DIR] [--seal-after SECONDS]
+    python log_stats.py [--log-dir DIR] --percentiles START END
 
 Cronjob:
 - Use the configmap ``rda-tds-helm/log_stats_cronjob.yaml`` to store the python script as data and run it as a cronjob.
@@ -15,10 +39,42 @@ It will generate a CSV file with the following columns:
 
 date,total_requests,failed_requests,bytes_sent,bytes_success,subset_requests,opendap_requests,fileserver_requests,other_requests
 
+and two breakdown tables (with _current.txt twins for the open dates):
+
+access_log_dataset_stats.txt  date,dsid,service,requests,bytes_sent,failed_requests
+    dsid from /thredds/<service>/files/<dsid>/... paths
+access_log_top_hosts.txt      date,rank,host,requests,bytes_sent,failed_requests
+    the TOP_HOSTS busiest client hosts
+
+Both are counted with TopK, a bounded memory heavy hitter counter, so a
+crawler hitting millions of distinct paths or hosts cannot exhaust memory;
+counts are exact as long as a date has fewer distinct keys than the capacity.
+
+With the %D field in the log pattern (request processing time, unit set by
+LOG_LATENCY_UNIT: us (Tomcat 10+, default), ms or s) it also writes
+
+access_log_latency_stats.txt  date,scope,key,requests,p50_ms,p95_ms,p99_ms
+    scope service (all, subset, ...) or dataset (dsid)
+
+from QuantileSketch, a mergeable log-bucket sketch (1% relative accuracy).
+The sketches of every sealed date are appended to
+access_log_latency_sketches.jsonl so percentiles over several days can be
+combined without raw samples:
+
+    python log_stats.py --percentiles 2025-10-01 2025-10-31
+
+The sealed tables (daily, datasets, hosts, latency) are stored in
+stats_store/<table>/<YYYY-MM>.csv.gz, appended one gzip member per run, with
+stats_store/manifest.json listing the dates, rows and size of every month
+partition (see StatsStore). The existing dates come from the manifest and
+src/gen_stats_plot.py only downloads the months it plots. Parquet would need
+pyarrow, which the python:3.11-slim cronjob image does not have.
+
 
 """
 
-import re, os, glob, sys
+import re, os, glob, sys, gzip, json, time, math, argparse
+from concurrent.futures import ProcessPoolExecutor
 
 
 
@@ -26,15 +82,514 @@ import re, os, glob, sys
 # define global constants
 LOG_DIR = "/usr/local/tomcat/logs"
 OUTPUT_FILE = os.path.join(LOG_DIR, "access_log_stats.txt")
+# partial stats of the dates still being logged (today), rewritten every run
+CURRENT_FILE = os.path.join(LOG_DIR, "access_log_stats_current.txt")
+# byte offsets and partial stats of the logs not sealed yet
+CHECKPOINT_FILE = os.path.join(LOG_DIR, "access_log_stats.checkpoint.json")
+CHECKPOINT_VERSION = 3
+# a past day is sealed once its log has not been modified for this many seconds
+SEAL_AFTER = 3600
 HEADER = "date,total_requests,failed_requests,bytes_sent,bytes_success,subset_requests,opendap_requests,fileserver_requests,other_requests\n"
+# per dataset and service breakdown, and the busiest client hosts per date
+DATASET_OUTPUT_FILE = os.path.join(LOG_DIR, "access_log_dataset_stats.txt")
+DATASET_CURRENT_FILE = os.path.join(LOG_DIR, "access_log_dataset_stats_current.txt")
+DATASET_HEADER = "date,dsid,service,requests,bytes_sent,failed_requests\n"
+HOSTS_OUTPUT_FILE = os.path.join(LOG_DIR, "access_log_top_hosts.txt")
+HOSTS_CURRENT_FILE = os.path.join(LOG_DIR, "access_log_top_hosts_current.txt")
+HOSTS_HEADER = "date,rank,host,requests,bytes_sent,failed_requests\n"
+# bounded counters: (dsid, service) pairs and client hosts tracked per date
+DATASET_CAPACITY = 10000
+HOST_CAPACITY = 2000
+TOP_HOSTS = 25
+# distinct raw keys counted exactly in the hot loop before they are folded into the TopKs
+FOLD_KEYS = 50000
+# request latency percentiles per service and dataset, and the daily sketches to combine them
+LATENCY_OUTPUT_FILE = os.path.join(LOG_DIR, "access_log_latency_stats.txt")
+LATENCY_CURRENT_FILE = os.path.join(LOG_DIR, "access_log_latency_stats_current.txt")
+LATENCY_SKETCH_FILE = os.path.join(LOG_DIR, "access_log_latency_sketches.jsonl")
+LATENCY_HEADER = "date,scope,key,requests,p50_ms,p95_ms,p99_ms\n"
+LATENCY_QUANTILES = (0.5, 0.95, 0.99)
+# unit of %D in the access log: microseconds on Tomcat 10+, milliseconds before
+LATENCY_UNITS = {'us': 0.001, 'ms': 1.0, 's': 1000.0}
+LATENCY_UNIT = os.getenv('LOG_LATENCY_UNIT', 'us')
+# month partitioned store of the sealed tables, read by src/gen_stats_plot.py
+STORE_DIR = os.path.join(LOG_DIR, "stats_store")
+STORE_VERSION = 1
+# store table -> (header, CSV export file)
+STORE_TABLES = {
+    'daily': (HEADER, OUTPUT_FILE),
+    'datasets': (DATASET_HEADER, DATASET_OUTPUT_FILE),
+    'hosts': (HOSTS_HEADER, HOSTS_OUTPUT_FILE),
+    'latency': (LATENCY_HEADER, LATENCY_OUTPUT_FILE),
+}
 
-# regex pattern to extract date, path, status code, and bytes sent from log lines
+# Tomcat AccessLogValve pattern (rda-tds/conf/server.xml), "common" plus
+# the processing time and the client address behind the ingress:
+#   %h %l %u %t "%r" %s %b %D "%{X-Forwarded-For}i"
+#   host ident user [10/Oct/2025:13:55:36 -0600] "GET /thredds/dodsC/... HTTP/1.1" 200 2326 5120 "1.2.3.4"
+# logs written with the plain "common" pattern (no %D, no X-Forwarded-For) are still accepted.
+# lines are read as bytes and split on the quotes around the request line,
+# the regex below is only the fallback for lines the fast path cannot split
 log_pattern = re.compile(
-    r'\[(\d{2}/\w{3}/\d{4}):\d{2}:\d{2}:\d{2}[^\]]*\] "\w+ ([^ ]+) [^"]*" (\d{3}) (\d+|-)'
+    rb'\[(\d{2}/\w{3}/\d{4}):\d{2}:\d{2}:\d{2}[^\]]*\] "\w+ ([^ ]+) [^"]*" (\d{3}) (\d+|-)(?: (\d+|-))?(?: "([^"]*)")?'
 )
 date_from_filename = re.compile(
     r'localhost_access_log\.(\d{4}-\d{2}-\d{2})'
 )
+# suffixes of the access logs, plain (today / not yet compressed) and gzip rotated
+LOG_SUFFIXES = ('.txt', '.txt.gz')
+STAT_KEYS = (
+    'total', 'failed', 'bytes_sent', 'bytes_success',
+    'subset', 'opendap', 'fileserver', 'other'
+)
+
+# service counter by the first path segment after /thredds/
+SERVICE_PREFIXES = {
+    b'ncss': 'subset',
+    b'dodsC': 'opendap',
+    b'fileServer': 'fileserver',
+}
+SERVICES = ('subset', 'opendap', 'fileserver', 'other')
+
+
+def classify_service(path):
+    """Return the service counter (subset, opendap, fileserver or other) of a request path.
+
+    Parameters
+    ----------
+    path : bytes
+        The request path (e.g. b'/thredds/dodsC/files/d010077/file.nc').
+
+    Returns
+    -------
+    str
+        The key of the service counter in the stats dict.
+    """
+    if path.startswith(b'/thredds/'):
+        return SERVICE_PREFIXES.get(path[9:].split(b'/', 1)[0], 'other')
+    return 'other'
+
+
+def dataset_of(path):
+    """Return the dsid of a /thredds/<service>/files/<dsid>/... path, None if there is none.
+
+    Parameters
+    ----------
+    path : bytes
+        The request path.
+
+    Returns
+    -------
+    str or None
+        The dataset ID (e.g. 'd010077').
+    """
+    start = path.find(b'/files/')
+    if start == -1:
+        return None
+    return _valid_dsid(path[start + 7:start + 15])
+
+
+def _valid_dsid(segment):
+    """The dsid (str) if segment is b'd' + 6 digits, optionally followed by '/' or '?', else None."""
+    if len(segment) >= 7 and segment[:1] == b'd' and segment[1:7].isdigit() and segment[7:8] in (b'/', b'?', b''):
+        return segment[:7].decode('ascii')
+    return None
+
+
+class QuantileSketch:
+    """Mergeable streaming quantile sketch of latencies in ms (DDSketch style).
+
+    Values are counted in logarithmic buckets: bucket i holds the values in
+    (GAMMA**(i-1), GAMMA**i], so every quantile is returned within
+    RELATIVE_ACCURACY of the true value. Sketches of different files, days
+    or workers are combined by adding bucket counts, no samples are kept.
+    Values below MIN_VALUE (1 microsecond) share the lowest bucket and the
+    180 s ingress timeout keeps the number of buckets below ~1000.
+    """
+    RELATIVE_ACCURACY = 0.01
+    GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+    INV_LOG_GAMMA = 1 / math.log(GAMMA)
+    MIN_VALUE = 0.001
+
+    def __init__(self, bins=None):
+        # bucket index -> count
+        self.bins = bins if bins is not None else {}
+
+    @classmethod
+    def index(cls, value):
+        """Bucket index of a value (ms)."""
+        return math.ceil(math.log(max(value, cls.MIN_VALUE)) * cls.INV_LOG_GAMMA)
+
+    def add(self, value):
+        """Count one value (ms)."""
+        i = self.index(value)
+        self.bins[i] = self.bins.get(i, 0) + 1
+
+    @property
+    def count(self):
+        """Number of values counted."""
+        return sum(self.bins.values())
+
+    def merge(self, other):
+        """Add the counts of another sketch (in place) and return self."""
+        for i, n in other.bins.items():
+            self.bins[i] = self.bins.get(i, 0) + n
+        return self
+
+    def copy(self):
+        """Independent copy of the sketch."""
+        return QuantileSketch(dict(self.bins))
+
+    def quantile(self, q):
+        """Value (ms) at quantile q (0-1), None if the sketch is empty."""
+        count = self.count
+        if count == 0:
+            return None
+        rank = q * (count - 1)
+        seen = 0
+        for i in sorted(self.bins):
+            seen += self.bins[i]
+            if seen > rank:
+                break
+        # middle of the bucket in relative terms
+        return 2 * self.GAMMA ** i / (self.GAMMA + 1)
+
+    def to_json(self):
+        """JSON serializable form (see `from_json`)."""
+        return {str(i): n for i, n in self.bins.items()}
+
+    @classmethod
+    def from_json(cls, data):
+        """Rebuild a sketch from `to_json` output."""
+        return cls({int(i): n for i, n in data.items()})
+
+
+class TopK:
+    """Bounded memory heavy hitter counter of requests, bytes and failures per key.
+
+    Keeps at most 2 * capacity keys; when full the keys with the fewest
+    requests are pruned down to `capacity` (Space-Saving style, pruning in
+    batches keeps the cost per insert amortized O(log capacity)). `floor`
+    is the largest request count (plus its error) ever pruned, a key inserted
+    afterwards may have missed up to `floor` requests, kept as its error.
+    So for every reported key: requests <= true requests <= requests + error.
+    Counters of different files or runs are combined with `merge`.
+    With `sketches` every key also carries a QuantileSketch of its latencies.
+    """
+
+    def __init__(self, capacity, sketches=False):
+        self.capacity = capacity
+        self.sketches = sketches
+        self.floor = 0
+        # key -> [requests, bytes, failures, error(, QuantileSketch)]
+        self.entries = {}
+
+    def add(self, key, nbytes, failed, latency_index=None):
+        """Count one request of key, with the sketch bucket index of its latency if known."""
+        entry = self.entries.get(key)
+        if entry is None:
+            if len(self.entries) >= 2 * self.capacity:
+                self._prune()
+            entry = self.entries[key] = [0, 0, 0, self.floor]
+            if self.sketches:
+                entry.append(QuantileSketch())
+        entry[0] += 1
+        entry[1] += nbytes
+        entry[2] += failed
+        if latency_index is not None and self.sketches:
+            bins = entry[4].bins
+            bins[latency_index] = bins.get(latency_index, 0) + 1
+
+    def add_entry(self, key, entry):
+        """Add the counts (and sketch) of an entry of another TopK under key."""
+        own = self.entries.get(key)
+        if own is None:
+            if len(self.entries) >= 2 * self.capacity:
+                self._prune()
+            own = self.entries[key] = [0, 0, 0, self.floor]
+            if self.sketches:
+                own.append(QuantileSketch())
+        for i in range(4):
+            own[i] += entry[i]
+        if self.sketches and len(entry) > 4:
+            own[4].merge(entry[4])
+
+    def _prune(self):
+        """Drop the keys with the fewest requests, keeping `capacity` keys.
+
+        The entries dict is pruned in place so callers may hold a reference to it.
+        """
+        ranked = sorted(self.entries.items(), key=lambda item: item[1][0], reverse=True)
+        for _, entry in ranked[self.capacity:]:
+            self.floor = max(self.floor, entry[0] + entry[3])
+        self.entries.clear()
+        self.entries.update(ranked[:self.capacity])
+
+    def merge(self, other):
+        """Add the counts of another TopK (in place) and return self."""
+        for key, entry in other.entries.items():
+            own = self.entries.get(key)
+            if own is None:
+                # the key may have been pruned here
+                own = self.entries[key] = [entry[0], entry[1], entry[2], entry[3] + self.floor]
+                if self.sketches:
+                    own.append(entry[4].copy() if len(entry) > 4 else QuantileSketch())
+            else:
+                for i in range(4):
+                    own[i] += entry[i]
+                if self.sketches and len(entry) > 4:
+                    own[4].merge(entry[4])
+        for key, entry in self.entries.items():
+            if key not in other.entries:
+                entry[3] += other.floor
+        self.floor += other.floor
+        if len(self.entries) > 2 * self.capacity:
+            self._prune()
+        return self
+
+    def top(self, n=None):
+        """(key, requests, bytes, failures, error) sorted by requests, the n largest or all."""
+        ranked = sorted(self.entries.items(), key=lambda item: (-item[1][0], item[0]))
+        if n is not None:
+            ranked = ranked[:n]
+        return [(key, *entry[:4]) for key, entry in ranked]
+
+    def to_json(self):
+        """JSON serializable form (see `from_json`)."""
+        entries = {
+            key: entry[:4] + [entry[4].to_json()] if len(entry) > 4 else entry
+            for key, entry in self.entries.items()
+        }
+        return dict(capacity=self.capacity, sketches=self.sketches, floor=self.floor, entries=entries)
+
+    @classmethod
+    def from_json(cls, data):
+        """Rebuild a TopK from `to_json` output."""
+        topk = cls(data["capacity"], data.get("sketches", False))
+        topk.floor = data["floor"]
+        topk.entries = {
+            key: entry[:4] + [QuantileSketch.from_json(entry[4])] if len(entry) > 4 else list(entry)
+            for key, entry in data["entries"].items()
+        }
+        return topk
+
+
+def client_host(line, forwarded):
+    """Client of a request: the first X-Forwarded-For address if logged, else %h."""
+    if forwarded and forwarded != b'-':
+        return forwarded.split(b',', 1)[0].strip()
+    return line[:line.find(b' ')]
+
+
+def parse_latency(raw):
+    """Latency in ms of a %D field (bytes, LATENCY_UNIT), None if missing."""
+    if raw and raw.isdigit():
+        return int(raw) * LATENCY_UNITS[LATENCY_UNIT]
+    return None
+
+
+def parse_line(line):
+    """Split an access log line into host, path, status, bytes sent and latency.
+
+    Parameters
+    ----------
+    line : bytes
+        One line of a Tomcat access log, read in binary mode.
+
+    Returns
+    -------
+    tuple or None
+        (host, path, status, bytes_sent, latency_ms) with host, path and
+        status as bytes, bytes_sent as int and latency_ms as float (None
+        for "common" pattern logs), None if the line is not a request line.
+    """
+    # fast path: <host ident user [time] >"<method path protocol>"< status bytes [%D] >"<X-Forwarded-For>"
+    parts = line.split(b'"')
+    if len(parts) in (3, 5):
+        request = parts[1].split(b' ')
+        fields = parts[2].split()
+        if len(request) == 3 and len(fields) >= 2:
+            status, bytes_raw = fields[0], fields[1]
+            if bytes_raw == b'-' or bytes_raw.isdigit():
+                return (
+                    client_host(line, parts[3] if len(parts) == 5 else None),
+                    request[1], status,
+                    int(bytes_raw) if bytes_raw != b'-' else 0,
+                    parse_latency(fields[2] if len(fields) > 2 else None)
+                )
+
+    # slow path: quotes inside the request line, malformed requests
+    m = log_pattern.search(line)
+    if not m:
+        return None
+    bytes_raw = m.group(4)
+    return (
+        client_host(line, m.group(6)), m.group(2), m.group(3),
+        int(bytes_raw) if bytes_raw != b'-' else 0,
+        parse_latency(m.group(5))
+    )
+
+
+def open_log(log_file):
+    """Open a log file for binary reading, decompressing .gz files on the fly."""
+    if log_file.endswith('.gz'):
+        return gzip.open(log_file, "rb")
+    return open(log_file, "rb")
+
+
+def process_log_range(log_file, offset=0):
+    """Process the complete lines of a log file from a byte offset on.
+
+    A last line without its newline (Tomcat is still writing it) is left
+    for the next run.
+
+    The hot loop only counts raw host and dataset keys exactly in plain
+    dicts; they are folded into the TopKs (decoded, validated, pruned)
+    every FOLD_KEYS distinct keys and at the end of the file. The totals,
+    the services of the dataset requests and their latencies are summed
+    from the raw entries when they are folded.
+
+    Parameters
+    ----------
+    log_file : str
+        Path to the log file to process.
+    offset : int
+        Byte offset to start reading from (uncompressed offset for .gz files).
+
+    Returns
+    -------
+    tuple
+        (stats dict, offset after the last complete line read).
+    """
+    # running totals are kept in locals, the hot loop below runs once per request
+    services = dict(subset=0, opendap=0, fileserver=0, other=0)
+    service_of = SERVICE_PREFIXES.get
+    latency = {service: QuantileSketch() for service in services}
+    latency_bins = {service: sketch.bins for service, sketch in latency.items()}
+    datasets = TopK(DATASET_CAPACITY, sketches=True)
+    hosts = TopK(HOST_CAPACITY)
+    # b'<service path>/files/<segment>' -> [requests, bytes, failures, latency bins]
+    raw_datasets = {}
+    # host -> [requests, bytes, failures, bytes of failures]
+    raw_hosts = {}
+    totals = [0, 0, 0, 0]
+    to_ms = LATENCY_UNITS[LATENCY_UNIT]
+    bucket_of = QuantileSketch.index
+    ceil, log = math.ceil, math.log
+    inv_log_gamma, min_latency = QuantileSketch.INV_LOG_GAMMA, QuantileSketch.MIN_VALUE
+    partial = 0
+
+    # binary mode skips decoding every line, only the fields are compared
+    with open_log(log_file) as f:
+        if offset:
+            f.seek(offset)
+        for line in f:
+            if line[-1:] != b'\n':
+                partial = len(line)
+                break
+
+            # fast path: one split of <host ident user [time zone] "method path protocol" status bytes>
+            # (+ <%D "X-Forwarded-For">), anything else goes through parse_line
+            # (tokens are bytes, their items ints: 34 is the quote)
+            tokens = line.split()
+            n_tokens = len(tokens)
+            if 10 <= n_tokens <= 12 and tokens[5][0] == 34 and tokens[7][-1] == 34 and (
+                    tokens[9].isdigit() or tokens[9] == b'-'):
+                path, status = tokens[6], tokens[8]
+                bval = int(tokens[9]) if tokens[9] != b'-' else 0
+                host = tokens[0]
+                bucket = None
+                if n_tokens > 10:
+                    # client_host and QuantileSketch.index inlined
+                    if tokens[10].isdigit():
+                        bucket = ceil(log(int(tokens[10]) * to_ms or min_latency) * inv_log_gamma)
+                    if n_tokens == 12:
+                        forwarded = tokens[11][1:-1]
+                        if forwarded and forwarded != b'-':
+                            host = forwarded
+            else:
+                parsed = parse_line(line)
+                if parsed is None:
+                    continue
+                host, path, status, bval, latency_ms = parsed
+                bucket = bucket_of(latency_ms) if latency_ms is not None else None
+
+            failure = status != b"200"
+            start = path.find(b'/files/', 9)
+            if start != -1 and path.startswith(b'/thredds/'):
+                # keyed on the raw path up to the dsid segment, service and dsid are read once per key
+                key = path[9:start + 15]
+                entry = raw_datasets.get(key)
+                if entry is None:
+                    if len(raw_datasets) >= FOLD_KEYS:
+                        _fold_datasets(raw_datasets, datasets, services, latency)
+                    entry = raw_datasets[key] = [0, 0, 0, {}]
+                entry[0] += 1
+                entry[1] += bval
+                if failure:
+                    entry[2] += 1
+                if bucket is not None:
+                    bins = entry[3]
+                    bins[bucket] = bins.get(bucket, 0) + 1
+            else:
+                service = service_of(path[9:].partition(b'/')[0], 'other') if path.startswith(b'/thredds/') else 'other'
+                services[service] += 1
+                if bucket is not None:
+                    bins = latency_bins[service]
+                    bins[bucket] = bins.get(bucket, 0) + 1
+            # most lines come from known hosts, a miss is the exception
+            try:
+                entry = raw_hosts[host]
+                entry[0] += 1
+                entry[1] += bval
+            except KeyError:
+                if len(raw_hosts) >= FOLD_KEYS:
+                    _fold_hosts(raw_hosts, hosts, totals)
+                entry = raw_hosts[host] = [1, bval, 0, 0]
+            if failure:
+                entry[2] += 1
+                entry[3] += bval
+        end_offset = f.tell() - partial
+
+    _fold_datasets(raw_datasets, datasets, services, latency)
+    _fold_hosts(raw_hosts, hosts, totals)
+    total, bytes_sent, failed, bytes_failed = totals
+
+    # same structure as the total dict in the main loop, but scoped to this log file
+    stats = dict(
+        total=total, failed=failed, bytes_sent=bytes_sent, bytes_success=bytes_sent - bytes_failed,
+        **services
+    )
+    stats['datasets'] = datasets
+    stats['hosts'] = hosts
+    stats['latency'] = latency
+    return stats, end_offset
+
+
+def _fold_datasets(raw_datasets, datasets, services, latency):
+    """Add the raw dataset entries of process_log_range to the service counters,
+    the service latencies and the datasets TopK (valid dsids only), then clear them."""
+    service_of = SERVICE_PREFIXES.get
+    for key, (requests, nbytes, failures, bins) in raw_datasets.items():
+        service = service_of(key.split(b'/', 1)[0], 'other')
+        services[service] += requests
+        sketch = QuantileSketch(bins)
+        latency[service].merge(sketch)
+        dsid = _valid_dsid(key[key.find(b'/files/') + 7:])
+        if dsid is not None:
+            datasets.add_entry(f"{dsid} {service}", [requests, nbytes, failures, 0, sketch])
+    raw_datasets.clear()
+
+
+def _fold_hosts(raw_hosts, hosts, totals):
+    """Add the raw host entries of process_log_range to the hosts TopK and to
+    totals ([requests, bytes, failures, bytes of failures], in place), then clear them."""
+    for host, entry in raw_hosts.items():
+        # keys are decoded once per distinct key instead of once per line
+        hosts.add_entry(host.decode('ascii', 'replace'), [entry[0], entry[1], entry[2], 0])
+        for i in range(4):
+            totals[i] += entry[i]
+    raw_hosts.clear()
 
 
 def process_log_file(log_file):
@@ -51,110 +606,637 @@ def process_log_file(log_file):
         A dictionary containing statistics about the log file, including total requests,
         failed requests, bytes sent, bytes successfully sent, and counts of different request types.
     """
-    # initialize total stats for the date (same structure as the total dict in the main loop, but scoped to this log file)
-    stats = dict(
-        total=0, failed=0, bytes_sent=0, bytes_success=0,
-        subset=0, opendap=0, fileserver=0, other=0
+    return process_log_range(log_file)[0]
+
+
+def _process_task(task):
+    """Pool worker: process_log_range on a (log_file, offset) task."""
+    return process_log_range(*task)
+
+
+def empty_stats():
+    """Stats dict with every counter at 0 and empty dataset / host counters."""
+    stats = dict.fromkeys(STAT_KEYS, 0)
+    stats['datasets'] = TopK(DATASET_CAPACITY, sketches=True)
+    stats['hosts'] = TopK(HOST_CAPACITY)
+    stats['latency'] = {service: QuantileSketch() for service in SERVICES}
+    return stats
+
+
+def merge_stats(total, stats):
+    """Add the counters of stats into total (in place) and return total."""
+    for k in STAT_KEYS:
+        total[k] += stats[k]
+    total['datasets'].merge(stats['datasets'])
+    total['hosts'].merge(stats['hosts'])
+    for service, sketch in stats['latency'].items():
+        total['latency'][service].merge(sketch)
+    return total
+
+
+def stats_to_json(stats):
+    """JSON serializable copy of a stats dict (for the checkpoint)."""
+    data = {k: stats[k] for k in STAT_KEYS}
+    data['datasets'] = stats['datasets'].to_json()
+    data['hosts'] = stats['hosts'].to_json()
+    data['latency'] = {service: sketch.to_json() for service, sketch in stats['latency'].items()}
+    return data
+
+
+def stats_from_json(data):
+    """Stats dict from `stats_to_json` output."""
+    stats = {k: data[k] for k in STAT_KEYS}
+    stats['datasets'] = TopK.from_json(data['datasets'])
+    stats['hosts'] = TopK.from_json(data['hosts'])
+    stats['latency'] = {service: QuantileSketch.from_json(bins) for service, bins in data['latency'].items()}
+    return stats
+
+
+def load_checkpoint(checkpoint_file):
+    """Read the checkpoint file, an empty checkpoint if missing or unreadable.
+
+    The checkpoint maps the log name (file name without .gz) to the inode,
+    byte offset and partial stats of the log at the end of the last run
+    (stats as written by `stats_to_json`)::
+
+        {"version": 3, "logs": {"localhost_access_log.2025-10-10.txt":
+            {"date": "2025-10-10", "inode": 1234, "offset": 56789,
+             "mtime": 1760140800.0, "stats": {"total": 12, "failed": 1, ...,
+             "datasets": {"capacity": 10000, "sketches": true, "floor": 0, "entries": {...}},
+             "hosts": {"capacity": 2000, "sketches": false, "floor": 0, "entries": {...}},
+             "latency": {"subset": {...}, "opendap": {...}, "fileserver": {...}, "other": {...}}}}}}
+
+    A checkpoint of another CHECKPOINT_VERSION is ignored (the logs are
+    processed again from the start).
+    """
+    try:
+        with open(checkpoint_file, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return {"version": CHECKPOINT_VERSION, "logs": {}}
+    if checkpoint.get("version") != CHECKPOINT_VERSION:
+        return {"version": CHECKPOINT_VERSION, "logs": {}}
+    for entry in checkpoint["logs"].values():
+        entry["stats"] = stats_from_json(entry["stats"])
+    return checkpoint
+
+
+def write_text_atomic(path, text):
+    """Write a text file through a temporary file and os.replace."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def save_checkpoint(checkpoint_file, checkpoint):
+    """Write the checkpoint file atomically."""
+    logs = {
+        name: dict(entry, stats=stats_to_json(entry["stats"]))
+        for name, entry in checkpoint["logs"].items()
+    }
+    data = dict(checkpoint, logs=logs)
+    write_text_atomic(checkpoint_file, json.dumps(data, separators=(',', ':'), sort_keys=True))
+
+
+def log_name(log_file):
+    """Checkpoint key of a log file: the plain file name, also for its .gz."""
+    name = os.path.basename(log_file)
+    return name[:-3] if name.endswith('.gz') else name
+
+
+def collect_logs(log_dir=LOG_DIR):
+    """Group the access log files by the date in their file name.
+
+    When both the plain and the gzip file of a log exist (compression in
+    progress) only the plain file is used so requests are not counted twice.
+
+    Parameters
+    ----------
+    log_dir : str
+        Directory of the Tomcat access logs.
+
+    Returns
+    -------
+    dict
+        Date string (YYYY-MM-DD) to sorted list of log file paths.
+    """
+    log_files = sorted(
+        path for path in glob.glob(os.path.join(log_dir, "localhost_access_log.*"))
+        if path.endswith(LOG_SUFFIXES)
     )
-    with open(log_file, "r", errors="replace", encoding="utf-8") as f:
-        for line in f:
-            m = log_pattern.search(line)
-            if not m:
-                continue
-            _, path, status, bytes_raw = m.group(1), m.group(2), m.group(3), m.group(4)
-            bval = int(bytes_raw) if bytes_raw != "-" else 0
-            stats['total'] += 1
-            stats['bytes_sent'] += bval
-            if status != "200":
-                stats['failed'] += 1
-            else:
-                stats['bytes_success'] += bval
-            if "ncss" in path:
-                stats['subset'] += 1
-            elif "dodsC" in path:
-                stats['opendap'] += 1
-            elif "fileServer" in path:
-                stats['fileserver'] += 1
+    plain = set(log_files)
+
+    logs_by_date = {}
+    for log_file in log_files:
+        if log_file.endswith('.gz') and log_file[:-3] in plain:
+            continue
+        m = date_from_filename.search(os.path.basename(log_file))
+        if m:
+            logs_by_date.setdefault(m.group(1), []).append(log_file)
+    return logs_by_date
+
+
+def get_worker_count(requested=None):
+    """Number of worker processes for the pool.
+
+    Parameters
+    ----------
+    requested : int, optional
+        Explicit worker count (--workers). Default is None which uses
+        LOG_STATS_WORKERS or the number of CPUs available to the process.
+
+    Returns
+    -------
+    int
+        At least 1.
+    """
+    if requested is None:
+        env_workers = os.getenv('LOG_STATS_WORKERS')
+        if env_workers:
+            requested = int(env_workers)
+        elif hasattr(os, 'sched_getaffinity'):
+            requested = len(os.sched_getaffinity(0))
+        else:
+            requested = os.cpu_count() or 1
+    return max(1, requested)
+
+
+def update_dates(logs_by_date, dates, checkpoint, workers=1):
+    """Bring the stats of the given dates up to date, resuming from the checkpoint.
+
+    Each log is read from the offset recorded in the checkpoint if it is
+    still the same file (same inode, not truncated), from the start
+    otherwise. A .gz log continues from the offset of its plain file since
+    the offsets are uncompressed byte offsets.
+
+    Parameters
+    ----------
+    logs_by_date : dict
+        Date string to list of log files (see `collect_logs`).
+    dates : list[str]
+        Dates to process.
+    checkpoint : dict
+        The checkpoint (see `load_checkpoint`), updated in place.
+    workers : int
+        Number of worker processes, 1 processes the files in this process.
+
+    Returns
+    -------
+    dict
+        Date string to stats dict of the whole date so far.
+    """
+    logs = checkpoint["logs"]
+
+    # one task per log file with new data, remembering the date each file belongs to
+    tasks = []
+    for date in sorted(dates):
+        for log_file in logs_by_date[date]:
+            name = log_name(log_file)
+            st = os.stat(log_file)
+            entry = logs.get(name)
+            if log_file.endswith('.gz'):
+                # compressed logs do not grow, finished if read once with this inode
+                if entry and entry["inode"] == st.st_ino:
+                    continue
+                start = entry["offset"] if entry else 0
+            elif entry and entry["inode"] == st.st_ino and entry["offset"] <= st.st_size:
+                if entry["offset"] == st.st_size:
+                    entry["mtime"] = st.st_mtime
+                    continue
+                start = entry["offset"]
             else:
-                stats['other'] += 1
-    return stats
+                # new, replaced or truncated file
+                entry = None
+                start = 0
+            if entry is None:
+                logs[name] = dict(date=date, inode=st.st_ino, offset=0, mtime=st.st_mtime, stats=empty_stats())
+            tasks.append((date, name, log_file, start, st))
+
+    workers = min(workers, len(tasks))
+    args = [(log_file, start) for _, _, log_file, start, _ in tasks]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_process_task, args))
+    else:
+        results = [_process_task(arg) for arg in args]
+
+    # merge the new stats into the checkpoint entries
+    for (date, name, log_file, start, st), (stats, end_offset) in zip(tasks, results):
+        print(f"Processed {log_file} for date {date} (bytes {start}-{end_offset})")
+        entry = logs[name]
+        merge_stats(entry["stats"], stats)
+        entry.update(inode=st.st_ino, offset=end_offset, mtime=st.st_mtime)
+
+    # the stats of a date are the sum over its logs
+    # (theoretically there should only be one log file per date, but we handle multiple just in case)
+    totals = {date: empty_stats() for date in dates}
+    for name, entry in logs.items():
+        if entry["date"] in totals:
+            merge_stats(totals[entry["date"]], entry["stats"])
+    return totals
+
+
+def is_sealed(date, log_files, checkpoint, today, seal_after, now):
+    """True if the date is finished: before today and every log read to the end and quiet.
+
+    A log counts as quiet when it has not been modified for seal_after
+    seconds, compressed logs are always final.
+    """
+    if date >= today:
+        return False
+    for log_file in log_files:
+        entry = checkpoint["logs"].get(log_name(log_file))
+        if entry is None:
+            return False
+        if log_file.endswith('.gz'):
+            continue
+        st = os.stat(log_file)
+        if entry["offset"] != st.st_size or now - st.st_mtime < seal_after:
+            return False
+    return True
+
+
+def format_row(date, s):
+    """CSV row of a date in the HEADER column order."""
+    return f"{date},{s['total']},{s['failed']},{s['bytes_sent']},{s['bytes_success']},{s['subset']},{s['opendap']},{s['fileserver']},{s['other']}\n"
 
 
-def get_existing_dates():
-    """Read the existing date in the stats file
+def format_dataset_rows(date, s):
+    """CSV rows of a date in the DATASET_HEADER column order, the busiest DATASET_CAPACITY pairs."""
+    rows = []
+    for key, requests, nbytes, failures, _ in s['datasets'].top(DATASET_CAPACITY):
+        dsid, service = key.split(' ')
+        rows.append(f"{date},{dsid},{service},{requests},{nbytes},{failures}\n")
+    return "".join(rows)
+
+
+def format_host_rows(date, s, n=TOP_HOSTS):
+    """CSV rows of the n busiest hosts of a date in the HOSTS_HEADER column order."""
+    return "".join(
+        f"{date},{rank},{host},{requests},{nbytes},{failures}\n"
+        for rank, (host, requests, nbytes, failures, _) in enumerate(s['hosts'].top(n), start=1)
+    )
+
+
+def latency_sketches(s):
+    """Latency sketches of a stats dict by service (plus 'all') and by dsid.
 
     Returns
     -------
-    set
-        A set of date strings (YYYY-MM-DD) that are already present in the output file.
+    tuple
+        (service -> QuantileSketch, dsid -> QuantileSketch)
     """
-    if not os.path.exists(OUTPUT_FILE):
-        return set()
-    dates = set()
-    with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
+    by_service = {'all': QuantileSketch()}
+    for service in SERVICES:
+        by_service[service] = s['latency'][service].copy()
+        by_service['all'].merge(s['latency'][service])
+    by_dataset = {}
+    for key, entry in s['datasets'].entries.items():
+        dsid = key.split(' ')[0]
+        by_dataset.setdefault(dsid, QuantileSketch()).merge(entry[4])
+    return by_service, by_dataset
+
+
+def format_latency_rows(label, by_service, by_dataset):
+    """CSV rows in the LATENCY_HEADER column order, services first then datasets by requests."""
+    rows = []
+    order = ('all',) + SERVICES
+    services = sorted(by_service.items(), key=lambda item: order.index(item[0]) if item[0] in order else len(order))
+    ranked_datasets = sorted(by_dataset.items(), key=lambda item: (-item[1].count, item[0]))
+    for scope, items in (('service', services), ('dataset', ranked_datasets)):
+        for key, sketch in items:
+            count = sketch.count
+            if count == 0:
+                continue
+            percentiles = ",".join(f"{sketch.quantile(q):.2f}" for q in LATENCY_QUANTILES)
+            rows.append(f"{label},{scope},{key},{count},{percentiles}\n")
+    return "".join(rows)
+
+
+def format_sketch_line(date, by_service, by_dataset):
+    """One JSON line of the latency sketches of a date (LATENCY_SKETCH_FILE)."""
+    return json.dumps(dict(
+        date=date,
+        service={key: sketch.to_json() for key, sketch in by_service.items() if sketch.bins},
+        dataset={key: sketch.to_json() for key, sketch in by_dataset.items() if sketch.bins},
+    ), separators=(',', ':'), sort_keys=True) + "\n"
+
+
+def combine_latency(sketch_file, start, end):
+    """Merge the daily latency sketches of the dates start to end (inclusive).
+
+    Parameters
+    ----------
+    sketch_file : str
+        Path of the sketch file (LATENCY_SKETCH_FILE).
+    start, end : str
+        First and last date (YYYY-MM-DD).
+
+    Returns
+    -------
+    tuple
+        (service -> QuantileSketch, dsid -> QuantileSketch, number of dates merged)
+    """
+    by_service, by_dataset, seen = {}, {}, set()
+    with open(sketch_file, "r", encoding="utf-8") as f:
         for line in f:
-            parts = line.strip().split(',')
-            if parts and re.match(r'\d{4}-\d{2}-\d{2}', parts[0]):
-                dates.add(parts[0])
-    return dates
+            day = json.loads(line)
+            # a date appended twice by a run killed before the export was tracked counts once
+            if not start <= day["date"] <= end or day["date"] in seen:
+                continue
+            seen.add(day["date"])
+            for scope, combined in (("service", by_service), ("dataset", by_dataset)):
+                for key, bins in day[scope].items():
+                    combined.setdefault(key, QuantileSketch()).merge(QuantileSketch.from_json(bins))
+    return by_service, by_dataset, len(seen)
+
+
+class StatsStore:
+    """Date partitioned store of the sealed stats tables with a manifest.
+
+    Every table is split in monthly partitions
+    ``<root>/<table>/<YYYY-MM>.csv.gz``. A batch of new dates is appended as
+    one more gzip member, so nothing is rewritten and readers (gzip, pandas)
+    see a single CSV with one header. ``<root>/manifest.json`` lists per
+    table the columns and per partition the file, dates, rows and size::
+
+        {"version": 1, "tables": {"daily": {"columns": ["date", ...],
+            "partitions": {"2025-10": {"path": "daily/2025-10.csv.gz",
+                "dates": ["2025-10-01", ...], "rows": 31, "bytes": 1234}}}}}
+
+    so the existing dates are known without reading any data and readers
+    fetch only the partitions (months) they need. Bytes past the size in the
+    manifest (an append interrupted before the manifest was saved) are
+    truncated before the next append.
+
+    The plain file exports of the sealed dates (CSV files, latency sketch
+    lines) are tracked the same way under ``"exports"``: per file its size
+    and the dates it holds, so a date is appended at most once and a write
+    interrupted before `save` is truncated and redone by the next run.
+    """
+
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        self.manifest_file = os.path.join(root, "manifest.json")
+        try:
+            with open(self.manifest_file, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = {"version": STORE_VERSION, "tables": {}}
+
+    def has_table(self, table):
+        """True if the table has at least one partition."""
+        return bool(self.manifest["tables"].get(table, {}).get("partitions"))
+
+    def dates(self, table='daily'):
+        """Set of the dates stored in a table."""
+        partitions = self.manifest["tables"].get(table, {}).get("partitions", {})
+        return {date for partition in partitions.values() for date in partition["dates"]}
+
+    def append(self, table, header, rows_by_date):
+        """Append the CSV rows of some dates to a table (manifest saved by `save`).
+
+        Parameters
+        ----------
+        table : str
+            Table name (see STORE_TABLES).
+        header : str
+            CSV header line of the table.
+        rows_by_date : dict
+            Date string to its CSV rows (str, lines ending in newline).
+        """
+        meta = self.manifest["tables"].setdefault(
+            table, {"columns": header.strip().split(','), "partitions": {}}
+        )
+        by_month = {}
+        for date in sorted(rows_by_date):
+            by_month.setdefault(date[:7], []).append(date)
+
+        for month, dates in by_month.items():
+            partition = meta["partitions"].setdefault(
+                month, {"path": f"{table}/{month}.csv.gz", "dates": [], "rows": 0, "bytes": 0}
+            )
+            path = os.path.join(self.root, partition["path"])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            rows = "".join(rows_by_date[date] for date in dates)
+            if partition["bytes"] == 0:
+                rows = header + rows
+            with open(path, "ab") as f:
+                # drop an append the manifest does not know about
+                f.truncate(partition["bytes"])
+                f.seek(partition["bytes"])
+                f.write(gzip.compress(rows.encode("utf-8")))
+                f.flush()
+                os.fsync(f.fileno())
+                partition["bytes"] = f.tell()
+            partition["dates"] = sorted(set(partition["dates"]) | set(dates))
+            partition["rows"] += sum(1 for date in dates for _ in rows_by_date[date].splitlines())
+
+    def import_csv(self, table, csv_file):
+        """Fill an empty table from an existing CSV export (one time migration)."""
+        if self.has_table(table) or not os.path.exists(csv_file):
+            return 0
+        rows_by_date = {}
+        with open(csv_file, "r", encoding="utf-8") as f:
+            header = f.readline()
+            for line in f:
+                date = line.split(',', 1)[0]
+                if re.match(r'\d{4}-\d{2}-\d{2}$', date):
+                    rows_by_date[date] = rows_by_date.get(date, "") + line
+        if rows_by_date:
+            self.append(table, header, rows_by_date)
+        return len(rows_by_date)
+
+    def export(self, path, header, rows_by_date, date_of=None):
+        """Append the rows of the dates not exported yet to a plain file (manifest saved by `save`).
+
+        Parameters
+        ----------
+        path : str
+            The export file (CSV or JSON lines).
+        header : str
+            Header line written to a new file ('' for none).
+        rows_by_date : dict
+            Date string to its rows (str, lines ending in newline).
+        date_of : callable, optional
+            Date of a line (str), used once to find the dates of a file
+            written before it was tracked. Default: the first CSV field.
+
+        Returns
+        -------
+        int
+            Number of dates appended.
+        """
+        exports = self.manifest.setdefault("exports", {})
+        name = os.path.basename(path)
+        meta = exports.get(name)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if meta is None or size < meta["bytes"]:
+            # written before the exports were tracked, or replaced since
+            meta = exports[name] = scan_export(path, date_of or (lambda line: line.split(',', 1)[0]))
+        exported = set(meta["dates"])
+        dates = [date for date in sorted(rows_by_date) if date not in exported]
+        rows = "".join(rows_by_date[date] for date in dates)
+        if meta["bytes"] == 0:
+            rows = header + rows
+        with open(path, "ab") as f:
+            # drop an append the manifest does not know about
+            f.truncate(meta["bytes"])
+            f.seek(meta["bytes"])
+            f.write(rows.encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+            meta["bytes"] = f.tell()
+        meta["dates"] = sorted(exported | set(dates))
+        return len(dates)
+
+    def save(self):
+        """Write the manifest atomically."""
+        os.makedirs(self.root, exist_ok=True)
+        write_text_atomic(self.manifest_file, json.dumps(self.manifest, indent=1, sort_keys=True))
+
+
+def scan_export(path, date_of):
+    """Export state of a file written without one: its dates and its size up to the last complete line."""
+    dates, size = set(), 0
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            for line in f:
+                if line[-1:] != b"\n":
+                    break
+                size += len(line)
+                try:
+                    date = date_of(line.decode("utf-8"))
+                except ValueError:
+                    continue
+                if re.match(r'\d{4}-\d{2}-\d{2}$', date or ''):
+                    dates.add(date)
+    return {"bytes": size, "dates": sorted(dates)}
+
+
+def sketch_date(line):
+    """Date of a line of the latency sketch file."""
+    return json.loads(line).get("date")
+
 
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(description="Summarize the daily TDS usage from the Tomcat access logs.")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: LOG_STATS_WORKERS or the available CPUs)")
+    parser.add_argument('--log-dir', default=LOG_DIR,
+                        help=f"directory of the access logs and the stats files (default: {LOG_DIR})")
+    parser.add_argument('--seal-after', type=int, default=SEAL_AFTER,
+                        help=f"seconds a past day's log must be unmodified before the day is sealed (default: {SEAL_AFTER})")
+    parser.add_argument('--percentiles', nargs=2, metavar=('START', 'END'),
+                        help="print the latency percentiles combined over the sealed dates START to END (YYYY-MM-DD) and exit")
+    args = parser.parse_args()
+    current_file = os.path.join(args.log_dir, os.path.basename(CURRENT_FILE))
+    checkpoint_file = os.path.join(args.log_dir, os.path.basename(CHECKPOINT_FILE))
+    dataset_current_file = os.path.join(args.log_dir, os.path.basename(DATASET_CURRENT_FILE))
+    hosts_current_file = os.path.join(args.log_dir, os.path.basename(HOSTS_CURRENT_FILE))
+    latency_current_file = os.path.join(args.log_dir, os.path.basename(LATENCY_CURRENT_FILE))
+    sketch_file = os.path.join(args.log_dir, os.path.basename(LATENCY_SKETCH_FILE))
+    store = StatsStore(os.path.join(args.log_dir, os.path.basename(STORE_DIR)))
+
+    # multi-day percentiles from the daily sketches
+    if args.percentiles:
+        start, end = args.percentiles
+        by_service, by_dataset, n_dates = combine_latency(sketch_file, start, end)
+        print(f"# {n_dates} date(s) with latency sketches", file=sys.stderr)
+        sys.stdout.write(LATENCY_HEADER + format_latency_rows(f"{start}/{end}", by_service, by_dataset))
+        sys.exit(0)
+
     # Collect log files grouped by date
-    log_files = sorted(glob.glob(os.path.join(LOG_DIR, "localhost_access_log.*")))
-    print(f"Found {len(log_files)} log files")
+    logs_by_date = collect_logs(args.log_dir)
+    print(f"Found {sum(len(files) for files in logs_by_date.values())} log files")
 
-    # track all available log files by date
-    logs_by_date = {}
-    for log_file in log_files:
-        m = date_from_filename.search(os.path.basename(log_file))
-        if m:
-            logs_by_date.setdefault(m.group(1), []).append(log_file)
+    # the CSV files written before the store existed are imported once; the
+    # flag keeps the rows of a run killed before its save from being imported
+    if not store.manifest.get("imported"):
+        imported = {
+            table: store.import_csv(table, os.path.join(args.log_dir, os.path.basename(csv_file)))
+            for table, (_, csv_file) in STORE_TABLES.items()
+        }
+        store.manifest["imported"] = True
+        store.save()
+        if any(imported.values()):
+            print(f"Imported the CSV files into {store.root}: {imported}")
 
-    # find exising date in the output
-    existing_dates = get_existing_dates()
+    # find exising (sealed) date in the store manifest
+    existing_dates = store.dates('daily')
 
-    # find missing date in the output
+    # find missing date in the output, including today's growing log
     missing_dates = sorted(set(logs_by_date.keys()) - existing_dates)
 
+    # resume from the checkpoint, dropping logs of dates already sealed
+    checkpoint = load_checkpoint(checkpoint_file)
+    checkpoint["logs"] = {
+        name: entry for name, entry in checkpoint["logs"].items()
+        if entry["date"] in missing_dates
+    }
+
     if not missing_dates:
         print("No missing dates to process.")
+        save_checkpoint(checkpoint_file, checkpoint)
         sys.exit(0)
 
     print(f"Processing {len(missing_dates)} missing date(s): {missing_dates}")
 
-    # create rows of stats for missing dates
-    rows = []
-    for date in missing_dates:
-        print(f"Processing logs for date {date}...")
-
-        # initialize total stats for the date
-        # same structure as the stats dict in process_log_file, but scoped to the entire date
-        # (accumulating across all log files for that date)
-        total = dict(
-            total=0, failed=0, bytes_sent=0, bytes_success=0,
-            subset=0, opendap=0, fileserver=0, other=0
-        )
+    # bring the stats of the missing dates up to date
+    workers = get_worker_count(args.workers)
+    print(f"Using {workers} worker process(es)")
+    totals = update_dates(logs_by_date, missing_dates, checkpoint, workers)
 
-        # process each log file for the date and accumulate stats 
-        # (theoretically there should only be one log file per date, but we handle multiple just in case)
-        for log_file in logs_by_date[date]:
-            s = process_log_file(log_file)
-            for k in total:
-                total[k] += s[k]
-        rows.append((date, total))
-
-    # test is the output file already exists
-    # if not we need to write the header
-    first_run = not os.path.exists(OUTPUT_FILE)
-    # if the file already exists, we append to it; otherwise we create a new file
-    mode = "w" if first_run else "a"
-
-    # write the stats to the output file
-    with open(OUTPUT_FILE, mode, encoding="utf-8") as f:
-        if first_run:
-            f.write(HEADER)
-        for date, s in rows:
-            f.write(f"{date},{s['total']},{s['failed']},{s['bytes_sent']},{s['bytes_success']},{s['subset']},{s['opendap']},{s['fileserver']},{s['other']}\n")
-
-    print(f"Wrote {len(rows)} row(s) to {OUTPUT_FILE}")
+    # split finished (sealed) dates from the ones still growing
+    now = time.time()
+    today = time.strftime("%Y-%m-%d", time.localtime(now))
+    sealed = [
+        date for date in missing_dates
+        if is_sealed(date, logs_by_date[date], checkpoint, today, args.seal_after, now)
+    ]
+    current = [date for date in missing_dates if date not in sealed]
+
+    # write the stats of the sealed dates to the store, 'daily' last since
+    # its dates mark what is sealed, and to the CSV and sketch exports. One
+    # manifest save commits all of them: a run killed before it leaves
+    # appends that the next run truncates and redoes, none is doubled or lost
+    if sealed:
+        sealed_latency = {date: latency_sketches(totals[date]) for date in sealed}
+        new_rows = {
+            'datasets': {date: format_dataset_rows(date, totals[date]) for date in sealed},
+            'hosts': {date: format_host_rows(date, totals[date]) for date in sealed},
+            'latency': {date: format_latency_rows(date, *sealed_latency[date]) for date in sealed},
+            'daily': {date: format_row(date, totals[date]) for date in sealed},
+        }
+        for table, rows_by_date in new_rows.items():
+            store.append(table, STORE_TABLES[table][0], rows_by_date)
+        for table, rows_by_date in new_rows.items():
+            header, csv_file = STORE_TABLES[table]
+            store.export(os.path.join(args.log_dir, os.path.basename(csv_file)), header, rows_by_date)
+        # dates logged without %D have no latency to keep
+        store.export(sketch_file, "", {
+            date: format_sketch_line(date, *sealed_latency[date]) for date in sealed
+            if sealed_latency[date][0]['all'].bins
+        }, sketch_date)
+        store.save()
+    print(f"Wrote {len(sealed)} sealed date(s) to {store.root} and the CSV exports")
+
+    # the partial stats of the dates still growing replace the current files
+    write_text_atomic(current_file, HEADER + "".join(format_row(date, totals[date]) for date in current))
+    write_text_atomic(dataset_current_file, DATASET_HEADER + "".join(format_dataset_rows(date, totals[date]) for date in current))
+    write_text_atomic(hosts_current_file, HOSTS_HEADER + "".join(format_host_rows(date, totals[date]) for date in current))
+    write_text_atomic(latency_current_file, LATENCY_HEADER + "".join(
+        format_latency_rows(date, *latency_sketches(totals[date])) for date in current
+    ))
+    print(f"Wrote {len(current)} partial date(s) to {current_file}")
+
+    # sealed dates are in the output file now, only keep the open logs
+    checkpoint["logs"] = {
+        name: entry for name, entry in checkpoint["logs"].items()
+        if entry["date"] not in sealed
+    }
+    save_checkpoint(checkpoint_file, checkpoint)
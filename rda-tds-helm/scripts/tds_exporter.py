@@ -0,0 +1,224 @@
+"""
+Prometheus exporter of the TDS access log, run in the rda-logs sidecar.
+
+This script will
+1. tail today's Tomcat access log (localhost_access_log.<date>.txt) in
+   /usr/local/tomcat/logs, following the switch to the next day's file.
+2. parse every new line with the parser of log_stats.py (same fields,
+   same service classification, %D latency when logged).
+3. expose the counters as Prometheus metrics on http://<pod>:<port>/metrics
+
+Metrics (label service = subset, opendap, fileserver or other):
+- tds_requests_total{service,status}           requests by status class (2xx, 3xx, 4xx, 5xx)
+- tds_request_failures_total{service}          requests with status != 200 (failed_requests of log_stats)
+- tds_response_bytes_total{service}            bytes sent
+- tds_request_duration_seconds{service}        histogram of the %D processing time
+- tds_exporter_skipped_lines_total             lines that are not request lines
+
+All replicas write to the same access log on the logs-persist volume, so
+every replica exports the traffic of the whole deployment: aggregate with
+max() across pods rather than sum().
+
+Deployment:
+- shipped in the log-stats-script configmap next to log_stats.py and mounted
+  at /scripts in the rda-logs container, which runs it next to `tail -f`
+  when webapp.logs.exporter is true (the image needs python3).
+- /metrics answers 503 once the log tail thread died, which fails the
+  liveness probe of the sidecar.
+
+Usage:
+    python3 tds_exporter.py [--port 9464] [--log-dir /usr/local/tomcat/logs]
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import log_stats
+
+# histogram buckets of the request duration in seconds, up to the ingress responseTimeout (180 s)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 180)
+POLL_INTERVAL = 1.0
+DEFAULT_PORT = int(os.getenv('TDS_EXPORTER_PORT', '9464'))
+
+
+class Metrics:
+    """Thread safe counters of the access log, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}       # (service, status class) -> count
+        self.failures = {}       # service -> count
+        self.bytes = {}          # service -> bytes
+        self.duration = {}       # service -> [bucket counts..., sum, count]
+        self.skipped = 0
+
+    def observe(self, service, status, nbytes, latency_ms):
+        """Count one request."""
+        status_class = f"{status[:1]}xx"
+        with self.lock:
+            key = (service, status_class)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if status != "200":
+                self.failures[service] = self.failures.get(service, 0) + 1
+            self.bytes[service] = self.bytes.get(service, 0) + nbytes
+            if latency_ms is not None:
+                seconds = latency_ms / 1000
+                histogram = self.duration.setdefault(service, [0] * (len(DURATION_BUCKETS) + 2))
+                for i, bound in enumerate(DURATION_BUCKETS):
+                    if seconds <= bound:
+                        histogram[i] += 1
+                histogram[-2] += seconds
+                histogram[-1] += 1
+
+    def skip(self):
+        """Count one line that is not a request line."""
+        with self.lock:
+            self.skipped += 1
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            lines.append("# HELP tds_requests_total TDS requests by service and status class.")
+            lines.append("# TYPE tds_requests_total counter")
+            for (service, status_class), count in sorted(self.requests.items()):
+                lines.append(f'tds_requests_total{{service="{service}",status="{status_class}"}} {count}')
+
+            lines.append("# HELP tds_request_failures_total TDS requests with a status other than 200.")
+            lines.append("# TYPE tds_request_failures_total counter")
+            for service, count in sorted(self.failures.items()):
+                lines.append(f'tds_request_failures_total{{service="{service}"}} {count}')
+
+            lines.append("# HELP tds_response_bytes_total Bytes sent by TDS.")
+            lines.append("# TYPE tds_response_bytes_total counter")
+            for service, count in sorted(self.bytes.items()):
+                lines.append(f'tds_response_bytes_total{{service="{service}"}} {count}')
+
+            lines.append("# HELP tds_request_duration_seconds TDS request processing time (%D).")
+            lines.append("# TYPE tds_request_duration_seconds histogram")
+            for service, histogram in sorted(self.duration.items()):
+                for bound, count in zip(DURATION_BUCKETS, histogram):
+                    lines.append(f'tds_request_duration_seconds_bucket{{service="{service}",le="{bound}"}} {count}')
+                lines.append(f'tds_request_duration_seconds_bucket{{service="{service}",le="+Inf"}} {histogram[-1]}')
+                lines.append(f'tds_request_duration_seconds_sum{{service="{service}"}} {histogram[-2]:.6f}')
+                lines.append(f'tds_request_duration_seconds_count{{service="{service}"}} {histogram[-1]}')
+
+            lines.append("# HELP tds_exporter_skipped_lines_total Access log lines that are not request lines.")
+            lines.append("# TYPE tds_exporter_skipped_lines_total counter")
+            lines.append(f"tds_exporter_skipped_lines_total {self.skipped}")
+        return "\n".join(lines) + "\n"
+
+
+def todays_log(log_dir):
+    """Path of today's access log."""
+    return os.path.join(log_dir, f"localhost_access_log.{time.strftime('%Y-%m-%d')}.txt")
+
+
+def count_lines(data, metrics):
+    """Count the complete lines of data, return the trailing partial line (or b'')."""
+    lines = data.split(b'\n')
+    # the last element is a line Tomcat is still writing (or b'')
+    remainder = lines.pop()
+    for line in lines:
+        parsed = log_stats.parse_line(line + b'\n')
+        if parsed is None:
+            metrics.skip()
+            continue
+        _, request_path, status, nbytes, latency_ms = parsed
+        metrics.observe(
+            log_stats.classify_service(request_path),
+            status.decode('ascii', 'replace'), nbytes, latency_ms
+        )
+    return remainder
+
+
+def follow(log_dir, metrics, poll_interval=POLL_INTERVAL):
+    """Tail today's access log forever and count its complete lines.
+
+    Starts at the end of the current log (the history is log_stats.py's
+    job), reads the next day's log from its beginning and reopens the log
+    if it was replaced (inode changed) or truncated.
+    """
+    f = None
+    path = inode = None
+    remainder = b''
+    first = True
+
+    while True:
+        current = todays_log(log_dir)
+        try:
+            st = os.stat(current)
+        except FileNotFoundError:
+            st = None
+
+        # (re)open on a new day, a replaced or a truncated file
+        if st is not None and (current != path or st.st_ino != inode or st.st_size < f.tell()):
+            if f is not None:
+                # drain the previous file: lines written since the last poll and its unterminated last line
+                remainder = count_lines(remainder + f.read(), metrics)
+                if remainder:
+                    count_lines(remainder + b'\n', metrics)
+                f.close()
+            f = open(current, 'rb')
+            if first:
+                f.seek(0, os.SEEK_END)
+            path, inode, remainder = current, st.st_ino, b''
+        first = False
+
+        if f is not None:
+            chunk = f.read()
+            if chunk:
+                remainder = count_lines(remainder + chunk, metrics)
+        time.sleep(poll_interval)
+
+
+def make_handler(metrics, is_alive=None):
+    """HTTP handler class serving the metrics on /metrics.
+
+    is_alive (e.g. the is_alive of the log tail thread) returning False
+    makes /metrics answer 503, so the liveness probe restarts the sidecar
+    instead of serving frozen counters.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            if is_alive is not None and not is_alive():
+                self.send_error(503, "access log tail stopped")
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # scrapes every few seconds would flood the sidecar output
+            pass
+
+    return MetricsHandler
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Prometheus exporter of the TDS access log.")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                        help=f"port of the /metrics endpoint (default: TDS_EXPORTER_PORT or 9464)")
+    parser.add_argument('--log-dir', default=log_stats.LOG_DIR,
+                        help=f"directory of the access logs (default: {log_stats.LOG_DIR})")
+    args = parser.parse_args()
+
+    metrics = Metrics()
+    tail_thread = threading.Thread(target=follow, args=(args.log_dir, metrics), daemon=True)
+    tail_thread.start()
+
+    server = ThreadingHTTPServer(('', args.port), make_handler(metrics, tail_thread.is_alive))
+    print(f"Serving TDS access log metrics of {args.log_dir} on :{args.port}/metrics", file=sys.stderr)
+    server.serve_forever()
@@ -0,0 +1,91 @@
+"""
+Atomic, crash-safe file writes for generated catalogs.
+
+The new content is written to a temporary file in the target directory,
+fsync'ed and renamed over the target, so readers (TDS) see either the old
+or the new file, never a truncated one, even if the writer is killed
+mid-write (e.g. a Prefect flow timeout). A target whose content is already
+identical (same SHA-256) is left untouched so its mtime does not change and
+TDS does not reinitialize the catalog.
+
+Usage:
+    changed = write_atomic('rda-tds/content/catalog.xml', xml_bytes)
+"""
+import os
+import stat
+import hashlib
+import tempfile
+
+
+def file_sha256(path: str):
+    """SHA-256 hex digest of a file, None if it does not exist."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+def _fsync_dir(directory: str):
+    """fsync a directory so a rename in it is durable."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_atomic(path: str, data, skip_unchanged: bool = True) -> bool:
+    """Write data to path through an fsync'ed temporary file and a rename.
+
+    The permissions of an existing file are kept.
+
+    Parameters
+    ----------
+    path : str
+        Target file.
+    data : bytes or str
+        New file content (str is encoded as utf-8).
+    skip_unchanged : bool
+        Leave the target untouched if its content is identical (default True).
+
+    Returns
+    -------
+    bool
+        True if the file was written, False if it was unchanged.
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+
+    if skip_unchanged and file_sha256(path) == hashlib.sha256(data).hexdigest():
+        return False
+
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.'+os.path.basename(path)+'.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    _fsync_dir(directory)
+    return True
@@ -0,0 +1,419 @@
+#!/usr/bin/env python
+"""
+Trace driven simulation of the TDS file caches of threddsConfig.xml.
+
+Replays the Tomcat access logs (the files and line format log_stats.py
+reads) through a model of the NetcdfFileCache, RandomAccessFile,
+GribCollection and HTTPFileCache caches, and reports for a sweep of
+minFiles/maxFiles/scour settings the hit rate, the file opens per second
+and the number of files kept open. The current settings are read from
+rda-tds/content/threddsConfig.xml and marked with '*'.
+
+Each successful (2xx) request is mapped to the cache entries it uses:
+
+    dodsC, ncss on files/<dsid>/<file>              NetcdfFileCache <file>
+        GRIB files (served file by file) also       RandomAccessFile <file>
+    dodsC, ncss on a GRIB featureCollection path    GribCollection <collection path>
+    dodsC, ncss on other aggregations (NcML)        NetcdfFileCache <aggregation path>
+    fileServer on files/<dsid>/<file>               HTTPFileCache <file>
+
+(the featureCollection paths come from the catalogs in the content
+directory). The data files read inside a GRIB collection are not in the
+log, so their RandomAccessFile use is not simulated.
+
+Cache model (per cache, as netcdf-java's FileCache): a hit moves the entry
+to the most recently used end; a miss opens the file, and when the cache
+then holds more than maxFiles the least recently used entries are closed
+down to minFiles. Every scour period the entries idle for a whole period
+are closed, least recently used first, down to minFiles. Each cached entry
+holds one open file. The sum of the per cache peaks is compared to the
+open file limit of src/monitor/monitor.sh; with --entry-mb the peak entries
+are also converted to heap, to compare with the TDS -Xmx.
+
+Usage:
+    cache_sim.py [--log-dir DIR] [--start YYYY-MM-DD] [--end YYYY-MM-DD]
+                 [--config threddsConfig.xml] [--content-dir DIR]
+                 [--factors 0.5,1,2,4,8] [--scours 1,5,11,30]
+                 [--entry-mb NetcdfFileCache=20 ...]
+
+Example:
+    cache_sim.py --log-dir /usr/local/tomcat/logs --start 2025-10-01 --end 2025-10-07
+"""
+import os
+import re
+import sys
+import glob
+import argparse
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'rda-tds-helm', 'scripts'))
+import log_stats  # noqa: E402
+from grib_collections import GRIB_EXTENSIONS  # noqa: E402
+
+CONFIG_FILE = os.path.join(PROJECT_ROOT, 'rda-tds', 'content', 'threddsConfig.xml')
+CONTENT_DIR = os.path.join(PROJECT_ROOT, 'rda-tds', 'content')
+CACHES = ('NetcdfFileCache', 'RandomAccessFile', 'GribCollection', 'HTTPFileCache')
+# openFileLimit of src/monitor/monitor.sh and THREDDS_XMX_SIZE of rda-tds-helm/values.yaml
+OPEN_FILE_LIMIT = 2500
+HEAP_GB = 48
+# maxFiles multipliers of the default sweep, minFiles keeps its ratio to maxFiles
+SWEEP_FACTORS = (0.5, 1, 2, 4, 8)
+SCOUR_UNITS = {'sec': 1, 'min': 60, 'hour': 3600, 'hours': 3600}
+# suffixes appended to the dataset path by the OPeNDAP and NCSS services
+DODS_SUFFIXES = ('.dods', '.das', '.dds', '.ascii', '.asc', '.html', '.info', '.ver', '.dmr', '.dmr.xml', '.dap', '.dsr')
+NCSS_ENDPOINTS = ('dataset.html', 'dataset.xml', 'datasetBoundaries.xml', 'pointDataset.html', 'station.xml')
+
+log_time = re.compile(rb'\[([^\]]+)\]')
+
+
+@dataclass
+class CacheSetting:
+    """minFiles, maxFiles and scour (seconds) of a cache."""
+    min_files: int
+    max_files: int
+    scour: int
+
+    def __str__(self):
+        return f'{self.min_files}-{self.max_files}/{self.scour // 60 if self.scour % 60 == 0 else self.scour / 60:g}min'
+
+
+@dataclass
+class SimResult:
+    """Outcome of replaying one cache trace with one setting."""
+    setting: CacheSetting
+    accesses: int = 0
+    hits: int = 0
+    opens: int = 0
+    peak_open: int = 0
+    mean_open: float = 0.0
+    peak_opens_per_min: int = 0
+    duration: float = 0.0
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.accesses if self.accesses else 0.0
+
+    @property
+    def opens_per_sec(self) -> float:
+        return self.opens / self.duration if self.duration else 0.0
+
+
+def parse_scour(text: str) -> int:
+    """Seconds of a threddsConfig duration ('11 min', '0 hours', '30 sec')."""
+    value, unit = text.split()
+    return int(float(value) * SCOUR_UNITS[unit])
+
+
+def load_cache_settings(config_file: str = CONFIG_FILE) -> dict:
+    """Cache name to its CacheSetting in threddsConfig.xml (caches not set are left out)."""
+    root = ET.parse(config_file).getroot()
+    settings = {}
+    for name in CACHES:
+        element = root.find(name)
+        if element is None:
+            continue
+        settings[name] = CacheSetting(
+            min_files=int(element.findtext('minFiles')),
+            max_files=int(element.findtext('maxFiles')),
+            scour=parse_scour(element.findtext('scour'))
+        )
+    return settings
+
+
+def load_collection_paths(content_dir: str = CONTENT_DIR) -> list:
+    """The path of every featureCollection in the catalogs of the content directory."""
+    paths = set()
+    for catalog_file in glob.glob(os.path.join(content_dir, 'catalog*.xml')):
+        try:
+            root = ET.parse(catalog_file).getroot()
+        except ET.ParseError:
+            continue
+        for element in root.iter():
+            if element.tag.endswith('featureCollection') and element.get('path'):
+                paths.add(element.get('path').strip('/'))
+    # longest first so nested paths match before their parent
+    return sorted(paths, key=len, reverse=True)
+
+
+def dataset_path(path: bytes):
+    """
+    Service and dataset path of a dodsC, ncss or fileServer request.
+
+    Parameters
+    ----------
+    path : bytes
+        The request path (e.g. b'/thredds/dodsC/files/d010077/a.nc.dods?T').
+
+    Returns
+    -------
+    tuple or None
+        (service, dataset path without service suffix or query), e.g.
+        ('opendap', 'files/d010077/a.nc'), None for the other requests.
+    """
+    service = log_stats.classify_service(path)
+    if service == 'other':
+        return None
+    path = path.split(b'?', 1)[0].decode('utf-8', 'replace')
+    rest = path[9:].split('/', 1)[1] if '/' in path[9:] else ''
+    if service == 'opendap':
+        for suffix in DODS_SUFFIXES:
+            if rest.endswith(suffix):
+                rest = rest[:-len(suffix)]
+                break
+    elif service == 'subset':
+        if rest.startswith(('grid/', 'point/')):
+            rest = rest.split('/', 1)[1]
+        head, _, last = rest.rpartition('/')
+        if last in NCSS_ENDPOINTS:
+            rest = head
+    return (service, rest.strip('/')) if rest else None
+
+
+def cache_accesses(path: bytes, collection_paths: list) -> list:
+    """
+    Cache entries used by a request (see the module docstring).
+
+    Returns
+    -------
+    list
+        [(cache name, key), ...], [] for requests that open no file.
+    """
+    request = dataset_path(path)
+    if request is None:
+        return []
+    service, rest = request
+    if service == 'fileserver':
+        return [('HTTPFileCache', rest)] if rest.startswith('files/') else []
+    if rest.startswith('files/'):
+        if rest.lower().endswith(GRIB_EXTENSIONS):
+            return [('NetcdfFileCache', rest), ('RandomAccessFile', rest)]
+        return [('NetcdfFileCache', rest)]
+    for collection in collection_paths:
+        if rest == collection or rest.startswith(collection + '/'):
+            return [('GribCollection', collection)]
+    if rest.startswith('aggregations/'):
+        return [('NetcdfFileCache', rest)]
+    return []
+
+
+def parse_time(line: bytes, cache: dict) -> float:
+    """Epoch seconds of the [10/Oct/2025:13:55:36 -0600] field, None if missing."""
+    m = log_time.search(line)
+    if not m:
+        return None
+    stamp = m.group(1)
+    t = cache.get(stamp)
+    if t is None:
+        try:
+            t = datetime.strptime(stamp.decode('ascii'), '%d/%b/%Y:%H:%M:%S %z').timestamp()
+        except ValueError:
+            return None
+        if len(cache) > 100_000:
+            cache.clear()
+        cache[stamp] = t
+    return t
+
+
+def read_traces(log_files, collection_paths: list) -> dict:
+    """
+    Cache name to its trace [(time, key), ...] in time order.
+
+    Parameters
+    ----------
+    log_files : list[str]
+        Access logs (plain or .gz), replayed in the given order.
+    collection_paths : list[str]
+        featureCollection paths (see `load_collection_paths`).
+    """
+    traces = {name: [] for name in CACHES}
+    times = {}
+    for log_file in log_files:
+        with log_stats.open_log(log_file) as f:
+            for line in f:
+                parsed = log_stats.parse_line(line)
+                if parsed is None or not parsed[2].startswith(b'2'):
+                    continue
+                accesses = cache_accesses(parsed[1], collection_paths)
+                if not accesses:
+                    continue
+                t = parse_time(line, times)
+                if t is None:
+                    continue
+                for name, key in accesses:
+                    traces[name].append((t, key))
+    for trace in traces.values():
+        trace.sort(key=lambda access: access[0])
+    return traces
+
+
+def simulate(trace: list, setting: CacheSetting) -> SimResult:
+    """
+    Replay a cache trace with one setting.
+
+    Parameters
+    ----------
+    trace : list
+        [(time, key), ...] in time order.
+    setting : CacheSetting
+        minFiles, maxFiles and scour of the cache.
+
+    Returns
+    -------
+    SimResult
+    """
+    result = SimResult(setting=setting, accesses=len(trace))
+    if not trace:
+        return result
+    cache = OrderedDict()  # key -> last access time, least recently used first
+    start = last_time = trace[0][0]
+    next_scour = start + setting.scour if setting.scour > 0 else None
+    open_seconds = 0.0
+    minute, opens_in_minute = None, 0
+
+    for t, key in trace:
+        open_seconds += len(cache) * (t - last_time)
+        last_time = t
+
+        # scour: close the entries idle for a whole period, down to minFiles
+        while next_scour is not None and next_scour <= t:
+            while len(cache) > setting.min_files:
+                oldest_key, oldest_time = next(iter(cache.items()))
+                if oldest_time > next_scour - setting.scour:
+                    break
+                del cache[oldest_key]
+            # nothing changes until the next access, skip the idle periods
+            next_scour += setting.scour * max(1, int((t - next_scour) // setting.scour))
+
+        if key in cache:
+            result.hits += 1
+            cache.move_to_end(key)
+        else:
+            result.opens += 1
+            if int(t // 60) != minute:
+                minute, opens_in_minute = int(t // 60), 0
+            opens_in_minute += 1
+            result.peak_opens_per_min = max(result.peak_opens_per_min, opens_in_minute)
+            if len(cache) + 1 > setting.max_files:
+                # cleanup down to minFiles (the new entry included)
+                while cache and len(cache) + 1 > setting.min_files:
+                    cache.popitem(last=False)
+        cache[key] = t
+        result.peak_open = max(result.peak_open, len(cache))
+
+    result.duration = last_time - start
+    result.mean_open = open_seconds / result.duration if result.duration else float(len(cache))
+    return result
+
+
+def sweep_settings(current: CacheSetting, factors=SWEEP_FACTORS, scours=None) -> list:
+    """Settings around the current one: maxFiles times each factor, minFiles in the same ratio."""
+    ratio = current.min_files / current.max_files if current.max_files else 0
+    scours = scours or [current.scour]
+    settings = []
+    for factor in factors:
+        max_files = max(1, round(current.max_files * factor))
+        for scour in scours:
+            setting = CacheSetting(min(max_files, round(max_files * ratio)), max_files, scour)
+            if setting not in settings:
+                settings.append(setting)
+    if current not in settings:
+        settings.append(current)
+    return settings
+
+
+def format_report(name: str, results: list, current: CacheSetting, entry_mb: float = None) -> str:
+    """Table of the results of one cache."""
+    heading = f"{'':1} {'min-max/scour':>18} {'accesses':>10} {'hit rate':>9} {'opens':>9} {'opens/s':>8} " \
+              f"{'peak opens/min':>14} {'mean open':>9} {'peak open':>9}"
+    if entry_mb is not None:
+        heading += f" {'peak heap GB':>12}"
+    lines = [f'{name}', heading]
+    for r in results:
+        row = f"{'*' if r.setting == current else ' ':1} {str(r.setting):>18} {r.accesses:>10,} {r.hit_rate:>9.1%} " \
+              f"{r.opens:>9,} {r.opens_per_sec:>8.3f} {r.peak_opens_per_min:>14,} {r.mean_open:>9.1f} {r.peak_open:>9,}"
+        if entry_mb is not None:
+            row += f" {r.peak_open * entry_mb / 1024:>12.2f}"
+        lines.append(row)
+    return '\n'.join(lines)
+
+
+def select_logs(log_dir: str, start: str = None, end: str = None) -> list:
+    """Access logs of log_dir (see log_stats.collect_logs) between two dates, in date order."""
+    logs_by_date = log_stats.collect_logs(log_dir)
+    return [
+        log_file
+        for date in sorted(logs_by_date)
+        if (start is None or date >= start) and (end is None or date <= end)
+        for log_file in logs_by_date[date]
+    ]
+
+
+def parse_entry_mb(values) -> dict:
+    """Cache name to MB per entry of --entry-mb NAME=MB arguments, ValueError on a bad one."""
+    entry_mb = {}
+    for value in values or []:
+        name, _, mb = value.partition('=')
+        if name not in CACHES:
+            raise ValueError(f'unknown cache {name}, one of {", ".join(CACHES)}')
+        try:
+            entry_mb[name] = float(mb)
+        except ValueError:
+            raise ValueError(f'MB of {name} is not a number: {mb!r}') from None
+    return entry_mb
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay TDS access logs through the threddsConfig.xml file caches.')
+    parser.add_argument('--log-dir', default=log_stats.LOG_DIR, help='directory of the Tomcat access logs')
+    parser.add_argument('--start', help='first date (YYYY-MM-DD)')
+    parser.add_argument('--end', help='last date (YYYY-MM-DD)')
+    parser.add_argument('--config', default=CONFIG_FILE, help='threddsConfig.xml with the current settings')
+    parser.add_argument('--content-dir', default=CONTENT_DIR, help='catalogs holding the featureCollection paths')
+    parser.add_argument('--factors', default=','.join(f'{f:g}' for f in SWEEP_FACTORS),
+                        help='maxFiles multipliers of the sweep')
+    parser.add_argument('--scours', help='scour periods of the sweep in minutes (default the current one)')
+    parser.add_argument('--entry-mb', nargs='*', help='heap MB per cached entry, e.g. NetcdfFileCache=20')
+    args = parser.parse_args(argv)
+    try:
+        entry_mb = parse_entry_mb(args.entry_mb)
+    except ValueError as e:
+        parser.error(f'--entry-mb: {e}')
+
+    log_files = select_logs(args.log_dir, args.start, args.end)
+    if not log_files:
+        sys.stderr.write(f'No access logs in {args.log_dir}\n')
+        return 1
+    factors = [float(f) for f in args.factors.split(',')]
+    scours = [int(float(s) * 60) for s in args.scours.split(',')] if args.scours else None
+
+    current = load_cache_settings(args.config)
+    traces = read_traces(log_files, load_collection_paths(args.content_dir))
+    print(f'{len(log_files)} log file(s), {args.start or "first"} to {args.end or "last"}\n')
+
+    peak_open_files = 0
+    peak_heap_gb = 0.0
+    for name in CACHES:
+        if name not in current:
+            continue
+        results = [simulate(traces[name], setting) for setting in sweep_settings(current[name], factors, scours)]
+        print(format_report(name, results, current[name], entry_mb.get(name)))
+        print()
+        current_result = next(r for r in results if r.setting == current[name])
+        peak_open_files += current_result.peak_open
+        if name in entry_mb:
+            peak_heap_gb += current_result.peak_open * entry_mb[name] / 1024
+
+    # the per cache peaks may not coincide, their sum is an upper bound
+    print(f'Current settings: at most {peak_open_files:,} cached open files '
+          f'(monitor.sh limit {OPEN_FILE_LIMIT:,})')
+    if entry_mb:
+        print(f'Current settings: at most {peak_heap_gb:.2f} GB of heap in the cached entries (-Xmx {HEAP_GB}G)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+Batch editor of the top level TDS catalog (rda-tds/content/catalog.xml).
+
+The catalog is parsed once, its catalogRef elements are indexed by dsid and
+kept sorted by lowercased title. Any number of additions and removals are
+applied in memory (bisect insert) and the file is written once, atomically.
+
+Usage:
+    editor = CatalogEditor('rda-tds/content/catalog.xml')
+    editor.add('d123456', 'Example New Dataset Title for Testing')
+    editor.remove('d010014')
+    editor.write()
+"""
+from bisect import bisect_right
+import xml.etree.ElementTree as ET
+from atomic_write import write_atomic
+from pretty_xml import tree_to_bytes
+
+XMLNS = 'http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0'
+XMLNS_XLINK = 'http://www.w3.org/1999/xlink'
+CATALOG_REF = '{'+XMLNS+'}catalogRef'
+HREF = '{'+XMLNS_XLINK+'}href'
+TITLE = '{'+XMLNS_XLINK+'}title'
+
+
+def ref_dsid(ref):
+    """Dataset ID of a catalogRef (from catalog_<dsid>.xml), None if not a dataset."""
+    href = ref.get(HREF, '')
+    if href.startswith('catalog_') and href.endswith('.xml'):
+        return href[len('catalog_'):-len('.xml')]
+    return None
+
+
+def ref_key(ref):
+    """Sort key of a catalogRef: the xlink:title (case-insensitive)."""
+    return ref.get(TITLE, '').lower()
+
+
+class CatalogEditor:
+    """Load the catalog once, apply many catalogRef changes, write once.
+
+    Parameters
+    ----------
+    catalog_file : str
+        Path to the catalog XML file.
+    """
+
+    def __init__(self, catalog_file: str):
+        # Register namespaces
+        ET.register_namespace('', XMLNS)
+        ET.register_namespace('xlink', XMLNS_XLINK)
+
+        self.catalog_file = catalog_file
+        self.tree = ET.parse(catalog_file)
+        self.root = self.tree.getroot()
+
+        # catalogRef elements in title order, their sort keys and the dsid index
+        self._refs = [ref for ref in self.root if ref.tag == CATALOG_REF]
+        self._keys = [ref_key(ref) for ref in self._refs]
+        if self._keys != sorted(self._keys) or not self._refs_at_end():
+            self._normalize()
+        self._by_dsid = {}
+        for ref in self._refs:
+            dsid = ref_dsid(ref)
+            if dsid is not None:
+                self._by_dsid[dsid] = ref
+
+    def _refs_at_end(self):
+        """True if the catalogRef elements are the last children of root."""
+        return list(self.root)[len(self.root) - len(self._refs):] == self._refs
+
+    def _normalize(self):
+        """Move all catalogRef elements to the end of root in title order."""
+        self._refs.sort(key=ref_key)
+        self._keys = [ref_key(ref) for ref in self._refs]
+        for ref in self._refs:
+            self.root.remove(ref)
+        self.root.extend(self._refs)
+
+    def __contains__(self, dsid):
+        return dsid in self._by_dsid
+
+    def dsids(self) -> list[str]:
+        """Dataset IDs referenced by the catalog."""
+        return list(self._by_dsid)
+
+    def add(self, dsid: str, title: str):
+        """Insert a catalogRef for the dataset at its sorted position.
+
+        Parameters
+        ----------
+        dsid : str
+            The dataset ID for the new catalogRef.
+        title : str
+            The title for the new catalogRef.
+
+        Raises
+        ------
+        ValueError
+            If the dataset is already in the catalog.
+        """
+        if dsid in self._by_dsid:
+            raise ValueError(f'{dsid} is already in {self.catalog_file}')
+
+        # Create the new catalogRef element
+        new_ref = ET.Element(CATALOG_REF)
+        new_ref.set(HREF, f'catalog_{dsid}.xml')
+        new_ref.set(TITLE, f'{dsid} {title}')
+        new_ref.set('name', '')
+        new_ref.tail = '\n    ' #indentation and newline for pretty print
+
+        # after equal titles, same as appending then stable sorting
+        key = ref_key(new_ref)
+        index = bisect_right(self._keys, key)
+        first_ref = len(self.root) - len(self._refs)
+        self.root.insert(first_ref + index, new_ref)
+        self._refs.insert(index, new_ref)
+        self._keys.insert(index, key)
+        self._by_dsid[dsid] = new_ref
+
+    def remove(self, dsid: str) -> bool:
+        """Remove the catalogRef of the dataset.
+
+        Returns
+        -------
+        bool
+            True if the dataset was in the catalog.
+        """
+        ref = self._by_dsid.pop(dsid, None)
+        if ref is None:
+            return False
+        index = self._refs.index(ref)
+        del self._refs[index]
+        del self._keys[index]
+        self.root.remove(ref)
+        return True
+
+    def apply(self, additions=(), removals=()) -> list[str]:
+        """Apply a batch of removals and additions in memory.
+
+        Parameters
+        ----------
+        additions : iterable of (dsid, title)
+            catalogRefs to add.
+        removals : iterable of str
+            Dataset IDs to remove.
+
+        Returns
+        -------
+        list[str]
+            Dataset IDs of the removals that were not in the catalog.
+        """
+        missing = [dsid for dsid in removals if not self.remove(dsid)]
+        for dsid, title in additions:
+            self.add(dsid, title)
+        return missing
+
+    def to_bytes(self) -> bytes:
+        """Serialized catalog (same output as ElementTree.write)."""
+        return tree_to_bytes(self.root)
+
+    def write(self) -> bool:
+        """Write the catalog back to its file atomically (temp file + rename).
+
+        Returns
+        -------
+        bool
+            True if the file changed, False if the content was identical.
+        """
+        return write_atomic(self.catalog_file, self.to_bytes())
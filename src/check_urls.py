@@ -0,0 +1,162 @@
+"""
+Concurrent reachability check of TDS URLs.
+
+Checks many URLs with a small thread pool sharing one keep-alive
+requests.Session (one connection pool to tds.gdex.ucar.edu), so the
+control file flows do not pay a new TLS connection and a 10 s timeout per
+URL in sequence. Each URL gets a HEAD request, with a GET fallback
+(streamed, body not read) when HEAD is refused or not ok. Connection
+errors and 429/5xx responses are retried with exponential backoff by
+urllib3, and the request rate is capped below the ingress rate limit
+(webapp.tds.limit_rps) so the check never trips it.
+
+Usage:
+    statuses = check_urls(urls)           # url -> HTTP status, None if unreachable
+    ok = [url for url in urls if status_is_ok(statuses[url])]
+"""
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# webapp.tds.limit_rps in rda-tds-helm/values.yaml (per client IP)
+INGRESS_LIMIT_RPS = 150
+# stay at half of the ingress limit to leave room for the retries
+MAX_RPS = INGRESS_LIMIT_RPS // 2
+MAX_WORKERS = 16
+TIMEOUT = 10
+RETRIES = 3
+BACKOFF_FACTOR = 0.5
+
+
+class RateLimiter:
+    """Spaces calls of many threads at least 1/rate seconds apart."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.next_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """Block until the next call is allowed."""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_time, now)
+            self.next_time = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def make_session(pool_size: int = MAX_WORKERS, retries: int = RETRIES) -> requests.Session:
+    """
+    Create a session with a keep-alive connection pool and retry with backoff.
+
+    Parameters
+    ----------
+    pool_size : int
+        Connections kept per host, one per worker thread.
+    retries : int
+        Retries of connection errors and 429/502/503/504 responses.
+
+    Returns
+    -------
+    requests.Session
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=frozenset({"HEAD", "GET"}),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def status_is_ok(status) -> bool:
+    """True if status is a reachable HTTP status (200-399), like requests' Response.ok."""
+    return status is not None and 200 <= status < 400
+
+
+def check_url(session: requests.Session, url: str, limiter: RateLimiter = None, timeout: float = TIMEOUT):
+    """
+    HTTP status of url, HEAD first with a GET fallback.
+
+    Parameters
+    ----------
+    session : requests.Session
+        Session shared by the worker threads.
+    url : str
+        The URL to check.
+    limiter : RateLimiter, optional
+        Shared rate limiter, waited on before each request.
+    timeout : float
+        Connect and read timeout of each request in seconds.
+
+    Returns
+    -------
+    int or None
+        The HTTP status code, None if the URL could not be reached.
+    """
+    try:
+        if limiter is not None:
+            limiter.wait()
+        response = session.head(url, timeout=timeout, allow_redirects=True)
+        if response.ok:
+            return response.status_code
+
+        # some endpoints refuse or mishandle HEAD, confirm with a GET without reading the body
+        if limiter is not None:
+            limiter.wait()
+        with session.get(url, timeout=timeout, allow_redirects=True, stream=True) as response:
+            return response.status_code
+    except requests.RequestException as e:
+        print(f"Error: {url}: {e}")
+        return None
+
+
+def check_urls(
+    urls,
+    max_workers: int = MAX_WORKERS,
+    max_rps: float = MAX_RPS,
+    timeout: float = TIMEOUT,
+    retries: int = RETRIES
+) -> dict:
+    """
+    Check many URLs concurrently.
+
+    Parameters
+    ----------
+    urls : iterable of str
+        URLs to check, duplicates are checked once.
+    max_workers : int
+        Number of concurrent requests.
+    max_rps : float
+        Maximum number of requests per second over all workers.
+    timeout : float
+        Timeout of each request in seconds.
+    retries : int
+        Retries with backoff of connection errors and 429/5xx responses.
+
+    Returns
+    -------
+    dict
+        URL to HTTP status code, None for the unreachable URLs.
+    """
+    unique_urls = list(dict.fromkeys(urls))
+    if not unique_urls:
+        return {}
+
+    limiter = RateLimiter(max_rps)
+    workers = min(max_workers, len(unique_urls))
+    with make_session(workers, retries) as session:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            statuses = executor.map(lambda url: check_url(session, url, limiter, timeout), unique_urls)
+            return dict(zip(unique_urls, statuses))
@@ -1,6 +1,7 @@
 #!/bin/bash
+# Regenerate every catalog_d*.xml in the content directory in one process
+# (one database connection, see createXML.py --all)
 
+content_dir=${1:-../rda-tds/content/}
 
-for i in `cat thredds_dsids`; do 
-    ./createXML.py $i > catalog_${i}.xml
-done
+./createXML.py --all "$content_dir"
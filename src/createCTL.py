@@ -2,21 +2,108 @@
 """
 Creating the .ctl entries about TDS links for a given dataset
 
+The entries are built in-process as `ControlRecord`s, so the control file
+flows can import this module and generate the entries of many datasets
+over one dssdb connection, e.g.
+
+    conn = connect_dssdb()
+    for record in fetch_control_records(conn, 'd010077'):
+        print(record.to_line())
+
+Many datasets (e.g. backfilling the TDS links of all catalogs) are fetched
+with two queries in total, `fetch_all_control_records(conn, dsids)`.
+
 Needed packages:
     psycopg2 (include in )
     python-dotenv
 
 Usage:
-    createCTL.py [dsid]
+    createCTL.py [dsid] [dsid ...]
+    createCTL.py --log [auto_add_data_tds log]
 
 Example:
     createCTL.py d010077
+    createCTL.py --log prefect-workflow/auto_add_data_tds_2026-08-20-01_07_15.log
 """
 
 import sys
 import os
+from dataclasses import astuple, dataclass
 import psycopg2 as sql
 
+# field separator of the dsrqst control files
+SEPARATOR = '<:>'
+TDS_CATALOG_URL = 'https://tds.gdex.ucar.edu/thredds/catalog/files/'
+
+
+@dataclass
+class ControlRecord:
+    """One entry (line) of a dsrqst control file.
+
+    Control file format:
+    ControlIndex<:>Dataset<:>GroupIndex<:>RequestType<:>ControlMode<:>TarFlag<:>Specialist<:>ProcessCommand<:>EmptyOutput<:>URL<:>HostName<:>
+
+    The defaults are the values of a TDS link entry.
+
+    Attributes
+    ----------
+    control_index : str
+        Control index, '0' for a new entry (not yet defined).
+    dataset : str
+        The dataset ID (e.g., 'd010077').
+    group_index : str
+        Group index, '0' when refering to all products.
+    request_type, control_mode, tar_flag : str
+        'N', 'A' and 'N' for TDS links.
+    specialist : str
+        The specialist associated with the dataset.
+    process_command : str
+        Empty for TDS links.
+    empty_output : str
+        'N' for TDS links.
+    url : str
+        The TDS catalog URL.
+    host_name : str
+        Empty for TDS links.
+    """
+    control_index: str = '0'
+    dataset: str = ''
+    group_index: str = '0'
+    request_type: str = 'N'
+    control_mode: str = 'A'
+    tar_flag: str = 'N'
+    specialist: str = ''
+    process_command: str = ''
+    empty_output: str = 'N'
+    url: str = ''
+    host_name: str = ''
+
+    def to_line(self) -> str:
+        """The control file line of the entry (every field followed by '<:>')."""
+        return ''.join(field + SEPARATOR for field in astuple(self))
+
+    @classmethod
+    def from_line(cls, line: str) -> 'ControlRecord':
+        """Parse a control file line (e.g. from `dsrqst -gc`).
+
+        Raises
+        ------
+        ValueError
+            If the line has fewer than the 11 fields of an entry.
+        """
+        fields = line.strip().split(SEPARATOR)
+        if len(fields) < 11:
+            raise ValueError(f"control file line has {len(fields)} fields, expected 11: {line.strip()!r}")
+        return cls(*fields[:11])
+
+    def is_tds_link(self) -> bool:
+        """True if the entry has the request settings of a TDS link entry."""
+        return (
+            self.request_type == 'N' and self.control_mode == 'A' and self.tar_flag == 'N'
+            and self.process_command == '' and self.empty_output == 'N' and self.host_name == ''
+        )
+
+
 # for reading local .env file
 def load_env():
     """Load environment variables from .env file if dotenv is available."""
@@ -31,14 +118,16 @@ def load_env():
 def usage():
     """Print usage information for the script."""
     sys.stderr.write('Usage:\n')
-    sys.stderr.write('    ' + sys.argv[0] + ' [dsid] \n')
+    sys.stderr.write('    ' + sys.argv[0] + ' [dsid] [dsid ...]\n')
+    sys.stderr.write('    ' + sys.argv[0] + ' --log [auto_add_data_tds log]\n')
     exit(1)
 
-def get_dsid():
-    """get dsid arg, check if valid and fix if possible."""
+def get_dsid(ds_id:str=None):
+    """get dsid arg (or the given ds_id), check if valid and fix if possible."""
 
     # store dsid arg
-    ds_id = sys.argv[1]
+    if ds_id is None:
+        ds_id = sys.argv[1]
 
     # check if dsid is valid in the format of dxxxxxx
     ## check if it starts with d, if not add it
@@ -53,25 +142,19 @@ def get_dsid():
         exit(1)
     return ds_id
 
-def write_seperator():
-    """Write '<:>' to stdout"""
-    sys.stdout.write('<:>')
-
-def create_ctl_entry(
+def control_record(
     ds_id:str,
     specialist:str,
     # access_type:str,
     dirname:str="",
     gindex:int=None
-):
+) -> ControlRecord:
     """
-    Create a .ctl entry for the given dsid,
+    Create the .ctl entry of the TDS link for the given dsid,
     specialist, access_type, dirname, and gindex.
 
-    Control file format:
-    ControlIndex<:>Dataset<:>GroupIndex<:>RequestType<:>ControlMode<:>TarFlag<:>Specialist<:>ProcessCommand<:>EmptyOutput<:>URL<:>HostName<:>
+    Example line (`ControlRecord.to_line`):
     1317<:>ds633.0<:>38<:>N<:>A<:>N<:>davestep<:><:>N<:>https://rda.ucar.edu/thredds/catalog/files/e/ds633.0/e5.oper.fc.sfc.minmax/catalog.html<:><:>
-    ....
 
     Parameters
     ----------
@@ -86,37 +169,156 @@ def create_ctl_entry(
     gindex : int or None, optional
         The group index (default is None, represent group index = 0).
 
+    Returns
+    -------
+    ControlRecord
+        The entry, with index 0 because the index is not yet defined.
     """
 
     if len(dirname) > 0 and dirname[-1] != '/':
         dirname += '/'
     dirname += "catalog.html"
 
+    return ControlRecord(
+        dataset=ds_id,
+        group_index='0' if gindex is None else str(gindex),  # 0 when refering to all products
+        specialist=specialist,
+        url=TDS_CATALOG_URL + ds_id + '/' + dirname
+    )
+
+
+def create_ctl_entry(
+    ds_id:str,
+    specialist:str,
+    dirname:str="",
+    gindex:int=None
+):
+    """Write the .ctl entry of `control_record` to stdout."""
+    sys.stdout.write(control_record(ds_id, specialist, dirname, gindex).to_line() + '\n')
+
+
+def connect_dssdb():
+    """Open a connection to rdadb as the dssdb user.
+
+    Returns
+    -------
+    psycopg2 connection
+        The connection to rdadb.
+    """
+    # Get password from environment variable or prompt the user
+    pw = os.getenv('DB')
+    if pw is None:
+        pw = input("Enter db pw: ")
+
+    return sql.connect(user = 'dssdb', password=pw, host = 'rda-db.ucar.edu', database='rdadb')
+
+
+def fetch_top_groups(conn, dsids) -> dict:
+    """
+    Top level groups (pindex 0) of many datasets with one dsgroup query.
+
+    Parameters
+    ----------
+    conn : psycopg2 connection
+        Connection to rdadb (see `connect_dssdb`).
+    dsids : list[str]
+        The dataset IDs.
+
+    Returns
+    -------
+    dict
+        dsid to its list of (grpid, webpath, gindex) ordered by gindex,
+        datasets without groups are left out.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "select dsid, grpid, webpath, gindex from dsgroup where dsid = ANY(%s) and pindex=0 order by dsid, gindex;",
+            (list(dsids),)
+        )
+        groups = {}
+        for dsid, grpid, webpath, gindex in cursor.fetchall():
+            groups.setdefault(dsid, []).append((grpid, webpath, gindex))
+    return groups
+
+
+def fetch_all_control_records(conn, dsids) -> dict:
+    """
+    Create the TDS link entries of many datasets with two queries:
+    the specialists and the top level groups of all datasets at once.
+
+    Parameters
+    ----------
+    conn : psycopg2 connection
+        Connection to rdadb (see `connect_dssdb`).
+    dsids : list[str]
+        The dataset IDs (e.g., ['d010077', 'd633000']).
+
+    Returns
+    -------
+    dict
+        dsid to its list[ControlRecord] (group 0 first, then each top
+        level group), in the order of dsids. Datasets without a specialist
+        in dsowner are left out.
+    """
+    dsids = list(dict.fromkeys(dsids))
+    with conn.cursor() as cursor:
+        # Get Specialists
+        cursor.execute("select dsid, specialist from dsowner where dsid = ANY(%s);", (dsids,))
+        specialists = {}
+        for dsid, specialist in cursor.fetchall():
+            specialists.setdefault(dsid, specialist)
+    groups = fetch_top_groups(conn, dsids)
+
+    records = {}
+    for dsid in dsids:
+        if dsid not in specialists:
+            continue
+        specialist1 = specialists[dsid]
+
+        # create the top level catalog entry for the whole dataset
+        records[dsid] = [control_record(dsid, specialist1)] # Create group 0
+
+        # create entries for each group that is under the subdirectory of the dataset
+        for grpid1, webpath1, gindex1 in groups.get(dsid, []):
+            # use grpid1 if webpath1 is not specified
+            dirname = webpath1 if webpath1 is not None else grpid1
+            records[dsid].append(control_record(dsid, specialist1, dirname, gindex1))
+    return records
+
+
+def fetch_control_records(conn, dsid:str) -> list:
+    """
+    Create the TDS link entries of a dataset: one for the whole dataset
+    (group 0) and one for each top level group.
+
+    Parameters
+    ----------
+    conn : psycopg2 connection
+        Connection to rdadb (see `connect_dssdb`), can be shared by many calls.
+    dsid : str
+        The dataset ID (e.g., 'd010077').
+
+    Returns
+    -------
+    list[ControlRecord]
+        The entries of the dataset.
+    """
+    records = fetch_all_control_records(conn, [dsid])
+    if dsid not in records:
+        raise ValueError(f"{dsid} has no specialist in dsowner")
+    return records[dsid]
+
+
+def dsids_from_log(log_file:str) -> list:
+    """Dataset IDs of an auto_add_data_tds log ("[datetime] - dxxxxxx added" lines)."""
+    dsids = []
+    with open(log_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            words = line.split()
+            if len(words) >= 2:
+                dsids.append(words[-2])
+    return dsids
 
-    sys.stdout.write('0') # Write index = 0 because index is not yet defined
-    write_seperator()
-    sys.stdout.write(ds_id)
-    write_seperator()
-    if gindex is None:
-        sys.stdout.write('0') # Write 0 when refering to all products
-    else:
-        sys.stdout.write(str(gindex))
-    write_seperator()
-    sys.stdout.write('N')
-    write_seperator()
-    sys.stdout.write('A')
-    write_seperator()
-    sys.stdout.write('N')
-    write_seperator()
-    sys.stdout.write(specialist)
-    write_seperator()
-    write_seperator()
-    sys.stdout.write('N')
-    write_seperator()
-    sys.stdout.write('https://tds.gdex.ucar.edu/thredds/catalog/files/'+ds_id+'/'+dirname)
-    write_seperator()
-    write_seperator()
-    sys.stdout.write('\n')
 
 if __name__ == "__main__":
     # Attempt to load environment variables from .env file
@@ -126,47 +328,24 @@ if __name__ == "__main__":
     if len(sys.argv) <= 1:
         usage()
 
-    # get dataset ID and dssdb password for access rdadb
-    dsid = get_dsid()
-
-    # Get password from environment variable or prompt the user
-    pw = os.getenv('DB')
-    if pw is None:
-        pw = input("Enter db pw: ")
+    # get dataset IDs and dssdb password for access rdadb
+    if sys.argv[1] == '--log':
+        if len(sys.argv) != 3:
+            usage()
+        dsids = [get_dsid(ds_id) for ds_id in dsids_from_log(sys.argv[2])]
+    else:
+        dsids = [get_dsid(ds_id) for ds_id in sys.argv[1:]]
+    dsids = list(dict.fromkeys(dsids))
 
     ## New Connection to dssdb
-    conn = sql.connect(user = 'dssdb', password=pw, host = 'rda-db.ucar.edu', database='rdadb')
-    cursor = conn.cursor()
-
-    # Get Specialist
-    query = f"select specialist from dsowner where dsid='{dsid}';"
-    cursor.execute(query)
-    specialist1, = cursor.fetchall()[0]
-
-    # # Get Access rights (currently not used in the function, commented out in parameters)
-    # query = f"select access_type from dataset where dsid='{dsid}';"
-    # cursor.execute(query)
-    # rights, = cursor.fetchall()[0]
-    # if rights is not None:
-    #     access_type1 = rights
-    # else:
-    #     access_type1 = 'g'
-
-    query = f"select grpid,webpath,gindex from dsgroup where dsid='{dsid}' and pindex=0;"
-    cursor.execute(query)
-    #grpid,gindex = cursor.fetchall()
-    all_ents = cursor.fetchall()
-
-    # create the top level catalog entry for the whole dataset
-    # create_ctl_entry(dsid, specialist1, access_type1) # Create group 0
-    create_ctl_entry(dsid, specialist1) # Create group 0
-
-    # create entries for each group that is under the subdirectory of the dataset
-    for grpid1, webpath1, gindex1 in all_ents:
-        try:
-            # create_ctl_entry(dsid, specialist1, access_type1, grpid, gindex1)  # Create group 0
-            create_ctl_entry(dsid, specialist1, webpath1, gindex1)
-        except TypeError as e:
-            # use grpid1 if webpath1 causes a TypeError 
-            # (usually not specified causing NoneType error)
-            create_ctl_entry(dsid, specialist1, grpid1, gindex1)
+    conn = connect_dssdb()
+    records = fetch_all_control_records(conn, dsids)
+    conn.close()
+
+    # entries grouped by dsid
+    for dsid in dsids:
+        if dsid not in records:
+            sys.stderr.write(f'Skipping {dsid}: no specialist in dsowner\n')
+            continue
+        for record in records[dsid]:
+            sys.stdout.write(record.to_line() + '\n')
@@ -2,13 +2,67 @@
 """
 Creates Thredds xml file for a given dataset.
 
+The catalog is built in-process from a `DatasetMetadata` record
+(see dataset_metadata.py) so that many catalogs can be generated in one
+interpreter with one database connection, e.g.
+
+    conn = connect_metadata_db()
+    for record in fetch_metadata(conn).values():
+        write_catalog(record, 'rda-tds/content/')
+
+Usage:
+    createXML.py [dsid]             # catalog to standard output
+    createXML.py [dsid] [out dir]   # write [out dir]/catalog_[dsid].xml
+    createXML.py --all [out dir]    # regenerate every catalog_d*.xml in [out dir]
+    createXML.py --sync [out dir]   # only regenerate the catalogs whose metadata changed
+    ... --static-min-files N        # serve datasets with N files or more through
+                                    # static catalogs instead of a datasetScan
+    ... --grib-collections MODE     # GRIB featureCollections per dataset (MODE dataset)
+                                    # or per top level dsgroup webpath (MODE group)
+    ... --ncml                      # NcML time aggregations of NetCDF time series
+
+The fingerprint of the metadata each catalog was built from is kept in
+[out dir]/catalog_fingerprints.json; --sync (and the auto-add flow with
+sync=True) compares it to the current database rows and only rewrites the
+stale catalogs, so TDS only re-reads the files that actually changed.
+
+With --static-min-files the data directory of each dataset is crawled
+(incrementally, see static_catalog.py) and datasets with at least N files
+get precomputed static catalogs in [out dir]/static/<dsid>/ instead of a
+datasetScan that lists GLADE live on every browse. Datasets that already
+have static catalogs keep them when regenerated without the option.
+
+With --grib-collections the GRIB datasets also get featureCollections
+whose specs are derived from the file names on disk (grib_collections.py),
+indexed ahead of time by the TDM into the tdsPersist PVC. The collections
+are recorded in [out dir]/grib_collections.json and kept when the
+catalogs are regenerated without the option.
+
+With --ncml the NetCDF datasets get joinExisting NcML aggregations of
+their time series, with the time values of every file written in the
+catalog (ncml_aggregation.py). The values are cached in [out dir]/ncml/
+and the aggregations kept when regenerated without the option.
+
 TODO: need to add contact info if possible.  
 """
 import os
 import sys
+import glob
+import json
+import hashlib
+from dataclasses import asdict
 import xml.etree.ElementTree as ET
-import psycopg2 as sql
-from createCTL import get_dsid, load_env
+from createCTL import connect_dssdb, fetch_top_groups, get_dsid, load_env
+from dataset_metadata import connect_metadata_db, fetch_metadata
+from atomic_write import write_atomic
+from pretty_xml import catalog_to_xml
+from static_catalog import (
+    EXCLUDE_PATTERNS, STATIC_DIR, TDS_DATA_ROOT, has_static_catalogs, update_static_catalogs
+)
+from grib_collections import (
+    TDM_RESCAN, TDM_REWRITE, find_collections, load_collections, save_collections
+)
+from ncml_aggregation import load_aggregations, ncml_element, scan_aggregations
 
 # in case of python2 or python3
 try:
@@ -17,36 +71,29 @@ except ImportError:
     from html.parser import HTMLParser
 
 
+# file keeping the metadata fingerprint of every generated catalog
+FINGERPRINT_FILE = 'catalog_fingerprints.json'
+# bump when build_catalog output changes so --sync regenerates everything
+CATALOG_TEMPLATE_VERSION = 1
+# formats (see get_format) served through GRIB featureCollections
+GRIB_FORMATS = ('GRIB-1', 'GRIB-2')
+GRIB_COLLECTION_MODES = ('dataset', 'group')
+
+
+class MixedDataTypeError(ValueError):
+    """Raised when a dataset has more than one data type."""
+
+
 
 def usage():
     """Print usage information for the script."""
     sys.stderr.write('Usage:\n')
     sys.stderr.write('    ' + sys.argv[0] + ' [dsid] [out dir]\n')
+    sys.stderr.write('    ' + sys.argv[0] + ' --all [out dir]\n')
+    sys.stderr.write('    ' + sys.argv[0] + ' --sync [out dir]\n')
+    sys.stderr.write('    (any of them with --static-min-files N, --grib-collections dataset|group and/or --ncml)\n')
     exit(1)
 
-def prettify(element, indent='  '):
-    """Prettify the XML element in place.
-
-    Parameters
-    ----------
-    element : root element
-        The root element of the XML tree to prettify.
-    indent : str, optional
-        The indentation string to use, by default '  '
-    """
-    queue = [(0, element)]  # (level, element)
-    while queue:
-        level, element = queue.pop(0)
-        children = [(level + 1, child) for child in list(element)]
-        if children:
-            element.text = '\n' + indent * (level+1)  # for child open
-        if queue:
-            element.tail = '\n' + indent * queue[0][0]  # for sibling open
-        else:
-            element.tail = '\n' + indent * (level-1)  # for parent close
-        queue[0:0] = children  # prepend so children come before siblings
-
-
 def strip_html(text):
     """get summary text without html tags.
 
@@ -96,83 +143,56 @@ def get_format(dformat):
 #         root = ET.fromstring(xml_str)
 #     return root
 
-def check_same(arr):
-    """Checks if all values are the same in an array."""
-    test_ele = arr.pop()
-    for i in arr:
-        if test_ele.__hash__() != i.__hash__():
-            sys.stderr.write('Values not all the same')
-            sys.stderr.write(str(i)+' != '+str(test_ele))
-            exit(1)
-    return True
+def get_datatype(data_types):
+    """Returns the thredds data type from the data type keywords.
 
-if __name__ == '__main__':
-    # Load environment variables from .env file
-    load_env()
+    The first keyword is used when several rows are given. A dataset with
+    a single (or no) data type row falls back to GRID, matching the catalogs
+    generated so far.
 
-    # check input arguments
-    if len(sys.argv) > 3 or len(sys.argv) == 1:
-        usage()
+    Raises
+    ------
+    MixedDataTypeError
+        If the data type keywords are not all the same.
+    """
+    if len(set(data_types)) > 1:
+        raise MixedDataTypeError('Values not all the same: '+', '.join(data_types))
+    if len(data_types) > 1:
+        return data_types[0].upper()
+    return 'GRID'
 
-    # get dataset id
-    dsid = get_dsid()
+def build_catalog(record, static=False, collections=None, aggregations=None):
+    """Build the catalog XML tree of a dataset.
 
-    # set output filename to None
-    output_filename = None
-    # if directory is given, set output filename
-    if len(sys.argv) == 3:
-        directory = sys.argv[2]
-        output_filename = directory+'catalog_'+dsid+'.xml'
-
-    # Get password from environment variable or prompt the user
-    pw = os.getenv('META')
-    if pw is None:
-        pw = input("Enter metadata pw: ")
-
-    # New Connection to search db
-    conn = sql.connect(user = 'metadata', password=pw, host = 'rda-db.ucar.edu', database='rdadb')
-    cursor = conn.cursor()
-
-    # Get title
-    query = "select title from search.datasets where dsid='" + dsid +"'"
-    cursor.execute(query)
-    title, = cursor.fetchall()[0]
-
-    # Get summary
-    query = "select summary from search.datasets where dsid='"+dsid+"'"
-    cursor.execute(query)
-    summary, = cursor.fetchall()[0]
-    summary = strip_html(summary)
-
-    # Get format
-    query = "select keyword from search.formats where dsid='"+dsid+"'"
-    cursor.execute(query)
-    formt, = cursor.fetchall()[0]
-    formt = get_format(formt)
-
-    # Get Datatype
-    query = "select keyword from search.data_types where dsid='"+dsid+"'"
-    cursor.execute(query)
-    datatypes = cursor.fetchall()
-    try:
-        check_same(datatypes)
-    except SystemExit:
-        sys.exit(250)
-    try:
-        datatype, = datatypes[0]
-    except Exception as e:
-        datatype = 'GRID'
-    datatype = datatype.upper()
+    Parameters
+    ----------
+    record : DatasetMetadata
+        The catalog metadata of the dataset.
+    static : bool
+        Refer to the static catalogs of the dataset (static_catalog.py)
+        instead of a datasetScan, default False.
+    collections : list[GribCollection], optional
+        GRIB featureCollections added next to the files (grib_collections.py),
+        default None for none.
+    aggregations : list[NcmlAggregation], optional
+        NcML time aggregations added next to the files (ncml_aggregation.py),
+        default None for none.
 
-    # Get creator
-    query = "select g.path from search.contributors_new as c left join search.GCMD_providers as g on g.uuid = c.keyword where c.dsid='"+dsid+"' and c.vocabulary = 'GCMD'"
-    cursor.execute(query)
-    creators = cursor.fetchall()
+    Returns
+    -------
+    xml.etree.ElementTree.Element
+        The root catalog element (not prettified).
 
-    # Get keywords
-    query = "select g.path from search.projects_new as c left join search.GCMD_projects as g on g.uuid = c.keyword where c.dsid='"+dsid+"' and c.vocabulary = 'GCMD'"
-    cursor.execute(query)
-    keywords = cursor.fetchall()
+    Raises
+    ------
+    MixedDataTypeError
+        If the dataset has different data types.
+    """
+    dsid = record.dsid
+    title = record.title
+    summary = strip_html(record.summary)
+    formt = get_format(record.formats[0])
+    datatype = get_datatype(record.data_types)
 
     # set rights
     rights = 'Freely Available'
@@ -223,13 +243,13 @@ if __name__ == '__main__':
         ele.attrib['title'] = related_ref.text
 
     vocabulary = 'DIF' # All are currently GCMD
-    for creator in creators:
+    for creator in record.contributors:
         creator_ele = ET.SubElement(metadata, 'creator')
 
         creator_name = ET.SubElement(creator_ele, 'name')
         creator_name.attrib['vocabulary'] = vocabulary
         try:
-            creator_name.text = creator[0].split(' ')[0]
+            creator_name.text = creator.split(' ')[0]
         except Exception as e:
             pass
 
@@ -248,51 +268,434 @@ if __name__ == '__main__':
     publisher_contact.attrib['url'] = 'http://gdex.ucar.edu/'
     publisher_contact.attrib['email'] = 'datahelp@ucar.edu'
 
-    # Get keywords
-    for keyword in keywords:
-        keyword_parts = keyword[0].split('>')
+    # Get keywords (projects without a GCMD path are skipped)
+    for keyword in record.projects:
+        if keyword is None:
+            continue
+        keyword_parts = keyword.split('>')
         for part in keyword_parts:
             keyword_ele = ET.SubElement(metadata, 'keyword')
             keyword_ele.text = part.strip()
 
     dataset.append(ET.Comment('Files'))
-    datasetScan = ET.SubElement(dataset, 'datasetScan')
-    datasetScan.attrib['name'] = dsid + ' Files'
-    datasetScan.attrib['path'] = 'files/'+dsid
-    datasetScan.attrib['location'] = '/data/rda/data/'+dsid+'/'
-    scan_metadata = ET.SubElement(datasetScan, 'metadata')
-    scan_metadata.attrib['inherited'] = 'true'
-    service_name = ET.SubElement(scan_metadata, 'serviceName')
+    if static:
+        # the static catalogs list the files, the datasetRoot maps their urlPath to the data
+        dataset_root = ET.Element('datasetRoot')
+        dataset_root.attrib['path'] = 'files/'+dsid
+        dataset_root.attrib['location'] = TDS_DATA_ROOT+'/'+dsid+'/'
+        root.insert(1, dataset_root)
+
+        files_ref = ET.SubElement(dataset, 'catalogRef')
+        files_ref.attrib['xlink:href'] = STATIC_DIR+'/'+dsid+'/catalog.xml'
+        files_ref.attrib['xlink:title'] = dsid + ' Files'
+        files_ref.attrib['name'] = ''
+    else:
+        datasetScan = ET.SubElement(dataset, 'datasetScan')
+        datasetScan.attrib['name'] = dsid + ' Files'
+        datasetScan.attrib['path'] = 'files/'+dsid
+        datasetScan.attrib['location'] = TDS_DATA_ROOT+'/'+dsid+'/'
+        scan_metadata = ET.SubElement(datasetScan, 'metadata')
+        scan_metadata.attrib['inherited'] = 'true'
+        service_name = ET.SubElement(scan_metadata, 'serviceName')
+        service_name.text = 'all'
+        scan_filter = ET.SubElement(datasetScan, 'filter')
+
+        # Create exclude elements for each pattern to exclude
+        for pattern in EXCLUDE_PATTERNS:
+            exclude = ET.SubElement(scan_filter, 'exclude')
+            exclude.attrib['wildcard'] = pattern
+
+        ET.SubElement(datasetScan, 'addDatasetSize')
+
+    # Create Feature Collections (GRIB, indexed ahead of time by the TDM) and NcML aggregations
+    collections = collections or []
+    aggregations = aggregations or []
+    if collections or aggregations:
+        dataset.append(ET.Comment('Aggregations'))
+        aggregation_dataset = ET.SubElement(dataset, 'dataset')
+        aggregation_dataset.attrib['name'] = dsid + ' Dataset Aggregations'
+        for i, collection in enumerate(collections, start=1):
+            build_feature_collection(aggregation_dataset, collection, 'aggregations/g/'+dsid+'/'+str(i))
+        for i, aggregation in enumerate(aggregations, start=len(collections)+1):
+            build_ncml_dataset(aggregation_dataset, aggregation, 'aggregations/g/'+dsid+'/'+str(i))
+
+    return root
+
+def build_feature_collection(parent, collection, path):
+    """Append the GRIB featureCollection of a collection to parent.
+
+    TDS only reads the collection indexes: they are built by the TDM
+    (`tdm` element), which then triggers TDS to reload them (`update`
+    element). The ncx4/gbx9 files go to the GribIndex directory of
+    threddsConfig.xml on the tdsPersist PVC (/data/TDSIndexFiles,
+    nestedDirectory policy).
+
+    Parameters
+    ----------
+    parent : xml.etree.ElementTree.Element
+        The dataset element holding the aggregations.
+    collection : GribCollection
+        The collection (see grib_collections.py).
+    path : str
+        The URL path of the featureCollection (e.g. aggregations/g/d084001/1).
+
+    Returns
+    -------
+    xml.etree.ElementTree.Element
+        The featureCollection element.
+    """
+    fc = ET.SubElement(parent, 'featureCollection')
+    fc.attrib['name'] = collection.name + ' Aggregation'
+    fc.attrib['featureType'] = collection.feature_type
+    fc.attrib['harvest'] = 'true'
+    fc.attrib['path'] = path
+
+    fc_metadata = ET.SubElement(fc, 'metadata')
+    fc_metadata.attrib['inherited'] = 'true'
+    data_format = ET.SubElement(fc_metadata, 'dataFormat')
+    data_format.text = collection.data_format
+    service_name = ET.SubElement(fc_metadata, 'serviceName')
     service_name.text = 'all'
-    scan_filter = ET.SubElement(datasetScan, 'filter')
-
-    # List of patterns to exclude
-    exclude_patterns = ['*.html', '*.x', '.*', '.*/']
-
-    # Create exclude elements for each pattern
-    for pattern in exclude_patterns:
-        exclude = ET.SubElement(scan_filter, 'exclude')
-        exclude.attrib['wildcard'] = pattern
-
-    ET.SubElement(datasetScan, 'addDatasetSize')
-
-    # Create Feature Collections
-    #FC = ET.SubElement(dataset,'featureCollection')#ds2
-    #FC.attrib['name'] = 'None'
-    #FC.attrib['featureType'] = 'None'
-    #FC.attrib['harvest'] = 'true'
-    #FC.attrib['path'] = 'None'
-
-    # prettify inplace and write to file or standard output
-    prettify(root)
-    xml_str = ET.tostring(root)
-    if isinstance(xml_str,bytes):
-        xml_str = xml_str.decode("utf-8")
-    xml_str = '<?xml version="1.0" encoding="UTF-8"?>\n'+xml_str
-
-    # standard output if no output filename created by directory argument
-    if output_filename is None:
-        print(xml_str)
+
+    fc_collection = ET.SubElement(fc, 'collection')
+    fc_collection.attrib['name'] = collection.collection_name
+    fc_collection.attrib['spec'] = collection.spec
+    if collection.date_format_mark:
+        fc_collection.attrib['dateFormatMark'] = collection.date_format_mark
+    if collection.time_partition:
+        fc_collection.attrib['timePartition'] = collection.time_partition
+
+    update = ET.SubElement(fc, 'update')
+    update.attrib['startup'] = 'never'
+    update.attrib['trigger'] = 'allow'
+    tdm = ET.SubElement(fc, 'tdm')
+    tdm.attrib['rewrite'] = TDM_REWRITE
+    tdm.attrib['rescan'] = TDM_RESCAN
+
+    grib_config = ET.SubElement(fc, 'gribConfig')
+    option = ET.SubElement(grib_config, 'option')
+    option.attrib['name'] = 'runtimeCoordinate'
+    option.attrib['value'] = 'union'
+    return fc
+
+def build_ncml_dataset(parent, aggregation, path):
+    """Append the dataset of an NcML time aggregation to parent.
+
+    Parameters
+    ----------
+    parent : xml.etree.ElementTree.Element
+        The dataset element holding the aggregations.
+    aggregation : NcmlAggregation
+        The aggregation (see ncml_aggregation.py).
+    path : str
+        The URL path of the aggregation (e.g. aggregations/g/d316000/1).
+
+    Returns
+    -------
+    xml.etree.ElementTree.Element
+        The dataset element.
+    """
+    ncml_dataset = ET.SubElement(parent, 'dataset')
+    ncml_dataset.attrib['name'] = aggregation.name
+    ncml_dataset.attrib['urlPath'] = path
+    ncml_dataset.attrib['ID'] = path
+    ncml_dataset.attrib['harvest'] = 'true'
+    ncml_metadata = ET.SubElement(ncml_dataset, 'metadata')
+    ncml_metadata.attrib['inherited'] = 'true'
+    service_name = ET.SubElement(ncml_metadata, 'serviceName')
+    service_name.text = 'all'
+    ncml_dataset.append(ncml_element(aggregation))
+    return ncml_dataset
+
+def write_catalog(record, directory, static=None, collections=None, aggregations=None):
+    """Build the catalog of a dataset and write it to `catalog_<dsid>.xml`.
+
+    The file is written atomically and left untouched (mtime kept)
+    if its content is unchanged (see atomic_write.py).
+
+    Parameters
+    ----------
+    record : DatasetMetadata
+        The catalog metadata of the dataset.
+    directory : str
+        Output directory.
+    static : bool, optional
+        Refer to static catalogs instead of a datasetScan, default
+        whether the dataset has static catalogs in the directory.
+    collections : list[GribCollection], optional
+        GRIB featureCollections of the dataset, default the ones recorded
+        in the directory (grib_collections.json).
+    aggregations : list[NcmlAggregation], optional
+        NcML time aggregations of the dataset, default the ones cached in
+        the directory (ncml/<dsid>.json.gz).
+
+    Returns
+    -------
+    bool
+        True if the catalog file changed, False if it was already up to date.
+    """
+    if static is None:
+        static = has_static_catalogs(directory, record.dsid)
+    if collections is None:
+        collections = load_collections(directory).get(record.dsid, [])
+    if aggregations is None:
+        aggregations = load_aggregations(record.dsid, directory)
+    xml_str = catalog_to_xml(build_catalog(record, static, collections, aggregations))
+    output_filename = os.path.join(directory, 'catalog_'+record.dsid+'.xml')
+    return write_atomic(output_filename, xml_str)
+
+def catalog_fingerprint(record, static=False, collections=(), aggregations=()):
+    """Fingerprint of the metadata rows and catalog template of a dataset."""
+    key = f'{CATALOG_TEMPLATE_VERSION}:{record.fingerprint()}' + (':static' if static else '')
+    for collection in collections:
+        key += f':{collection.spec}:{collection.date_format_mark}:{collection.time_partition}'
+    for aggregation in aggregations:
+        key += ':' + json.dumps(asdict(aggregation), sort_keys=True)
+
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+def load_fingerprints(directory):
+    """Dataset ID to catalog fingerprint stored in the output directory."""
+    try:
+        with open(os.path.join(directory, FINGERPRINT_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_fingerprints(directory, fingerprints):
+    """Write the catalog fingerprints (atomic, skipped if unchanged)."""
+    data = json.dumps(fingerprints, indent=1, sort_keys=True) + '\n'
+    write_atomic(os.path.join(directory, FINGERPRINT_FILE), data)
+
+def is_grib(record):
+    """True if the first format of the dataset is GRIB-1 or GRIB-2 (see `get_format`)."""
+    return bool(record.formats) and get_format(record.formats[0]) in GRIB_FORMATS
+
+def fetch_group_webpaths(dsids):
+    """Webpaths (grpid if not set) of the top level dsgroups of many datasets, keyed by dsid."""
+    conn = connect_dssdb()
+    groups = fetch_top_groups(conn, dsids)
+    conn.close()
+    return {
+        dsid: [webpath if webpath is not None else grpid for grpid, webpath, _ in dataset_groups]
+        for dsid, dataset_groups in groups.items()
+    }
+
+def dataset_collections(record, grib_collections, group_webpaths=None):
+    """Derive the GRIB collections of a GRIB dataset from its files.
+
+    Parameters
+    ----------
+    record : DatasetMetadata
+        The catalog metadata of the dataset.
+    grib_collections : str
+        'dataset' for collections of the whole data directory, 'group' for
+        collections per top level dsgroup webpath (the whole data directory
+        if the dataset has no groups).
+    group_webpaths : dict, optional
+        dsid to its top level group webpaths (see `fetch_group_webpaths`).
+
+    Returns
+    -------
+    list[GribCollection]
+        The collections, [] for non-GRIB datasets.
+    """
+    if not is_grib(record):
+        return []
+    webpaths = None
+    if grib_collections == 'group':
+        webpaths = (group_webpaths or {}).get(record.dsid)
+    return find_collections(record.dsid, webpaths)
+
+def create_catalogs(
+    records,
+    directory,
+    sync=False,
+    static_min_files=None,
+    grib_collections=None,
+    group_webpaths=None,
+    ncml=False
+):
+    """Write the catalogs of many datasets in one process.
+
+    The fingerprint of every written catalog is recorded in
+    FINGERPRINT_FILE of the output directory.
+
+    Parameters
+    ----------
+    records : iterable of DatasetMetadata
+        The catalog metadata of the datasets.
+    directory : str
+        Output directory.
+    sync : bool
+        Only rebuild the catalogs whose recorded fingerprint differs from
+        the current metadata (or which have none). Default False
+        rebuilds all.
+    static_min_files : int, optional
+        Crawl the data directory of each dataset and serve the datasets with
+        at least this many files through static catalogs (static_catalog.py).
+        Default None keeps the current mode of each dataset.
+    grib_collections : str, optional
+        'dataset' or 'group': derive the GRIB featureCollections of the
+        GRIB datasets from their files again (see `dataset_collections`).
+        Default None keeps the collections recorded in the directory.
+    group_webpaths : dict, optional
+        dsid to its top level group webpaths, for grib_collections 'group'.
+    ncml : bool
+        Scan the NetCDF datasets for NcML time aggregations (ncml_aggregation.py).
+        Default False keeps the cached aggregations.
+
+    Returns
+    -------
+    tuple
+        (list of dataset IDs whose catalog changed,
+        dict of dataset ID to the error message of the datasets that were skipped)
+    """
+    fingerprints = load_fingerprints(directory)
+    recorded_collections = load_collections(directory)
+    changed = []
+    skipped = {}
+    for record in records:
+        if static_min_files is not None:
+            static = update_static_catalogs(record.dsid, directory, static_min_files)
+        else:
+            static = has_static_catalogs(directory, record.dsid)
+        if grib_collections is not None:
+            recorded_collections[record.dsid] = dataset_collections(record, grib_collections, group_webpaths)
+        collections = recorded_collections.get(record.dsid, [])
+        if ncml and not is_grib(record):
+            aggregations = scan_aggregations(record.dsid, directory)
+        else:
+            aggregations = load_aggregations(record.dsid, directory)
+        fingerprint = catalog_fingerprint(record, static, collections, aggregations)
+        output_filename = os.path.join(directory, 'catalog_'+record.dsid+'.xml')
+        if sync and fingerprints.get(record.dsid) == fingerprint and os.path.exists(output_filename):
+            continue
+        try:
+            if write_catalog(record, directory, static, collections, aggregations):
+                changed.append(record.dsid)
+            fingerprints[record.dsid] = fingerprint
+        except MixedDataTypeError as e:
+            skipped[record.dsid] = str(e)
+        except IndexError:
+            skipped[record.dsid] = 'no format keyword in search.formats'
+    save_fingerprints(directory, fingerprints)
+    if grib_collections is not None:
+        save_collections(directory, recorded_collections)
+    return changed, skipped
+
+def existing_catalog_dsids(directory):
+    """Dataset IDs of the catalog_d*.xml files in a directory."""
+    dsids = []
+    for filename in sorted(glob.glob(os.path.join(directory, 'catalog_d*.xml'))):
+        dsids.append(os.path.basename(filename)[len('catalog_'):-len('.xml')])
+    return dsids
+
+if __name__ == '__main__':
+    # Load environment variables from .env file
+    load_env()
+
+    # file count from which datasets get static catalogs (optional)
+    static_min_files = None
+    if '--static-min-files' in sys.argv:
+        i = sys.argv.index('--static-min-files')
+        try:
+            static_min_files = int(sys.argv[i+1])
+        except (IndexError, ValueError):
+            usage()
+        del sys.argv[i:i+2]
+
+    # GRIB featureCollections per dataset or per top level group (optional)
+    grib_collections = None
+    if '--grib-collections' in sys.argv:
+        i = sys.argv.index('--grib-collections')
+        if i+1 >= len(sys.argv) or sys.argv[i+1] not in GRIB_COLLECTION_MODES:
+            usage()
+        grib_collections = sys.argv[i+1]
+        del sys.argv[i:i+2]
+
+    # NcML time aggregations of the NetCDF datasets (optional)
+    ncml = '--ncml' in sys.argv
+    if ncml:
+        sys.argv.remove('--ncml')
+
+    # check input arguments
+    if len(sys.argv) > 3 or len(sys.argv) == 1:
+        usage()
+    if (static_min_files is not None or grib_collections is not None or ncml) and len(sys.argv) != 3:
+        usage()
+
+    # regenerate all (or only the stale) existing catalogs in the output directory
+    if sys.argv[1] in ('--all', '--sync'):
+        if len(sys.argv) != 3:
+            usage()
+        directory = sys.argv[2]
+        dsids = existing_catalog_dsids(directory)
+
+        conn = connect_metadata_db()
+        snapshot = fetch_metadata(conn, dsids)
+        conn.close()
+
+        group_webpaths = None
+        if grib_collections == 'group':
+            group_webpaths = fetch_group_webpaths([dsid for dsid, record in snapshot.items() if is_grib(record)])
+
+        changed, skipped = create_catalogs(
+            snapshot.values(), directory, sync=sys.argv[1] == '--sync', static_min_files=static_min_files,
+            grib_collections=grib_collections, group_webpaths=group_webpaths, ncml=ncml
+        )
+        unchanged = len(snapshot) - len(skipped) - len(changed)
+        for dsid in dsids:
+            if dsid not in snapshot:
+                skipped[dsid] = 'not in search.datasets'
+        for dsid, err in sorted(skipped.items()):
+            sys.stderr.write(f'Skipping {dsid}: {err}\n')
+        print(f'Wrote {len(changed)} catalog(s) to {directory}, {unchanged} unchanged')
+        sys.exit(0)
+
+    # get dataset id
+    dsid = get_dsid()
+
+    # Fetch all catalog metadata of the dataset in one round trip per table
+    conn = connect_metadata_db()
+    snapshot = fetch_metadata(conn, [dsid])
+    conn.close()
+    record = snapshot[dsid]
+
+    # static catalogs instead of the datasetScan (crawls the data directory)
+    static = False
+    collections = []
+    aggregations = []
+    if len(sys.argv) == 3:
+        if static_min_files is not None:
+            static = update_static_catalogs(dsid, sys.argv[2], static_min_files)
+        else:
+            static = has_static_catalogs(sys.argv[2], dsid)
+
+        # GRIB featureCollections derived from the files (or the recorded ones)
+        recorded_collections = load_collections(sys.argv[2])
+        if grib_collections is not None:
+            group_webpaths = fetch_group_webpaths([dsid]) if grib_collections == 'group' else None
+            recorded_collections[dsid] = dataset_collections(record, grib_collections, group_webpaths)
+            save_collections(sys.argv[2], recorded_collections)
+        collections = recorded_collections.get(dsid, [])
+
+        # NcML time aggregations from the file headers (or the cached ones)
+        if ncml and not is_grib(record):
+            aggregations = scan_aggregations(dsid, sys.argv[2])
+        else:
+            aggregations = load_aggregations(dsid, sys.argv[2])
+
+    try:
+        catalog = build_catalog(record, static, collections, aggregations)
+    except MixedDataTypeError as e:
+        sys.stderr.write(str(e))
+        sys.exit(250)
+
+    # write to file if directory is given, otherwise standard output
+    xml_str = catalog_to_xml(catalog)
+    if len(sys.argv) == 3:
+        output_filename = os.path.join(sys.argv[2], 'catalog_'+dsid+'.xml')
+        write_atomic(output_filename, xml_str)
     else:
-        with open(output_filename, 'w', encoding='utf-8') as fxml:
-            fxml.write(xml_str)
+        print(xml_str)
@@ -0,0 +1,153 @@
+"""
+Bulk metadata snapshot of the GDEX search database.
+
+Pulls the catalog metadata (title, summary, formats, data types,
+contributors and projects) for all datasets, or a given list of datasets,
+with one set-based query per table and holds the rows in memory keyed by
+dsid. Callers share a single connection instead of opening one and issuing
+several single-row queries per dataset.
+
+Needed packages:
+    psycopg2
+
+Usage:
+    conn = connect_metadata_db()
+    snapshot = fetch_metadata(conn)               # every dataset
+    snapshot = fetch_metadata(conn, ['d010077'])  # selected datasets
+    conn.close()
+"""
+import os
+import json
+import hashlib
+from dataclasses import asdict, dataclass, field
+import psycopg2 as sql
+
+
+@dataclass
+class DatasetMetadata:
+    """Catalog related metadata of a single dataset.
+
+    Attributes
+    ----------
+    dsid : str
+        The dataset ID (e.g., 'd010077').
+    title : str
+        Dataset title from search.datasets.
+    summary : str
+        Dataset summary (may include html) from search.datasets.
+    formats : list[str]
+        Format keywords from search.formats.
+    data_types : list[str]
+        Data type keywords from search.data_types.
+    contributors : list[str]
+        GCMD provider paths of the dataset contributors
+        (None when the keyword has no GCMD match).
+    projects : list[str]
+        GCMD project paths of the dataset projects
+        (None when the keyword has no GCMD match).
+    """
+    dsid: str
+    title: str
+    summary: str
+    formats: list = field(default_factory=list)
+    data_types: list = field(default_factory=list)
+    contributors: list = field(default_factory=list)
+    projects: list = field(default_factory=list)
+
+    def fingerprint(self) -> str:
+        """SHA-256 of the metadata rows, changes whenever any row changes."""
+        rows = json.dumps(asdict(self), sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(rows.encode('utf-8')).hexdigest()
+
+
+def connect_metadata_db():
+    """Open a connection to the search db as the metadata user.
+
+    Returns
+    -------
+    psycopg2 connection
+        The connection to rdadb.
+    """
+    # Get password from environment variable or prompt the user
+    pw = os.getenv('META')
+    if pw is None:
+        pw = input("Enter metadata pw: ")
+
+    return sql.connect(user='metadata', password=pw, host='rda-db.ucar.edu', database='rdadb')
+
+
+def _fetch_rows(cursor, query, conditions, dsid_column, dsids, order_by=None):
+    """Run a select with the given where conditions, optionally restricted to dsids and ordered."""
+    conditions = list(conditions)
+    params = []
+    if dsids is not None:
+        conditions.append(f"{dsid_column} = ANY(%s)")
+        params.append(list(dsids))
+    if conditions:
+        query += " where " + " and ".join(conditions)
+    if order_by:
+        query += " order by " + order_by
+    cursor.execute(query, params)
+    return cursor.fetchall()
+
+
+def fetch_metadata(conn, dsids=None) -> dict:
+    """Fetch the catalog metadata of many datasets in one round trip per table.
+
+    Parameters
+    ----------
+    conn : psycopg2 connection
+        Connection to rdadb (see `connect_metadata_db`).
+    dsids : list[str], optional
+        Dataset IDs to fetch. Default is None which fetches every dataset
+        in search.datasets.
+
+    Returns
+    -------
+    dict
+        Dataset ID to `DatasetMetadata`, ordered by dsid.
+    """
+    cursor = conn.cursor()
+
+    # title and summary, which also defines the set of known datasets
+    rows = _fetch_rows(
+        cursor,
+        "select dsid, title, summary from search.datasets",
+        [], 'dsid', dsids
+    )
+    snapshot = {
+        dsid: DatasetMetadata(dsid=dsid, title=title, summary=summary or '')
+        for dsid, title, summary in sorted(rows, key=lambda row: row[0])
+    }
+
+    # list valued attributes, one query per table, ordered so the lists (their
+    # fingerprint and formats[0]) do not depend on the plan of the query
+    list_queries = {
+        'formats': (
+            "select dsid, keyword from search.formats",
+            [], 'dsid', 'dsid, keyword'
+        ),
+        'data_types': (
+            "select dsid, keyword from search.data_types",
+            [], 'dsid', 'dsid, keyword'
+        ),
+        'contributors': (
+            "select c.dsid, g.path from search.contributors_new as c "
+            "left join search.GCMD_providers as g on g.uuid = c.keyword",
+            ["c.vocabulary = 'GCMD'"], 'c.dsid', 'c.dsid, c.keyword, g.path'
+        ),
+        'projects': (
+            "select c.dsid, g.path from search.projects_new as c "
+            "left join search.GCMD_projects as g on g.uuid = c.keyword",
+            ["c.vocabulary = 'GCMD'"], 'c.dsid', 'c.dsid, c.keyword, g.path'
+        ),
+    }
+    for attribute, (query, conditions, dsid_column, order_by) in list_queries.items():
+        for dsid, value in _fetch_rows(cursor, query, conditions, dsid_column, dsids, order_by):
+            record = snapshot.get(dsid)
+            if record is not None:
+                getattr(record, attribute).append(value)
+
+    cursor.close()
+
+    return snapshot
@@ -3,13 +3,26 @@ This script is designed to generate the interactive statistics plot of
 the TDS usage. 
 
 Steps:
-1. Load the TDS usage data from the txt file from the Boreas backuop
+1. Load the TDS usage data from the Boreas backup
     - the python script generating the statistics and backed up 
       are located inside the rda-tds-helm/scripts/log_stats.py file.
-2. Plot the data using plotly and save it as an interactive HTML file.
+    - only the monthly partitions of the stats store (stats_store/) that
+      overlap the requested dates and the columns needed are read, the
+      manifest.json of the store lists the partitions. Falls back to the
+      access_log_stats.txt CSV export when there is no store.
+2. Pre-aggregate the daily rows into the views of the dashboard
+   (templates/tds_usage_dashboard.html): the last days with rolling means,
+   weekly and monthly sums. They are written to a compact JSON file that
+   the dashboard loads and plots, so its size does not grow with every day
+   of history.
+3. Plot the weekly view using plotly and save it as an interactive HTML
+   file that loads plotly.js from its CDN.
+4. Publish both files and the dashboard page to special_projects/tds, the
+   page fetches the JSON from its own directory (same origin).
 """
 import os
 import sys
+import json
 import fsspec
 import subprocess
 import pandas as pd
@@ -17,35 +30,203 @@ from plotly.subplots import make_subplots
 import plotly.graph_objects as go
 
 
-def load_tds_usage_data() -> pd.DataFrame:
+# aws cli access:
+# aws s3 ls s3://gdex/tds-tomcat-logs/ --endpoint-url https://boreas.hpc.ucar.edu:6443/ --profile tdsbackup
+S3_PREFIX = "s3://gdex/tds-tomcat-logs"
+S3_OPTIONS = dict(
+    profile="tdsbackup",
+    client_kwargs={"endpoint_url": "https://boreas.hpc.ucar.edu:6443"}
+)
+# columns of the daily table used by create_stats_figure
+PLOT_COLUMNS = [
+    "date", "total_requests", "failed_requests", "bytes_sent", "bytes_success",
+    "subset_requests", "opendap_requests", "fileserver_requests", "other_requests"
+]
+# views of the dashboard data
+RECENT_DAYS = 90                                  # daily rows
+ROLLING_WINDOWS = (7, 28)                         # days of the rolling means of the daily view
+ROLLING_COLUMNS = ["total_requests", "bytes_sent"]
+RECENT_WEEKS = 104                                # weekly sums, the monthly sums cover all dates
+PUBLISH_DIR = "/gdex/data/special_projects/tds"
+
+
+def load_store_manifest() -> dict:
+    """
+    Load the manifest of the stats store in the Boreas backup.
+
+    Returns
+    -------
+        dict: The manifest (see StatsStore in rda-tds-helm/scripts/log_stats.py),
+        None if the store has not been backed up yet.
+    """
+    try:
+        with fsspec.open(f"{S3_PREFIX}/stats_store/manifest.json", mode="rb", **S3_OPTIONS) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def load_stats_table(
+    table: str = "daily",
+    columns: list = None,
+    start: str = None,
+    end: str = None,
+    manifest: dict = None
+) -> pd.DataFrame:
     """
-    Load the TDS usage data from the txt file stored in the Boreas backup.
-    The data is in the CSV format.
+    Load a table of the stats store, reading only the partitions and columns needed.
+
+    Parameters
+    ----------
+    table : str
+        Table of the store: daily, datasets, hosts or latency.
+    columns : list[str], optional
+        Columns to read, default all. The date column is always read.
+    start, end : str, optional
+        First and last date (YYYY-MM-DD) to load, default everything.
+    manifest : dict, optional
+        The store manifest, loaded from the backup if not given.
+
+    Returns
+    -------
+        pd.DataFrame: The rows of the table between start and end.
+    """
+    manifest = manifest or load_store_manifest()
+    meta = manifest["tables"][table]
+    if columns is not None and "date" not in columns:
+        columns = ["date"] + list(columns)
+
+    # month partitions overlapping [start, end]
+    frames = []
+    for month, partition in sorted(meta["partitions"].items()):
+        if start is not None and month < start[:7]:
+            continue
+        if end is not None and month > end[:7]:
+            continue
+        with fsspec.open(
+            f"{S3_PREFIX}/stats_store/{partition['path']}",
+            mode="rb",
+            compression="gzip",
+            **S3_OPTIONS
+        ) as f:
+            frames.append(pd.read_csv(f, header=0, usecols=columns))
+
+    if not frames:
+        return pd.DataFrame(columns=columns or meta["columns"])
+    df = pd.concat(frames, ignore_index=True)
+    if start is not None:
+        df = df[df["date"] >= start]
+    if end is not None:
+        df = df[df["date"] <= end]
+    return df.sort_values("date").reset_index(drop=True)
+
+
+def load_tds_usage_data(start: str = None, end: str = None) -> pd.DataFrame:
+    """
+    Load the daily TDS usage data from the Boreas backup.
+
+    Reads the daily table of the stats store, or the access_log_stats.txt
+    CSV export if the store is not backed up yet.
 
     Column names:
     date,total_requests,failed_requests,bytes_sent,bytes_success,
     subset_requests,opendap_requests,fileserver_requests,other_requests
 
+    Parameters
+    ----------
+    start, end : str, optional
+        First and last date (YYYY-MM-DD) to load, default everything.
+
     Returns
     -------
         pd.DataFrame: The TDS usage data.
     """
+    manifest = load_store_manifest()
+    if manifest is not None:
+        return load_stats_table("daily", PLOT_COLUMNS, start, end, manifest)
 
-    # Load the TDS usage data from the txt file stored in the Boreas backup.
-    # aws cli access:
-    # aws s3 ls s3://gdex/tds-tomcat-logs/ --endpoint-url https://boreas.hpc.ucar.edu:6443/ --profile tdsbackup
-    s3_path = "s3://gdex/tds-tomcat-logs/access_log_stats.txt"
- 
-    with fsspec.open(
-        s3_path,
-        mode="rb",
-        profile="tdsbackup",
-        client_kwargs={"endpoint_url": "https://boreas.hpc.ucar.edu:6443"}
-    ) as f:
-        df = pd.read_csv(f, header=0)
+    # CSV export of the stats
+    with fsspec.open(f"{S3_PREFIX}/access_log_stats.txt", mode="rb", **S3_OPTIONS) as f:
+        df = pd.read_csv(f, header=0, usecols=PLOT_COLUMNS)
+    if start is not None:
+        df = df[df["date"] >= start]
+    if end is not None:
+        df = df[df["date"] <= end]
     return df
 
 
+def _columnar(frame: pd.DataFrame) -> dict:
+    """The rows of a date indexed frame as {"date": [...], column: [...]} lists."""
+    data = {"date": frame.index.strftime("%Y-%m-%d").tolist()}
+    for column in frame.columns:
+        data[column] = frame[column].tolist()
+    return data
+
+
+def rollup_usage(values: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """
+    Sum the daily usage data per period.
+
+    Parameters
+    ----------
+    values : pd.DataFrame
+        Daily usage counts indexed by date (DatetimeIndex).
+    freq : str
+        Pandas period frequency, "W-SUN" (weeks starting on Monday) or "M".
+
+    Returns
+    -------
+        pd.DataFrame: The sums indexed by the first day of each period, with
+        the number of days with data in the period (the current period is partial).
+    """
+    starts = values.index.to_period(freq).start_time
+    rolled = values.groupby(starts).sum()
+    rolled["days"] = values.groupby(starts).size()
+    rolled.index.name = "date"
+    return rolled
+
+
+def build_dashboard_data(df: pd.DataFrame) -> dict:
+    """
+    Pre-aggregate the daily TDS usage data into the views of the dashboard.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        TDS usage data with the PLOT_COLUMNS.
+
+    Returns
+    -------
+        dict: {"first_date", "last_date", "views": {"daily", "weekly", "monthly"}},
+        each view in columnar form ({"date": [...], column: [...]}). The daily
+        view has the last RECENT_DAYS days and the rolling means
+        (<column>_<window>d) of the ROLLING_COLUMNS.
+    """
+    values = df[PLOT_COLUMNS[1:]].set_index(pd.DatetimeIndex(pd.to_datetime(df["date"]), name="date"))
+    values = values.sort_index().astype("int64")
+    if values.empty:
+        empty = _columnar(values)
+        return dict(first_date=None, last_date=None, views=dict(daily=empty, weekly=empty, monthly=empty))
+    first, last = values.index.min(), values.index.max()
+
+    # last days, the rolling means are computed over all dates so the first days of the view have them
+    daily = values[values.index > last - pd.Timedelta(days=RECENT_DAYS)].copy()
+    for column in ROLLING_COLUMNS:
+        for window in ROLLING_WINDOWS:
+            rolling = values[column].rolling(f"{window}D").mean()
+            daily[f"{column}_{window}d"] = rolling.loc[daily.index].round(1)
+
+    return dict(
+        first_date=first.strftime("%Y-%m-%d"),
+        last_date=last.strftime("%Y-%m-%d"),
+        views=dict(
+            daily=_columnar(daily),
+            weekly=_columnar(rollup_usage(values, "W-SUN").tail(RECENT_WEEKS)),
+            monthly=_columnar(rollup_usage(values, "M"))
+        )
+    )
+
+
 def create_stats_figure(df: pd.DataFrame):
     """
     Create the interactive Plotly figure from TDS usage data.
@@ -175,23 +356,32 @@ def create_stats_figure(df: pd.DataFrame):
 if __name__ == "__main__":
     # get the directory path of the current script
     dir_path = os.path.dirname(os.path.realpath(__file__))
+    output_dir = os.path.join(dir_path, "..")
 
     # extract the TDS usage data from the Boreas backup
     df = load_tds_usage_data()
 
-    # create the interactive Plotly figure
-    fig = create_stats_figure(df)
+    # pre-aggregated views loaded by templates/tds_usage_dashboard.html
+    data = build_dashboard_data(df)
+    with open(f"{output_dir}/tds_usage_stats.json", "w") as f:
+        json.dump(data, f, separators=(",", ":"))
 
-    # save the interactive Plotly figure as an HTML file
-    fig.write_html(f"{dir_path}/../tds_usage_stats.html")
+    # create the interactive Plotly figure of the weekly sums
+    fig = create_stats_figure(pd.DataFrame(data["views"]["weekly"]))
 
-    # use cp to copy html to special_projects/tds/tds_usage_stats.html
-    result = subprocess.run(
-        ["sudo", "-u", "gdexdata",
-        "cp", f"{dir_path}/../tds_usage_stats.html",
-        "/gdex/data/special_projects/tds/tds_usage_stats.html"],
-        check=True
-    )
-    if result.returncode != 0:
-        print(f"Error: cp command failed with exit code {result.returncode}")
-        sys.exit(result.returncode)
+    # save the interactive Plotly figure as an HTML file, plotly.js is loaded from its CDN
+    fig.write_html(f"{output_dir}/tds_usage_stats.html", include_plotlyjs="cdn")
+
+    # use cp to copy the json, the html and the dashboard page to special_projects/tds/,
+    # the dashboard fetches the json relative to its own URL
+    for source in ("tds_usage_stats.json", "tds_usage_stats.html", "templates/tds_usage_dashboard.html"):
+        filename = os.path.basename(source)
+        result = subprocess.run(
+            ["sudo", "-u", "gdexdata",
+            "cp", f"{output_dir}/{source}",
+            f"{PUBLISH_DIR}/{filename}"],
+            check=True
+        )
+        if result.returncode != 0:
+            print(f"Error: cp command failed with exit code {result.returncode}")
+            sys.exit(result.returncode)
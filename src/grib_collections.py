@@ -0,0 +1,338 @@
+"""
+GRIB featureCollections derived from the files of a dataset on disk.
+
+A datasetScan serves GRIB datasets file by file, so every OPeNDAP/NCSS
+request opens and indexes raw GRIB files. A GRIB featureCollection is
+served from collection indexes (ncx4) instead, which the TDM container
+(rda-tds/Dockerfile-tdm) builds ahead of time from the `<tdm>` element
+and announces to TDS through the `<update trigger="allow"/>` element.
+
+`find_collections` walks the data directory of a dataset (whole dataset,
+or each top level dsgroup webpath) and derives one collection per GRIB
+file extension found there:
+
+- featureType GRIB-1/GRIB-2 from the magic bytes of a sample of the files
+  (see sniff_format.py), files of an unknown edition are left out
+- spec: the directory, `**/` when the files are spread over sub directories
+  (with timePartition="directory"), and a regular expression built from
+  the file names (the non-digit literals of the digit normalized names,
+  any digit run, so later dates match too)
+- dateFormatMark when the names hold a date (yyyyMMdd, yyyyMMddHH, ...)
+  after a fixed prefix
+
+Indexes are written under the GribIndex directory of threddsConfig.xml
+(/data/TDSIndexFiles, nestedDirectory policy), i.e. on the tdsPersist PVC
+mounted at /data/TDSIndexFiles/data/rda/data in the TDS and TDM containers.
+
+The collections of each dataset are recorded in
+[content dir]/grib_collections.json so catalogs regenerated later without
+a new crawl keep them.
+
+Usage:
+    collections = find_collections('d084001')
+    collections = find_collections('d084001', webpaths=['ds084.1/2015'])
+    # or through createXML.py [dsid] [out dir] --grib-collections dataset|group
+"""
+import os
+import re
+import json
+import random
+from datetime import datetime
+from dataclasses import asdict, dataclass
+from atomic_write import write_atomic
+from scan_datafiles import iter_files
+from sniff_format import classify_files
+from static_catalog import DATA_ROOT, TDS_DATA_ROOT
+
+COLLECTION_FILE = 'grib_collections.json'
+GRIB_EXTENSIONS = ('.grb', '.grb1', '.grb2', '.grib', '.grib1', '.grib2')
+FEATURE_TYPES = {'grib1': 'GRIB1', 'grib2': 'GRIB2'}
+DATA_FORMATS = {'GRIB1': 'GRIB-1', 'GRIB2': 'GRIB-2'}
+# files whose magic bytes are read per collection
+SAMPLE_SIZE = 20
+# file names whose dates are checked per collection
+NAME_SAMPLE_SIZE = 1000
+# TDM settings of the existing featureCollections (daily rescan at 01:10)
+TDM_REWRITE = 'test'
+TDM_RESCAN = '0 10 1 * * ? *'
+# date digit runs in file names, longest first, with their SimpleDateFormat
+DATE_FORMATS = (
+    (12, '%Y%m%d%H%M', 'yyyyMMddHHmm'),
+    (10, '%Y%m%d%H', 'yyyyMMddHH'),
+    (8, '%Y%m%d', 'yyyyMMdd'),
+    (6, '%Y%m', 'yyyyMM'),
+)
+DIGITS = re.compile(r'\d+')
+
+
+@dataclass
+class GribCollection:
+    """A GRIB featureCollection of a dataset.
+
+    Attributes
+    ----------
+    name : str
+        Name of the featureCollection and of its collection.
+    feature_type : str
+        'GRIB1' or 'GRIB2'.
+    spec : str
+        Collection spec, as seen from the TDS container.
+    date_format_mark : str
+        dateFormatMark of the collection, '' if the names hold no date.
+    time_partition : str
+        timePartition of the collection ('directory'), '' for none.
+    n_files : int
+        Number of files found when the collection was derived.
+    """
+    name: str
+    feature_type: str
+    spec: str
+    date_format_mark: str = ''
+    time_partition: str = ''
+    n_files: int = 0
+
+    @property
+    def data_format(self) -> str:
+        """The thredds dataFormat (see createXML.get_format)."""
+        return DATA_FORMATS[self.feature_type]
+
+    @property
+    def collection_name(self) -> str:
+        """Name of the collection element, also the name of its index files."""
+        return re.sub(r'[^\w.-]+', '_', self.name)
+
+
+def name_pattern(name: str) -> str:
+    """File name with every digit replaced by '#'."""
+    return re.sub(r'\d', '#', name)
+
+
+def digits_regex(pattern: str) -> str:
+    """Regular expression of a digit normalized text: literals joined by \\d+."""
+    return r'\d+'.join(re.escape(literal) for literal in re.split(r'#+', pattern))
+
+
+def name_regex(patterns, prefix: str, extension: str) -> str:
+    """
+    Regular expression matching the file names of a collection.
+
+    Only the non-digit parts of the names are kept as literals, every
+    digit run becomes \\d+ (also those shared by all files found today,
+    e.g. a year or a date), so files of later dates still match when the
+    TDM rescans the collection. Names that share one digit normalized
+    pattern give its literal parts joined by digit runs (e.g.
+    gfs\\.\\d+p\\d+\\.\\d+\\.f\\d+\\.grib2$), otherwise the shared
+    prefix (up to its trailing digits) then any characters.
+
+    Parameters
+    ----------
+    patterns : set[str]
+        The digit normalized names (see `name_pattern`).
+    prefix : str
+        Longest prefix shared by all names.
+    extension : str
+        Their extension (e.g. '.grib2').
+
+    Returns
+    -------
+    str
+        Regular expression anchored at the end of the name.
+    """
+    if len(patterns) == 1:
+        pattern = next(iter(patterns))
+        stem = pattern[:len(pattern) - len(extension)]
+        return digits_regex(stem) + re.escape(extension) + '$'
+
+    prefix = name_pattern(re.sub(r'\d+$', '', prefix))
+    return digits_regex(prefix) + '.*' + re.escape(extension) + '$'
+
+
+def date_format_mark(names) -> str:
+    """
+    dateFormatMark of file names holding a date after a fixed text.
+
+    The first digit run that parses as a date in every name is used. It
+    is marked by the text before it when that is the same in every name,
+    else by the text since the previous digit run when that is the same in
+    every name and does not occur earlier in it, as TDS reads the date
+    after the first occurrence of the mark.
+
+    Parameters
+    ----------
+    names : list[str]
+        The file names (or a sample of them).
+
+    Returns
+    -------
+    str
+        e.g. '#gfs.0p25.#yyyyMMddHH', '' if no such date is found.
+    """
+    runs = [list(DIGITS.finditer(name)) for name in names]
+    n_runs = min(len(name_runs) for name_runs in runs)
+    for i in range(n_runs):
+        marks = {name[:name_runs[i].start()] for name, name_runs in zip(names, runs)}
+        if len(marks) != 1 and i > 0:
+            marks = set()
+            for name, name_runs in zip(names, runs):
+                mark_start = name_runs[i-1].end()
+                mark = name[mark_start:name_runs[i].start()]
+                marks.add(mark if name.find(mark) == mark_start else None)
+        if len(marks) != 1 or not next(iter(marks)):
+            continue
+        mark = marks.pop()
+
+        for length, strptime_format, java_format in DATE_FORMATS:
+            try:
+                for name_runs in runs:
+                    digits = name_runs[i].group()
+                    if len(digits) < length:
+                        raise ValueError(digits)
+                    datetime.strptime(digits[:length], strptime_format)
+            except ValueError:
+                continue
+            return f'#{mark}#{java_format}'
+    return ''
+
+
+def scan_collection_dir(data_dir: str) -> dict:
+    """
+    GRIB files under a directory grouped by extension, in one walk.
+
+    Only the digit normalized names, the shared prefix and a random sample
+    of the paths are kept, so memory does not grow with the file count.
+
+    Parameters
+    ----------
+    data_dir : str
+        The collection directory.
+
+    Returns
+    -------
+    dict
+        extension to {"patterns": up to two name patterns, "prefix": str,
+        "paths": sample of paths, "nested": bool (files in sub directories),
+        "n_files": int}.
+    """
+    groups = {}
+    for entry in iter_files(data_dir):
+        name = entry.name
+        if name.startswith('.') or not name.lower().endswith(GRIB_EXTENSIONS):
+            continue
+        extension = os.path.splitext(name)[1]
+        group = groups.get(extension)
+        if group is None:
+            group = groups[extension] = dict(patterns=set(), prefix=name, paths=[], nested=False, n_files=0)
+        # only a single shared pattern is used, two tell it is not
+        if len(group['patterns']) < 2:
+            group['patterns'].add(name_pattern(name))
+        if not name.startswith(group['prefix']):
+            group['prefix'] = os.path.commonprefix([group['prefix'], name])
+        if os.path.dirname(entry.path) != data_dir:
+            group['nested'] = True
+
+        # reservoir sampling (algorithm R)
+        if len(group['paths']) < NAME_SAMPLE_SIZE:
+            group['paths'].append(entry.path)
+        else:
+            j = random.randrange(group['n_files'] + 1)
+            if j < NAME_SAMPLE_SIZE:
+                group['paths'][j] = entry.path
+        group['n_files'] += 1
+    return groups
+
+
+def derive_collections(dsid: str, relpath: str = '', data_root: str = DATA_ROOT) -> list:
+    """
+    GRIB collections of one directory of a dataset, one per GRIB extension.
+
+    Parameters
+    ----------
+    dsid : str
+        The dataset ID.
+    relpath : str
+        Directory relative to the dataset data directory ('' for all of it).
+    data_root : str
+        Directory of the dataset data directories.
+
+    Returns
+    -------
+    list[GribCollection]
+        The collections, [] if the directory holds no GRIB files.
+    """
+    data_dir = os.path.join(data_root, dsid, relpath) if relpath else os.path.join(data_root, dsid)
+    tds_dir = f'{TDS_DATA_ROOT}/{dsid}/{relpath}' if relpath else f'{TDS_DATA_ROOT}/{dsid}'
+    groups = scan_collection_dir(data_dir)
+
+    collections = []
+    for extension, group in sorted(groups.items()):
+        # GRIB edition of most of the sampled files
+        paths = group['paths']
+        kinds = classify_files(random.sample(paths, min(SAMPLE_SIZE, len(paths))))
+        kind, _ = kinds.most_common(1)[0]
+        if kind not in FEATURE_TYPES:
+            continue
+
+        # one partition per directory when the files are spread over sub directories
+        nested = group['nested']
+        spec = tds_dir + ('/**/' if nested else '/') + name_regex(group['patterns'], group['prefix'], extension)
+
+        name = f'{dsid} {relpath}' if relpath else dsid
+        if len(groups) > 1:
+            name += f' {extension[1:]}'
+        collections.append(GribCollection(
+            name=name,
+            feature_type=FEATURE_TYPES[kind],
+            spec=spec,
+            date_format_mark=date_format_mark([os.path.basename(path) for path in paths]),
+            time_partition='directory' if nested else '',
+            n_files=group['n_files']
+        ))
+    return collections
+
+
+def find_collections(dsid: str, webpaths=None, data_root: str = DATA_ROOT) -> list:
+    """
+    GRIB collections of a dataset.
+
+    Parameters
+    ----------
+    dsid : str
+        The dataset ID.
+    webpaths : list[str], optional
+        Top level dsgroup webpaths (relative to the dataset data directory),
+        one collection set per existing webpath directory. Default None
+        derives the collections of the whole dataset directory.
+    data_root : str
+        Directory of the dataset data directories.
+
+    Returns
+    -------
+    list[GribCollection]
+        The collections, in the order of the webpaths.
+    """
+    if not webpaths:
+        return derive_collections(dsid, data_root=data_root)
+
+    collections = []
+    for webpath in dict.fromkeys(webpath.strip('/') for webpath in webpaths):
+        if webpath and os.path.isdir(os.path.join(data_root, dsid, webpath)):
+            collections.extend(derive_collections(dsid, webpath, data_root))
+    return collections
+
+
+def load_collections(directory: str) -> dict:
+    """dsid to its list[GribCollection] recorded in the content directory."""
+    try:
+        with open(os.path.join(directory, COLLECTION_FILE), 'r', encoding='utf-8') as f:
+            recorded = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {dsid: [GribCollection(**c) for c in collections] for dsid, collections in recorded.items()}
+
+
+def save_collections(directory: str, collections: dict) -> bool:
+    """Record dsid to its list[GribCollection] in the content directory."""
+    recorded = {dsid: [asdict(c) for c in dataset_collections]
+                for dsid, dataset_collections in collections.items() if dataset_collections}
+    data = json.dumps(recorded, indent=1, sort_keys=True) + '\n'
+    return write_atomic(os.path.join(directory, COLLECTION_FILE), data)
@@ -23,8 +23,9 @@ fi
 #Check internal server errors
 logDate=`date +%Y-%m-%d`
 linesInLastHour=300 # Estimate
-ISE=`tail -$linesInLastHour /data/logs/tomcat/localhost_access_log.${logDate}.txt | grep " 500 "`
-if [[ $? -eq 0 ]]; then
+# status is the first field after the quoted request, %b/%D can also read 500
+ISE=`tail -$linesInLastHour /data/logs/tomcat/localhost_access_log.${logDate}.txt | awk -F'"' '{split($3, f, " "); if (f[1] == "500") print}'`
+if [[ -n "$ISE" ]]; then
 
     errorMsg="Internal server error in last hour:\n\n$ISE"
     subject="Thredds internal server error in last hour"
@@ -0,0 +1,627 @@
+#!/usr/bin/env python
+"""
+NcML joinExisting time aggregations of NetCDF time-series datasets.
+
+Users of NetCDF datasets otherwise open hundreds of files through the
+files/<dsid> datasetScan and stitch them together client-side. This
+module groups the files of a dataset into time series and describes each
+one as a joinExisting NcML aggregation for the per-dataset catalog of
+createXML.py:
+
+1. walk the data directory once and group the files by their digit
+   normalized relative path (e.g. ts/PS/b.e11.cam.h0.PS.######-######.nc)
+2. read the header of a sample of each group and drop the groups without
+   a time coordinate (a coordinate variable with "<unit> since <date>")
+3. read the time coordinate of every file of the remaining groups and
+   split them by their time varying variables
+4. order the files by time, each one with its number of time steps
+   (ncoords) and values (coordValue), so TDS does not open every file to
+   build the aggregated time coordinate on first access
+
+Classic, 64-bit offset and CDF5 headers are read with the standard library
+(values of the time variable only, see sniff_format.py for the kinds).
+netCDF-4 files need the optional netCDF4 package and are skipped without it
+(not cached, they are read by the first run that has it).
+
+The time coordinate of every file is cached with its size and mtime in
+[content dir]/ncml/<dsid>.json.gz, so a re-run only reads new or changed
+files, and catalogs regenerated without a new scan keep the aggregations.
+
+Usage:
+    aggregations = scan_aggregations('d316000', 'rda-tds/content/')
+    # offline, against local sample files in [data root]/[dsid]/:
+    ncml_aggregation.py [dsid] [data root] [cache dir]
+    # or through createXML.py [dsid] [out dir] --ncml
+"""
+import os
+import sys
+import gzip
+import json
+import random
+import struct
+import xml.etree.ElementTree as ET
+from dataclasses import asdict, dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from atomic_write import write_atomic
+from grib_collections import name_pattern
+from pretty_xml import prettify
+from scan_datafiles import NETCDF_EXTENSIONS, iter_files
+from sniff_format import classify_file
+from static_catalog import DATA_ROOT, TDS_DATA_ROOT
+
+# netCDF-4 (HDF5) files are only read if netCDF4 is installed
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+NCML_NAMESPACE = 'http://www.unidata.ucar.edu/namespaces/netcdf/ncml-2.2'
+# sub directory of the content directory holding the coordinate caches
+NCML_DIR = 'ncml'
+CACHE_VERSION = 1
+# files whose header is read to decide if a group is a time series
+SAMPLE_SIZE = 5
+# fewest files aggregated
+MIN_FILES = 2
+# above this many time steps the values are not written in the catalog (ncoords only)
+MAX_COORD_VALUES = 50_000
+MAX_WORKERS = 8
+
+# netCDF classic header tags and types (struct code, size)
+NC_DIMENSION = 10
+NC_VARIABLE = 11
+NC_ATTRIBUTE = 12
+NC_TYPES = {
+    1: ('b', 1), 2: ('c', 1), 3: ('h', 2), 4: ('i', 4), 5: ('f', 4), 6: ('d', 8),
+    7: ('B', 1), 8: ('H', 2), 9: ('I', 4), 10: ('q', 8), 11: ('Q', 8),
+}
+STREAMING = 0xFFFFFFFF
+
+
+@dataclass
+class TimeCoordinate:
+    """The time coordinate of a NetCDF file.
+
+    Attributes
+    ----------
+    dim_name : str
+        The time dimension.
+    var_name : str
+        The time coordinate variable.
+    units : str
+        Its units (e.g. 'hours since 1900-01-01 00:00:00').
+    calendar : str
+        Its calendar attribute, '' if not set.
+    variables : list[str]
+        The other variables along the time dimension, sorted.
+    values : list
+        The time values.
+    """
+    dim_name: str
+    var_name: str
+    units: str
+    calendar: str = ''
+    variables: list = field(default_factory=list)
+    values: list = field(default_factory=list)
+
+    @property
+    def signature(self) -> tuple:
+        """What the files of one aggregation share."""
+        return (self.dim_name, self.var_name, tuple(self.variables))
+
+
+@dataclass
+class NcmlAggregation:
+    """A joinExisting aggregation of NetCDF files along time.
+
+    Attributes
+    ----------
+    name : str
+        Name of the aggregation dataset.
+    dim_name : str
+        The joined (time) dimension.
+    variables : list[str]
+        The time varying variables.
+    files : list
+        [location, ncoords, coordValue] of every file in time order;
+        coordValue is '' when not written (see MAX_COORD_VALUES).
+    time_units_change : bool
+        True if the files have different time units.
+    """
+    name: str
+    dim_name: str
+    variables: list
+    files: list
+    time_units_change: bool = False
+
+    @property
+    def n_coords(self) -> int:
+        """Total number of time steps."""
+        return sum(ncoords for _, ncoords, _ in self.files)
+
+
+class _HeaderReader:
+    """Sequential reader of a netCDF classic (CDF1/CDF2/CDF5) header."""
+
+    def __init__(self, f, version: int):
+        self.f = f
+        self.size_format = '>Q' if version == 5 else '>I'
+        self.offset_format = '>I' if version == 1 else '>Q'
+
+    def read(self, n: int) -> bytes:
+        data = self.f.read(n)
+        if len(data) < n:
+            raise ValueError('truncated header')
+        return data
+
+    def unpack(self, fmt: str):
+        return struct.unpack(fmt, self.read(struct.calcsize(fmt)))[0]
+
+    def size(self) -> int:
+        return self.unpack(self.size_format)
+
+    def offset(self) -> int:
+        return self.unpack(self.offset_format)
+
+    def name(self) -> str:
+        n = self.size()
+        return self.read(-(-n // 4) * 4)[:n].decode('utf-8', 'replace')
+
+    def values(self, nc_type: int, n: int):
+        code, width = NC_TYPES[nc_type]
+        data = self.read(-(-n * width // 4) * 4)[:n * width]
+        if code == 'c':
+            return data.decode('utf-8', 'replace').rstrip('\0')
+        return list(struct.unpack(f'>{n}{code}', data))
+
+    def attributes(self) -> dict:
+        tag, n = self.unpack('>I'), self.size()
+        if tag != NC_ATTRIBUTE:
+            return {}
+        attributes = {}
+        for _ in range(n):
+            name = self.name()
+            nc_type = self.unpack('>I')
+            attributes[name] = self.values(nc_type, self.size())
+        return attributes
+
+
+def _is_time_coordinate(name: str, dims: list, attributes: dict) -> bool:
+    """True for a 1-D coordinate variable with units '<unit> since <date>'."""
+    units = attributes.get('units')
+    return len(dims) == 1 and dims[0] == name and isinstance(units, str) and ' since ' in units
+
+
+def _time_coordinate(variables: dict, unlimited: set) -> tuple:
+    """Name of the time coordinate among (name -> (dims, attributes)), the unlimited one first."""
+    candidates = [name for name, (dims, attributes) in variables.items() if _is_time_coordinate(name, dims, attributes)]
+    if not candidates:
+        return None
+    for name in candidates:
+        if variables[name][0][0] in unlimited:
+            return name
+    for name in candidates:
+        attributes = variables[name][1]
+        if attributes.get('standard_name') == 'time' or attributes.get('axis') == 'T':
+            return name
+    return candidates[0]
+
+
+def read_classic_time(path: str) -> TimeCoordinate:
+    """
+    Time coordinate of a netCDF classic, 64-bit offset or CDF5 file.
+
+    Only the header and the values of the time variable are read.
+
+    Parameters
+    ----------
+    path : str
+        The file.
+
+    Returns
+    -------
+    TimeCoordinate
+        None if the file has no time coordinate.
+
+    Raises
+    ------
+    ValueError
+        If the header cannot be parsed.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+        if magic[:3] != b'CDF' or magic[3:] not in (b'\x01', b'\x02', b'\x05'):
+            raise ValueError(f'{path} is not a netCDF classic file')
+        reader = _HeaderReader(f, magic[3])
+        numrecs = reader.size()
+
+        # dimensions (length 0 is the record dimension)
+        tag, n = reader.unpack('>I'), reader.size()
+        dims = [(reader.name(), reader.size()) for _ in range(n)] if tag == NC_DIMENSION else []
+        unlimited = {name for name, length in dims if length == 0}
+        reader.attributes()  # global attributes
+
+        tag, n = reader.unpack('>I'), reader.size()
+        variables, layout = {}, {}
+        for _ in range(n if tag == NC_VARIABLE else 0):
+            name = reader.name()
+            dim_names = [dims[reader.size()][0] for _ in range(reader.size())]
+            attributes = reader.attributes()
+            nc_type = reader.unpack('>I')
+            vsize = reader.size()
+            variables[name] = (dim_names, attributes)
+            layout[name] = (nc_type, vsize, reader.offset())
+
+        time_name = _time_coordinate(variables, unlimited)
+        if time_name is None:
+            return None
+        time_dim = variables[time_name][0][0]
+        attributes = variables[time_name][1]
+        nc_type, vsize, begin = layout[time_name]
+        code, width = NC_TYPES[nc_type]
+
+        if time_dim in unlimited:
+            # one value per record, records hold a slice of every record variable
+            record_vars = [name for name, (dim_names, _) in variables.items() if dim_names and dim_names[0] in unlimited]
+            if len(record_vars) == 1:
+                recsize = width
+            else:
+                recsize = sum(layout[name][1] for name in record_vars)
+            if numrecs == STREAMING:
+                first_begin = min(layout[name][2] for name in record_vars)
+                numrecs = (os.fstat(f.fileno()).st_size - first_begin) // recsize
+            values = []
+            for i in range(numrecs):
+                f.seek(begin + i * recsize)
+                values.append(struct.unpack(f'>{code}', f.read(width))[0])
+        else:
+            length = dict(dims)[time_dim]
+            f.seek(begin)
+            values = list(struct.unpack(f'>{length}{code}', f.read(length * width)))
+
+    data_vars = sorted(name for name, (dim_names, _) in variables.items()
+                       if time_dim in dim_names and name != time_name)
+    return TimeCoordinate(
+        dim_name=time_dim,
+        var_name=time_name,
+        units=attributes['units'],
+        calendar=attributes.get('calendar', '') if isinstance(attributes.get('calendar'), str) else '',
+        variables=data_vars,
+        values=values
+    )
+
+
+def read_netcdf4_time(path: str) -> TimeCoordinate:
+    """Time coordinate of a netCDF-4 file with the netCDF4 package (see `read_classic_time`)."""
+    with netCDF4.Dataset(path) as ds:
+        unlimited = {name for name, dim in ds.dimensions.items() if dim.isunlimited()}
+        variables = {
+            name: (list(var.dimensions), {attr: var.getncattr(attr) for attr in var.ncattrs()})
+            for name, var in ds.variables.items()
+        }
+        time_name = _time_coordinate(variables, unlimited)
+        if time_name is None:
+            return None
+        time_var = ds.variables[time_name]
+        time_var.set_auto_mask(False)
+        time_dim = time_var.dimensions[0]
+        attributes = variables[time_name][1]
+        return TimeCoordinate(
+            dim_name=time_dim,
+            var_name=time_name,
+            units=attributes['units'],
+            calendar=str(attributes.get('calendar', '')),
+            variables=sorted(name for name, (dim_names, _) in variables.items()
+                             if time_dim in dim_names and name != time_name),
+            values=time_var[:].tolist()
+        )
+
+
+def _read_time(path: str) -> tuple:
+    """
+    Time coordinate of a NetCDF file of any kind and whether it is a verdict.
+
+    Returns
+    -------
+    tuple
+        (TimeCoordinate or None, read). read is False if the file was not
+        read: a netCDF-4 file without netCDF4, or an I/O error.
+    """
+    try:
+        kind = classify_file(path)
+        if kind == 'netCDF-4':
+            if netCDF4 is None:
+                return None, False
+            return read_netcdf4_time(path), True
+        return read_classic_time(path), True
+    except OSError as e:
+        print(f"Error: {path}: {e}")
+        return None, False
+    except (ValueError, KeyError, IndexError, struct.error) as e:
+        print(f"Error: {path}: {e}")
+        return None, True
+
+
+def read_time_coordinate(path: str) -> TimeCoordinate:
+    """
+    Time coordinate of a NetCDF file of any kind.
+
+    Returns
+    -------
+    TimeCoordinate
+        None if the file has no time coordinate, is not readable, or is a
+        netCDF-4 file and netCDF4 is not installed.
+    """
+    return _read_time(path)[0]
+
+
+def group_files(data_dir: str) -> dict:
+    """
+    NetCDF files of a dataset grouped by their digit normalized relative path.
+
+    Returns
+    -------
+    dict
+        pattern to {relative path: [size, mtime_ns]}.
+    """
+    groups = {}
+    for entry in iter_files(data_dir):
+        if entry.name.startswith('.') or not entry.name.endswith(NETCDF_EXTENSIONS):
+            continue
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        relpath = os.path.relpath(entry.path, data_dir)
+        groups.setdefault(name_pattern(relpath), {})[relpath] = [st.st_size, st.st_mtime_ns]
+    return groups
+
+
+def cache_path(content_dir: str, dsid: str) -> str:
+    """Path of the coordinate cache of a dataset."""
+    return os.path.join(content_dir, NCML_DIR, dsid + '.json.gz')
+
+
+def load_cache(path: str) -> dict:
+    """
+    relative path -> [size, mtime_ns, time coordinate dict or None] of a saved cache, {} if none.
+
+    size and mtime_ns are None for a file that was not read (see `_read_time`).
+    """
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get('version') != CACHE_VERSION:
+        return {}
+    return cache['files']
+
+
+def save_cache(path: str, dsid: str, files: dict) -> bool:
+    """Write the coordinate cache (gzip JSON without timestamp, see static_catalog.save_manifest)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    cache = dict(version=CACHE_VERSION, dsid=dsid, files=files)
+    data = json.dumps(cache, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    return write_atomic(path, gzip.compress(data, mtime=0))
+
+
+def read_group(data_dir: str, group: dict, cache: dict, executor, relpaths=None) -> dict:
+    """
+    Time coordinates of files of a group, from the cache when size and mtime are unchanged.
+
+    Parameters
+    ----------
+    data_dir : str
+        The dataset data directory.
+    group : dict
+        relative path to [size, mtime_ns] (see `group_files`).
+    cache : dict
+        The coordinate cache, updated in place.
+    executor : concurrent.futures.Executor
+        Pool reading the headers.
+    relpaths : list[str], optional
+        Only these files of the group, default all.
+
+    Returns
+    -------
+    dict
+        relative path to its TimeCoordinate (None if it has none).
+    """
+    relpaths = list(group) if relpaths is None else relpaths
+    to_read = [relpath for relpath in relpaths
+               if relpath not in cache or cache[relpath][:2] != group[relpath]]
+    paths = [os.path.join(data_dir, relpath) for relpath in to_read]
+    for relpath, (time, read) in zip(to_read, executor.map(_read_time, paths)):
+        # a file not read never matches its size and mtime, it is read again on the next run
+        stat = group[relpath] if read else [None, None]
+        cache[relpath] = stat + [None if time is None else asdict(time)]
+    return {
+        relpath: None if cache[relpath][2] is None else TimeCoordinate(**cache[relpath][2])
+        for relpath in relpaths
+    }
+
+
+def format_coord(value) -> str:
+    """A coordinate value as written in coordValue (integral values without '.0')."""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def aggregation_name(dsid: str, relpaths: list, variables: list) -> str:
+    """Name of an aggregation: its directory (if any) and variables."""
+    directory = os.path.commonpath([os.path.dirname(relpath) for relpath in relpaths])
+    label = ', '.join(variables[:3]) + (', ...' if len(variables) > 3 else '')
+    return ' '.join(part for part in (dsid, directory, f'({label})' if label else '') if part)
+
+
+def build_aggregations(dsid: str, times: dict) -> list:
+    """
+    Aggregations of files sharing their time dimension and variables.
+
+    Parameters
+    ----------
+    dsid : str
+        The dataset ID.
+    times : dict
+        relative path to its TimeCoordinate of the files of one group.
+
+    Returns
+    -------
+    list[NcmlAggregation]
+        One aggregation per set of time varying variables with at least
+        MIN_FILES files, [] if a file lacks a time coordinate or the files
+        overlap in time.
+    """
+    if not times or any(time is None or not time.values for time in times.values()):
+        return []
+
+    series = {}
+    for relpath, time in times.items():
+        series.setdefault(time.signature, []).append(relpath)
+
+    aggregations = []
+    for signature, relpaths in sorted(series.items()):
+        if len(relpaths) < MIN_FILES:
+            continue
+        units_change = len({(times[relpath].units, times[relpath].calendar) for relpath in relpaths}) > 1
+        if units_change:
+            # values in different units cannot be compared, the file names give the order
+            relpaths.sort()
+        else:
+            relpaths.sort(key=lambda relpath: (times[relpath].values[0], relpath))
+            # joinExisting concatenates, the files must not overlap
+            ordered = all(
+                times[a].values[-1] < times[b].values[0] for a, b in zip(relpaths, relpaths[1:])
+            )
+            if not ordered:
+                print(f"Skipping {dsid} {relpaths[0]}...: files overlap in time")
+                continue
+
+        n_coords = sum(len(times[relpath].values) for relpath in relpaths)
+        files = []
+        for relpath in relpaths:
+            values = times[relpath].values
+            coord_value = ''
+            if not units_change and n_coords <= MAX_COORD_VALUES:
+                coord_value = ','.join(format_coord(value) for value in values)
+            files.append([f'{TDS_DATA_ROOT}/{dsid}/{relpath}', len(values), coord_value])
+
+        dim_name, _, variables = signature
+        aggregations.append(NcmlAggregation(
+            name=aggregation_name(dsid, relpaths, list(variables)),
+            dim_name=dim_name,
+            variables=list(variables),
+            files=files,
+            time_units_change=units_change
+        ))
+    return aggregations
+
+
+def scan_aggregations(
+    dsid: str,
+    content_dir: str,
+    data_root: str = DATA_ROOT,
+    sample_size: int = SAMPLE_SIZE,
+    max_workers: int = MAX_WORKERS
+) -> list:
+    """
+    Scan the NetCDF files of a dataset and derive its aggregations.
+
+    Parameters
+    ----------
+    dsid : str
+        The dataset ID.
+    content_dir : str
+        The TDS content directory, holding the coordinate cache in ncml/.
+    data_root : str
+        Directory of the dataset data directories.
+    sample_size : int
+        Files per group read first to decide if the group is a time series.
+    max_workers : int
+        Number of headers read concurrently.
+
+    Returns
+    -------
+    list[NcmlAggregation]
+        The aggregations, ordered by group.
+    """
+    data_dir = os.path.join(data_root, dsid)
+    cache_file = cache_path(content_dir, dsid)
+    previous = load_cache(cache_file)
+
+    cache = {}
+    aggregations = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for pattern, group in sorted(group_files(data_dir).items()):
+            if len(group) < MIN_FILES:
+                continue
+            group_cache = {relpath: previous[relpath] for relpath in group if relpath in previous}
+
+            # a sample first, most groups of a non time series dataset stop here
+            sample = random.sample(sorted(group), min(sample_size, len(group)))
+            if any(time is None for time in read_group(data_dir, group, group_cache, executor, sample).values()):
+                cache.update(group_cache)
+                continue
+
+            times = read_group(data_dir, group, group_cache, executor)
+            cache.update(group_cache)
+            aggregations.extend(build_aggregations(dsid, times))
+
+    if aggregations or os.path.exists(cache_file):
+        save_cache(cache_file, dsid, cache)
+    return aggregations
+
+
+def load_aggregations(dsid: str, content_dir: str) -> list:
+    """The aggregations of a dataset from its coordinate cache, without reading any file."""
+    cache_file = cache_path(content_dir, dsid)
+    if not os.path.exists(cache_file):
+        return []
+    groups = {}
+    for relpath, (_, _, time) in load_cache(cache_file).items():
+        groups.setdefault(name_pattern(relpath), {})[relpath] = None if time is None else TimeCoordinate(**time)
+
+    aggregations = []
+    for _, times in sorted(groups.items()):
+        aggregations.extend(build_aggregations(dsid, times))
+    return aggregations
+
+
+def ncml_element(aggregation: NcmlAggregation):
+    """
+    The NcML of an aggregation.
+
+    Returns
+    -------
+    xml.etree.ElementTree.Element
+        <netcdf> element holding the joinExisting aggregation.
+    """
+    netcdf = ET.Element('netcdf')
+    netcdf.attrib['xmlns'] = NCML_NAMESPACE
+    agg = ET.SubElement(netcdf, 'aggregation')
+    agg.attrib['dimName'] = aggregation.dim_name
+    agg.attrib['type'] = 'joinExisting'
+    if aggregation.time_units_change:
+        agg.attrib['timeUnitsChange'] = 'true'
+    for location, ncoords, coord_value in aggregation.files:
+        member = ET.SubElement(agg, 'netcdf')
+        member.attrib['location'] = location
+        member.attrib['ncoords'] = str(ncoords)
+        if coord_value:
+            member.attrib['coordValue'] = coord_value
+    return netcdf
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4:
+        sys.stderr.write('Usage:\n')
+        sys.stderr.write('    ' + sys.argv[0] + ' [dsid] [data root] [cache dir]\n')
+        sys.exit(1)
+
+    for aggregation in scan_aggregations(sys.argv[1], sys.argv[3], data_root=sys.argv[2]):
+        element = ncml_element(aggregation)
+        prettify(element)
+        print(f'<!--{aggregation.name}: {len(aggregation.files)} files, {aggregation.n_coords} time steps-->')
+        print(ET.tostring(element).decode('ascii'))
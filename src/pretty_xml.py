@@ -0,0 +1,78 @@
+"""
+Pretty printing and serialization of the TDS catalog trees.
+
+`prettify` indents an ElementTree in place in one pre-order walk with an
+explicit stack, O(n) in the number of elements, so catalogs with per-file
+datasets, many keywords or generated featureCollections stay cheap to
+write. The whitespace is the same as the previous queue based version of
+createXML.py, so existing catalogs are written byte for byte identical.
+
+Shared by createXML.py (generated catalogs) and catalog_editor.py (the top
+level catalog.xml, which keeps its hand made layout and is only serialized).
+
+Usage:
+    prettify(root)
+    xml_str = catalog_to_xml(root)
+"""
+import xml.etree.ElementTree as ET
+
+CATALOG_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>\n'
+
+
+def prettify(element, indent='  '):
+    """Prettify the XML element in place.
+
+    Each element with children gets a newline and the indentation of its
+    first child as text. The tail of each element is a newline and the
+    indentation of the element that follows its subtree in document order
+    (its next sibling, else the next sibling of the closest ancestor
+    that has one), or one level less than the element if nothing follows.
+
+    Parameters
+    ----------
+    element : root element
+        The root element of the XML tree to prettify.
+    indent : str, optional
+        The indentation string to use, by default '  '
+    """
+    # (level, element, level of the element following its subtree or None)
+    stack = [(0, element, None)]
+    while stack:
+        level, element, next_level = stack.pop()
+        children = list(element)
+        if children:
+            element.text = '\n' + indent * (level+1)  # for child open
+        if next_level is not None:
+            element.tail = '\n' + indent * next_level  # for sibling open
+        else:
+            element.tail = '\n' + indent * (level-1)  # for parent close
+
+        # the last child is followed by what follows its parent, the others by their sibling
+        if children:
+            stack.append((level + 1, children[-1], next_level))
+            stack.extend((level + 1, child, level + 1) for child in reversed(children[:-1]))
+
+
+def catalog_to_xml(root, indent='  '):
+    """Prettify a generated catalog tree in place and serialize it.
+
+    Parameters
+    ----------
+    root : xml.etree.ElementTree.Element
+        The root catalog element.
+    indent : str, optional
+        The indentation string to use, by default '  '
+
+    Returns
+    -------
+    str
+        The catalog XML document including the XML declaration
+        (non-ASCII characters as character references).
+    """
+    prettify(root, indent)
+    return CATALOG_DECLARATION + ET.tostring(root).decode('ascii')
+
+
+def tree_to_bytes(root):
+    """Serialize a tree as is (no re-indentation), as ElementTree.write with an XML declaration."""
+    return ET.tostring(root, encoding='utf-8', xml_declaration=True)
@@ -0,0 +1,150 @@
+"""
+Single pass scanner of a dataset data directory.
+
+Walks a dataset tree once with os.scandir and returns a small summary
+(data file counts per extension, total bytes and a random sample of NetCDF
+paths) that the auto-add checks share instead of walking the tree once per
+check. The sample is drawn with reservoir sampling so memory stays
+O(sample_size) on datasets with millions of files. With `classify` every
+NetCDF file is also classified from its magic bytes (see sniff_format.py).
+
+Usage:
+    summary = scan_data_dir('/gdex/data/d010077')
+    summary.has_datafiles, summary.sample_paths, summary.ext_counts
+"""
+import os
+import random
+from dataclasses import dataclass, field
+from sniff_format import classify_file
+
+# data file extensions TDS can serve
+DATA_EXTENSIONS = ('.nc', '.grb', '.grb2', '.nc4')
+# extensions of files sampled for the NetCDF (CDF5) probe
+NETCDF_EXTENSIONS = ('.nc', '.nc4')
+
+
+@dataclass
+class ScanSummary:
+    """Summary of the data files found under a dataset directory.
+
+    Attributes
+    ----------
+    ext_counts : dict
+        Data file extension to number of files.
+    sample_paths : list[str]
+        Uniform random sample of NetCDF file paths.
+    total_bytes : int
+        Total size of the data files (0 for existence only scans).
+    kind_counts : dict
+        File kind (classic, cdf5, netCDF-4, ...) to number of NetCDF files.
+        Only filled by scans with `classify`.
+    """
+    ext_counts: dict = field(default_factory=dict)
+    sample_paths: list = field(default_factory=list)
+    total_bytes: int = 0
+    kind_counts: dict = field(default_factory=dict)
+
+    @property
+    def n_files(self) -> int:
+        """Total number of data files."""
+        return sum(self.ext_counts.values())
+
+    @property
+    def has_datafiles(self) -> bool:
+        """True if at least one data file was found."""
+        return self.n_files > 0
+
+
+def iter_files(data_dir):
+    """Yield the os.DirEntry of every file under data_dir.
+
+    Symbolic links to directories are not followed and unreadable
+    directories are skipped (same as os.walk).
+    """
+    stack = [data_dir]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file():
+                            yield entry
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+
+def scan_data_dir(
+    data_dir: str,
+    sample_size: int = 10,
+    existence_only: bool = False,
+    classify: bool = False,
+    extensions: tuple = DATA_EXTENSIONS,
+    sample_extensions: tuple = NETCDF_EXTENSIONS,
+    rng: random.Random = None
+) -> ScanSummary:
+    """Walk a dataset directory once and summarize its data files.
+
+    Parameters
+    ----------
+    data_dir : str
+        The dataset data directory (e.g. /gdex/data/d010077).
+    sample_size : int
+        Number of NetCDF files to sample (default 10).
+    existence_only : bool
+        Stop at the first data file (default False). Only `has_datafiles`
+        is meaningful in the returned summary.
+    classify : bool
+        Classify every NetCDF file from its header bytes (default False).
+    extensions : tuple
+        Extensions counted as data files.
+    sample_extensions : tuple
+        Extensions of the files eligible for the sample.
+    rng : random.Random, optional
+        Random generator for the sample (default module random).
+
+    Returns
+    -------
+    ScanSummary
+        Summary of the data files.
+    """
+    rng = rng or random
+    summary = ScanSummary()
+    n_sample_candidates = 0
+
+    for entry in iter_files(data_dir):
+        name = entry.name
+        if not name.endswith(extensions):
+            continue
+        ext = os.path.splitext(name)[1]
+        summary.ext_counts[ext] = summary.ext_counts.get(ext, 0) + 1
+        if existence_only:
+            break
+
+        try:
+            summary.total_bytes += entry.stat().st_size
+        except OSError:
+            pass
+
+        if not name.endswith(sample_extensions):
+            continue
+
+        if classify:
+            kind = classify_file(entry.path)
+            summary.kind_counts[kind] = summary.kind_counts.get(kind, 0) + 1
+
+        # reservoir sampling (algorithm R)
+        if sample_size > 0:
+            if n_sample_candidates < sample_size:
+                summary.sample_paths.append(entry.path)
+            else:
+                j = rng.randrange(n_sample_candidates + 1)
+                if j < sample_size:
+                    summary.sample_paths[j] = entry.path
+            n_sample_candidates += 1
+
+    return summary
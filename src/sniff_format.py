@@ -0,0 +1,104 @@
+"""
+Identify NetCDF/HDF5/GRIB file kinds from their magic bytes.
+
+Reads only the first bytes of a file instead of running `ncdump -k`, so
+no netCDF C tools or fork/exec per file are needed. Kinds follow the
+`ncdump -k` names where they apply:
+
+    b'CDF\\x01'             classic
+    b'CDF\\x02'             64-bit offset
+    b'CDF\\x05'             cdf5
+    b'\\x89HDF\\r\\n\\x1a\\n'   netCDF-4 (HDF5, also netCDF-4 classic model)
+    b'GRIB' + edition      grib1 / grib2
+
+Usage:
+    classify_file('/gdex/data/d010077/file.nc')  # 'cdf5'
+    kinds = classify_files(paths)                # Counter of kinds
+    cdf5_fraction(kinds)
+"""
+from collections import Counter
+
+HDF5_SIGNATURE = b'\x89HDF\r\n\x1a\n'
+CDF_VERSIONS = {
+    1: 'classic',
+    2: '64-bit offset',
+    5: 'cdf5',
+}
+# HDF5 may start after a user block of 512, 1024, 2048 ... bytes
+HDF5_USERBLOCK_OFFSETS = (512, 1024, 2048, 4096)
+UNKNOWN = 'unknown'
+
+
+def classify_header(header: bytes) -> str:
+    """Classify the first 8 bytes of a file.
+
+    Parameters
+    ----------
+    header : bytes
+        Leading bytes of the file (at least 8 for GRIB/HDF5).
+
+    Returns
+    -------
+    str
+        The file kind, 'unknown' if not recognized.
+    """
+    if header[:3] == b'CDF' and len(header) >= 4:
+        return CDF_VERSIONS.get(header[3], UNKNOWN)
+    if header[:8] == HDF5_SIGNATURE:
+        return 'netCDF-4'
+    if header[:4] == b'GRIB' and len(header) >= 8:
+        edition = header[7]
+        if edition in (1, 2):
+            return f'grib{edition}'
+    return UNKNOWN
+
+
+def classify_file(filepath: str) -> str:
+    """Classify a file from its magic bytes.
+
+    Parameters
+    ----------
+    filepath : str
+        Path of the file.
+
+    Returns
+    -------
+    str
+        The file kind, 'unknown' if not recognized or not readable.
+    """
+    try:
+        with open(filepath, 'rb') as f:
+            kind = classify_header(f.read(8))
+            if kind != UNKNOWN:
+                return kind
+            for offset in HDF5_USERBLOCK_OFFSETS:
+                f.seek(offset)
+                if f.read(8) == HDF5_SIGNATURE:
+                    return 'netCDF-4'
+    except OSError:
+        pass
+    return UNKNOWN
+
+
+def classify_files(filepaths) -> Counter:
+    """Count the kinds of many files.
+
+    Parameters
+    ----------
+    filepaths : iterable of str
+        Paths of the files.
+
+    Returns
+    -------
+    collections.Counter
+        File kind to number of files.
+    """
+    return Counter(classify_file(filepath) for filepath in filepaths)
+
+
+def cdf5_fraction(kind_counts) -> float:
+    """Fraction of CDF5 files in the kind counts (0 if empty)."""
+    total = sum(kind_counts.values())
+    if total == 0:
+        return 0.0
+    return kind_counts.get('cdf5', 0) / total
@@ -0,0 +1,335 @@
+"""
+Precomputed static file catalogs for datasets too large for a datasetScan.
+
+A datasetScan makes TDS list and stat the GLADE directory live on every
+catalog browse. For datasets above a file count the per-dataset catalog
+instead refers to static catalogs generated here: one catalog per data
+directory, listing its files with their size and modification date and
+its subdirectories (catalogRef, with the size of their whole subtree).
+
+The dataset tree is crawled with os.scandir in a bounded thread pool and
+recorded in a gzip compressed JSON manifest (path, size, mtime of every
+file and the mtime of every directory). A re-run stats every directory
+but only lists again the ones whose mtime changed (a file was added,
+removed or renamed in it); the others are taken from the manifest.
+Catalog files whose content did not change are not rewritten
+(see atomic_write.py), so TDS only re-reads the directories that changed.
+
+Layout, next to the per-dataset catalogs:
+    <content dir>/catalog_<dsid>.xml                 catalogRef to static/<dsid>/catalog.xml
+    <content dir>/static/<dsid>/catalog.xml          top data directory
+    <content dir>/static/<dsid>/<sub dir>/catalog.xml
+    <content dir>/static/<dsid>/manifest.json.gz
+
+Usage:
+    used = update_static_catalogs('d010077', 'rda-tds/content/', min_files=20000)
+    # or through createXML.py [dsid] [out dir] --static-min-files 20000
+"""
+import os
+import gzip
+import json
+import shutil
+import fnmatch
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from atomic_write import write_atomic
+from pretty_xml import catalog_to_xml
+
+# dataset data directories on the host running the generator and in the TDS container
+DATA_ROOT = '/gdex/data'
+TDS_DATA_ROOT = '/data/rda/data'
+# sub directory of the content directory holding the static catalogs
+STATIC_DIR = 'static'
+MANIFEST_FILE = 'manifest.json.gz'
+MANIFEST_VERSION = 1
+MAX_WORKERS = 8
+# same files as the exclude filter of the datasetScan in createXML.py
+EXCLUDE_PATTERNS = ['*.html', '*.x', '.*', '.*/']
+
+
+def excluded(name: str, is_dir: bool) -> bool:
+    """True if the file or directory name matches an exclude pattern."""
+    for pattern in EXCLUDE_PATTERNS:
+        if pattern.endswith('/'):
+            if is_dir and fnmatch.fnmatchcase(name, pattern[:-1]):
+                return True
+        elif not is_dir and fnmatch.fnmatchcase(name, pattern):
+            return True
+    return False
+
+
+def list_directory(path: str, previous: dict = None) -> dict:
+    """
+    Manifest entry of one directory.
+
+    Parameters
+    ----------
+    path : str
+        The directory.
+    previous : dict, optional
+        The entry of the directory in the previous manifest, reused as is
+        if the directory mtime did not change.
+
+    Returns
+    -------
+    dict
+        {"mtime_ns": int, "files": [[name, size, mtime_ns], ...], "dirs": [name, ...]}
+        sorted by name, None if the directory cannot be read.
+    """
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    if previous is not None and previous['mtime_ns'] == mtime_ns:
+        return previous
+
+    files, dirs = [], []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not excluded(entry.name, True):
+                            dirs.append(entry.name)
+                    elif entry.is_file() and not excluded(entry.name, False):
+                        st = entry.stat()
+                        files.append([entry.name, st.st_size, st.st_mtime_ns])
+                except OSError:
+                    continue
+    except OSError:
+        return None
+    return dict(mtime_ns=mtime_ns, files=sorted(files), dirs=sorted(dirs))
+
+
+def crawl(data_dir: str, previous: dict = None, max_workers: int = MAX_WORKERS) -> dict:
+    """
+    Crawl a dataset tree in parallel.
+
+    Parameters
+    ----------
+    data_dir : str
+        The dataset data directory (e.g. /gdex/data/d010077).
+    previous : dict, optional
+        The manifest of the previous crawl, its unchanged directories are not listed again.
+    max_workers : int
+        Number of directories listed concurrently.
+
+    Returns
+    -------
+    dict
+        Relative directory path ('' for data_dir) to its entry (see `list_directory`).
+    """
+    previous = previous or {}
+    dirs = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(list_directory, data_dir, previous.get('')): ''}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                relpath = pending.pop(future)
+                entry = future.result()
+                if entry is None:
+                    continue
+                dirs[relpath] = entry
+                # sub directories are always visited, their changes do not change the parent mtime
+                for name in entry['dirs']:
+                    sub = f'{relpath}/{name}' if relpath else name
+                    future = executor.submit(list_directory, os.path.join(data_dir, sub), previous.get(sub))
+                    pending[future] = sub
+    return dirs
+
+
+def load_manifest(path: str) -> dict:
+    """Directory entries of a saved manifest, {} if missing or of another version."""
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest['dirs']
+
+
+def save_manifest(path: str, dsid: str, dirs: dict) -> bool:
+    """Write the manifest (gzip JSON, no timestamp so unchanged trees give identical bytes)."""
+    manifest = dict(version=MANIFEST_VERSION, dsid=dsid, dirs=dirs)
+    data = json.dumps(manifest, separators=(',', ':'), sort_keys=True).encode('utf-8')
+    return write_atomic(path, gzip.compress(data, mtime=0))
+
+
+def count_files(dirs: dict) -> int:
+    """Number of files in the manifest."""
+    return sum(len(entry['files']) for entry in dirs.values())
+
+
+def subtree_sizes(dirs: dict) -> dict:
+    """Relative directory path to the total size of the files under it."""
+    sizes = {}
+    # deepest directories first so the children are summed before their parent
+    for relpath in sorted(dirs, key=lambda p: p.count('/') if p else -1, reverse=True):
+        entry = dirs[relpath]
+        size = sum(f[1] for f in entry['files'])
+        for name in entry['dirs']:
+            size += sizes.get(f'{relpath}/{name}' if relpath else name, 0)
+        sizes[relpath] = size
+    return sizes
+
+
+def _date(mtime_ns: int) -> str:
+    """ISO 8601 UTC date of a file mtime."""
+    return datetime.fromtimestamp(mtime_ns // 1_000_000_000, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def build_directory_catalog(dsid: str, relpath: str, entry: dict, sizes: dict):
+    """
+    Build the static catalog of one data directory.
+
+    Parameters
+    ----------
+    dsid : str
+        The dataset ID.
+    relpath : str
+        Directory path relative to the dataset data directory ('' for the top).
+    entry : dict
+        The manifest entry of the directory.
+    sizes : dict
+        Subtree sizes (see `subtree_sizes`).
+
+    Returns
+    -------
+    xml.etree.ElementTree.Element
+        The root catalog element (not prettified).
+    """
+    url_dir = f'files/{dsid}/{relpath}/' if relpath else f'files/{dsid}/'
+    name = relpath.rsplit('/', 1)[-1] if relpath else f'{dsid} Files'
+
+    root = ET.Element('catalog')
+    root.attrib['name'] = f'{dsid} Files/{relpath}' if relpath else f'{dsid} Files'
+    root.attrib['xmlns'] = 'http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0'
+    root.attrib['xmlns:xlink'] = 'http://www.w3.org/1999/xlink'
+    root.append(ET.Comment('Generated by src/static_catalog.py, do not edit'))
+
+    dataset = ET.SubElement(root, 'dataset')
+    dataset.attrib['name'] = name
+    dataset.attrib['ID'] = url_dir.rstrip('/')
+    metadata = ET.SubElement(dataset, 'metadata')
+    metadata.attrib['inherited'] = 'true'
+    service_name = ET.SubElement(metadata, 'serviceName')
+    service_name.text = 'all'
+    data_size = ET.SubElement(dataset, 'dataSize')
+    data_size.attrib['units'] = 'bytes'
+    data_size.text = str(sizes[relpath])
+
+    # sub directories first, then the files, both by name like the datasetScan
+    for sub in entry['dirs']:
+        sub_relpath = f'{relpath}/{sub}' if relpath else sub
+        if sub_relpath not in sizes:
+            continue
+        ref = ET.SubElement(dataset, 'catalogRef')
+        ref.attrib['xlink:href'] = f'{sub}/catalog.xml'
+        ref.attrib['xlink:title'] = sub
+        ref.attrib['name'] = ''
+        ref_size = ET.SubElement(ref, 'dataSize')
+        ref_size.attrib['units'] = 'bytes'
+        ref_size.text = str(sizes[sub_relpath])
+
+    for file_name, size, mtime_ns in entry['files']:
+        file_ds = ET.SubElement(dataset, 'dataset')
+        file_ds.attrib['name'] = file_name
+        file_ds.attrib['ID'] = url_dir + file_name
+        file_ds.attrib['urlPath'] = url_dir + file_name
+        file_size = ET.SubElement(file_ds, 'dataSize')
+        file_size.attrib['units'] = 'bytes'
+        file_size.text = str(size)
+        date = ET.SubElement(file_ds, 'date')
+        date.attrib['type'] = 'modified'
+        date.text = _date(mtime_ns)
+    return root
+
+
+def write_static_catalogs(dsid: str, dirs: dict, static_dir: str) -> int:
+    """
+    Write the static catalog of every directory and remove the ones of deleted directories.
+
+    Parameters
+    ----------
+    dsid : str
+        The dataset ID.
+    dirs : dict
+        The crawled directories (see `crawl`).
+    static_dir : str
+        Output directory of the dataset (<content dir>/static/<dsid>).
+
+    Returns
+    -------
+    int
+        Number of catalog files that changed.
+    """
+    sizes = subtree_sizes(dirs)
+    changed = 0
+    expected = set()
+    for relpath, entry in dirs.items():
+        catalog_file = os.path.join(static_dir, relpath, 'catalog.xml')
+        expected.add(os.path.normpath(catalog_file))
+        os.makedirs(os.path.dirname(catalog_file), exist_ok=True)
+        xml_str = catalog_to_xml(build_directory_catalog(dsid, relpath, entry, sizes))
+        changed += write_atomic(catalog_file, xml_str)
+
+    # catalogs of directories that no longer exist
+    for directory, _, names in os.walk(static_dir, topdown=False):
+        if 'catalog.xml' in names and os.path.normpath(os.path.join(directory, 'catalog.xml')) not in expected:
+            os.remove(os.path.join(directory, 'catalog.xml'))
+            changed += 1
+        if directory != static_dir and not os.listdir(directory):
+            os.rmdir(directory)
+    return changed
+
+
+def has_static_catalogs(content_dir: str, dsid: str) -> bool:
+    """True if the dataset is served through static catalogs in content_dir."""
+    return os.path.exists(os.path.join(content_dir, STATIC_DIR, dsid, 'catalog.xml'))
+
+
+def update_static_catalogs(
+    dsid: str,
+    content_dir: str,
+    min_files: int,
+    data_root: str = DATA_ROOT,
+    max_workers: int = MAX_WORKERS
+) -> bool:
+    """
+    Crawl a dataset and keep its static catalogs if it has at least min_files files.
+
+    Parameters
+    ----------
+    dsid : str
+        The dataset ID.
+    content_dir : str
+        The TDS content directory holding catalog_<dsid>.xml.
+    min_files : int
+        File count from which the dataset is served through static catalogs.
+    data_root : str
+        Directory of the dataset data directories.
+    max_workers : int
+        Number of directories listed concurrently.
+
+    Returns
+    -------
+    bool
+        True if the dataset uses static catalogs, False if it stays with the
+        datasetScan (its static catalogs, if any, are removed).
+    """
+    static_dir = os.path.join(content_dir, STATIC_DIR, dsid)
+    manifest_file = os.path.join(static_dir, MANIFEST_FILE)
+    dirs = crawl(os.path.join(data_root, dsid), load_manifest(manifest_file), max_workers)
+
+    if count_files(dirs) < min_files:
+        if os.path.isdir(static_dir):
+            shutil.rmtree(static_dir)
+        return False
+
+    write_static_catalogs(dsid, dirs, static_dir)
+    save_manifest(manifest_file, dsid, dirs)
+    return True
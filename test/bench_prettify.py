@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Benchmark of the catalog pretty printer in src/pretty_xml.py.
+
+Builds a synthetic THREDDS catalog (a dataset per data file with its
+properties and access elements, like a catalog with per-file datasets)
+and times the previous list-queue `prettify` of createXML.py against the
+stack based `pretty_xml.prettify`. The list queue holds the pending
+siblings, so it is quadratic in the width of the tree: the catalog is
+timed with all file datasets in one directory (flat) and with 500 per
+directory (nested). The outputs of both are compared on the synthetic
+catalogs and on every catalog in rda-tds/content/.
+
+Usage:
+    ./bench_prettify.py             # ~100,000 elements
+    ./bench_prettify.py 300000      # number of elements
+"""
+import os
+import sys
+import copy
+import glob
+import time
+import xml.etree.ElementTree as ET
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'src'))
+import pretty_xml  # noqa: E402
+
+# elements per synthetic file dataset (dataset, 2 properties, dataSize, date, access)
+ELEMENTS_PER_FILE = 6
+
+
+def legacy_prettify(element, indent='  '):
+    """The previous prettify of createXML.py: list queue, quadratic."""
+    queue = [(0, element)]  # (level, element)
+    while queue:
+        level, element = queue.pop(0)
+        children = [(level + 1, child) for child in list(element)]
+        if children:
+            element.text = '\n' + indent * (level+1)  # for child open
+        if queue:
+            element.tail = '\n' + indent * queue[0][0]  # for sibling open
+        else:
+            element.tail = '\n' + indent * (level-1)  # for parent close
+        queue[0:0] = children  # prepend so children come before siblings
+
+
+def synthetic_catalog(n_elements, files_per_dir=500):
+    """Catalog with about n_elements elements, one dataset per file in nested directories."""
+    root = ET.Element('catalog', name='d999999', version='1.0.1')
+    service = ET.SubElement(root, 'service', name='all', serviceType='Compound', base='')
+    ET.SubElement(service, 'service', name='odap', serviceType='OpenDAP', base='/thredds/dodsC/')
+    top = ET.SubElement(root, 'dataset', name='d999999 Synthetic dataset', ID='d999999')
+    ET.SubElement(top, 'metadata', inherited='true').text = 'synthetic'
+
+    n_files = n_elements // ELEMENTS_PER_FILE
+    directory = None
+    for i in range(n_files):
+        if i % files_per_dir == 0:
+            directory = ET.SubElement(top, 'dataset', name=f'{2000 + i // files_per_dir}')
+        name = f'file_{i:07d}.nc'
+        dataset = ET.SubElement(directory, 'dataset', name=name, ID=f'd999999/{name}', urlPath=f'files/d999999/{name}')
+        ET.SubElement(dataset, 'property', name='variable', value='T')
+        ET.SubElement(dataset, 'property', name='level', value='surface')
+        ET.SubElement(dataset, 'dataSize', units='Mbytes').text = str(i % 900 + 1)
+        ET.SubElement(dataset, 'date', type='modified').text = '2025-10-10T00:00:00Z'
+        ET.SubElement(dataset, 'access', serviceName='all', urlPath=f'files/d999999/{name}')
+    return root
+
+
+def timed(func, *args):
+    """Return seconds of func(*args)."""
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    n_elements = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    mismatches = 0
+    for layout, files_per_dir in (('flat', n_elements), ('nested', 500)):
+        root = synthetic_catalog(n_elements, files_per_dir)
+        size = sum(1 for _ in root.iter())
+        old_root, new_root = copy.deepcopy(root), copy.deepcopy(root)
+
+        t_old = timed(legacy_prettify, old_root)
+        t_new = timed(pretty_xml.prettify, new_root)
+        t_write = timed(ET.tostring, new_root)
+
+        print(f'{layout} catalog, {size:,} elements')
+        print(f'  list queue    : {t_old:8.3f} s')
+        print(f'  stack walk    : {t_new:8.3f} s  ({t_old / t_new:,.1f}x)')
+        print(f'  serialization : {t_write:8.3f} s')
+
+        # same whitespace on the synthetic catalogs and on the catalogs in the repo
+        if ET.tostring(old_root) != ET.tostring(new_root):
+            print(f'MISMATCH on the {layout} synthetic catalog')
+            mismatches += 1
+    catalogs = sorted(glob.glob(os.path.join(PROJECT_ROOT, 'rda-tds', 'content', 'catalog_*.xml')))
+    for catalog_file in catalogs:
+        old_tree, new_tree = ET.parse(catalog_file).getroot(), ET.parse(catalog_file).getroot()
+        legacy_prettify(old_tree)
+        pretty_xml.prettify(new_tree)
+        if ET.tostring(old_tree) != ET.tostring(new_tree):
+            print(f'MISMATCH on {catalog_file}')
+            mismatches += 1
+    if mismatches:
+        sys.exit(1)
+    print(f'output identical on the synthetic catalogs and {len(catalogs)} catalogs in rda-tds/content')
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+Offline check of the file cache simulator in src/cache_sim.py.
+
+Writes a small access log in a temporary log directory and checks:
+
+    request mapping     dodsC/ncss/fileServer paths to their cache entries,
+                        GRIB files also to RandomAccessFile, featureCollection
+                        paths (from a sample catalog) to GribCollection
+    LRU and cleanup     hand computed hits and opens of a short trace with
+                        maxFiles 2 and minFiles 1
+    scour               entries idle for a whole period are closed
+    current settings    read from rda-tds/content/threddsConfig.xml
+
+Usage:
+    ./check_cache_sim.py    # checks, exit 1 on failure
+"""
+import os
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'src'))
+import cache_sim  # noqa: E402
+from cache_sim import CacheSetting  # noqa: E402
+
+CATALOG = """<?xml version="1.0" encoding="UTF-8"?>
+<catalog xmlns="http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0" name="d999999">
+  <featureCollection name="d999999" featureType="GRIB2" path="aggregations/g/d999999/1">
+    <collection name="d999999" spec="/data/rda/data/d999999/.*grib2$"/>
+  </featureCollection>
+</catalog>
+"""
+# (second of the day, path, status)
+REQUESTS = [
+    (0, '/thredds/dodsC/files/d999999/a.nc.dds', 200),
+    (1, '/thredds/dodsC/files/d999999/a.nc.dods?T[0:1:3]', 200),
+    (2, '/thredds/ncss/grid/files/d999999/b.grib2/dataset.xml', 200),
+    (3, '/thredds/ncss/grid/files/d999999/b.grib2?var=T&accept=netcdf', 200),
+    (4, '/thredds/dodsC/aggregations/g/d999999/1/Best.dds', 200),
+    (5, '/thredds/dodsC/aggregations/g/d999999/2.das', 200),
+    (6, '/thredds/fileServer/files/d999999/a.nc', 200),
+    (7, '/thredds/dodsC/files/d999999/missing.nc.dds', 404),
+    (8, '/thredds/catalog/files/d999999/catalog.html', 200),
+]
+
+
+def check(condition, message):
+    if not condition:
+        print(f'FAILED: {message}')
+        sys.exit(1)
+
+
+def write_log(path, requests):
+    with open(path, 'w', encoding='utf-8') as f:
+        for second, request, status in requests:
+            stamp = f'10/Oct/2025:{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d} -0600'
+            f.write(f'10.0.0.1 - - [{stamp}] "GET {request} HTTP/1.1" {status} 100\n')
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, 'catalog_d999999.xml'), 'w', encoding='utf-8') as f:
+            f.write(CATALOG)
+        collection_paths = cache_sim.load_collection_paths(tmp)
+        check(collection_paths == ['aggregations/g/d999999/1'], f'featureCollection paths {collection_paths}')
+
+        log_file = os.path.join(tmp, 'localhost_access_log.2025-10-10.txt')
+        write_log(log_file, REQUESTS)
+        check(cache_sim.select_logs(tmp, '2025-10-10', '2025-10-10') == [log_file], 'select_logs')
+        traces = cache_sim.read_traces([log_file], collection_paths)
+        keys = {name: [key for _, key in trace] for name, trace in traces.items()}
+        check(keys['NetcdfFileCache'] == ['files/d999999/a.nc'] * 2 + ['files/d999999/b.grib2'] * 2
+              + ['aggregations/g/d999999/2'], f'NetcdfFileCache trace {keys["NetcdfFileCache"]}')
+        check(keys['RandomAccessFile'] == ['files/d999999/b.grib2'] * 2, 'GRIB file also in RandomAccessFile')
+        check(keys['GribCollection'] == ['aggregations/g/d999999/1'], 'featureCollection in GribCollection')
+        check(keys['HTTPFileCache'] == ['files/d999999/a.nc'], 'fileServer in HTTPFileCache')
+
+    # maxFiles 2, minFiles 1: the third file closes all but the new one
+    trace = [(t, key) for t, key in enumerate('aabcab')]
+    result = cache_sim.simulate(trace, CacheSetting(1, 2, 0))
+    # a open, a hit, b open, c open (cleanup to 1: c), a open (a c), b open (cleanup to 1: b)
+    check((result.hits, result.opens, result.peak_open) == (1, 5, 2),
+          f'LRU cleanup: {result.hits} hits, {result.opens} opens, peak {result.peak_open}')
+
+    # scour every 60 s: a is idle for a whole period at t=60 and closed, b is kept (minFiles 1)
+    trace = [(0, 'a'), (10, 'b'), (70, 'b'), (130, 'a'), (135, 'b')]
+    result = cache_sim.simulate(trace, CacheSetting(1, 10, 60))
+    check((result.hits, result.opens) == (2, 3), f'scour: {result.hits} hits, {result.opens} opens')
+
+    current = cache_sim.load_cache_settings()
+    check(current['NetcdfFileCache'] == CacheSetting(5, 20, 660), f'NetcdfFileCache {current["NetcdfFileCache"]}')
+    settings = cache_sim.sweep_settings(current['GribCollection'], (0.5, 1, 2), [60, 300])
+    check(CacheSetting(20, 40, 60) in settings and current['GribCollection'] in settings, 'sweep_settings')
+    print('ok')
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"""
+Offline check of the GRIB featureCollection derivation in src/grib_collections.py.
+
+Writes small files with GRIB magic bytes in a temporary dataset directory,
+derives the collections and checks that the specs also match the files of
+later dates the TDM finds on its rescans:
+
+    gfs/gfs.0p25.2024010100.f000.grib2 ...   one date today   -> \\d+ for the date, dateFormatMark
+    monthly/x_2020_01.grb2 ...               one year today   -> \\d+ for the year
+    nested/2021/y.20210101.grb ...           sub directories  -> **/ with timePartition
+    mixed/a1.grib2, mixed/b_2.grib2          two patterns     -> shared prefix then .*
+
+Usage:
+    ./check_grib_collections.py    # checks, exit 1 on failure
+"""
+import os
+import re
+import sys
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'src'))
+import grib_collections  # noqa: E402
+
+DSID = 'd999999'
+SAMPLES = {
+    'gfs': ['gfs.0p25.2024010100.f000.grib2', 'gfs.0p25.2024010100.f003.grib2'],
+    'monthly': ['x_2020_01.grb2', 'x_2020_12.grb2'],
+    'nested': ['2021/y.20210101.grb', '2021/y.20210102.grb'],
+    'mixed': ['a1.grib2', 'b_2.grib2'],
+}
+# names of later files that must match the spec of their collection
+LATER = {
+    'gfs': 'gfs.0p25.2025063018.f384.grib2',
+    'monthly': 'x_2031_01.grb2',
+    'nested': 'y.20991231.grb',
+    'mixed': 'c_2030.grib2',
+}
+
+
+def check(condition, message):
+    if not condition:
+        print(f'FAILED: {message}')
+        sys.exit(1)
+
+
+def write_samples(data_dir):
+    """GRIB files (magic bytes and edition only) of SAMPLES."""
+    for relpath, names in SAMPLES.items():
+        for name in names:
+            path = os.path.join(data_dir, relpath, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            edition = 1 if name.endswith('.grb') else 2
+            with open(path, 'wb') as f:
+                f.write(b'GRIB' + b'\0\0\0' + bytes([edition]) + b'\0' * 8)
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as data_root:
+        write_samples(os.path.join(data_root, DSID))
+        collections = grib_collections.find_collections(DSID, webpaths=list(SAMPLES), data_root=data_root)
+        by_relpath = {collection.name.split(' ', 1)[1]: collection for collection in collections}
+        for collection in collections:
+            print(f'{collection.name}: {collection.spec} {collection.date_format_mark}')
+        check(sorted(by_relpath) == sorted(SAMPLES), f'one collection per directory: {sorted(by_relpath)}')
+
+        for relpath, collection in by_relpath.items():
+            regex = collection.spec.rsplit('/', 1)[1]
+            # no digit left outside the \d+ runs (the extension aside)
+            check(not re.search(r'\d', regex.replace(r'\d+', '').rsplit(r'\.', 1)[0]), f'digit literal in {regex}')
+            for name in SAMPLES[relpath] + [LATER[relpath]]:
+                check(re.search(regex, os.path.basename(name)), f'{regex} does not match {name}')
+
+        check(by_relpath['gfs'].spec.endswith(r'/gfs\.\d+p\d+\.\d+\.f\d+\.grib2$'), 'gfs spec')
+        check(by_relpath['gfs'].date_format_mark == '#gfs.0p25.#yyyyMMddHH', 'gfs dateFormatMark')
+        check(by_relpath['monthly'].spec.endswith(r'/x_\d+_\d+\.grb2$'), 'monthly spec')
+        check(by_relpath['nested'].feature_type == 'GRIB1' and by_relpath['nested'].time_partition == 'directory'
+              and '/nested/**/' in by_relpath['nested'].spec, 'nested GRIB1 collection partitioned by directory')
+        check(by_relpath['mixed'].spec.endswith(r'/.*\.grib2$'), 'mixed spec')
+
+    check(grib_collections.name_regex({'ab##_c#.grib2', 'ab#.grib2'}, 'ab12', '.grib2') == r'ab.*\.grib2$',
+          'trailing digits of the shared prefix dropped')
+    check(grib_collections.name_regex({'a#b#.grb', 'a#c.grb'}, 'a1', '.grb') == r'a.*\.grb$', 'prefix a1')
+    check(grib_collections.name_regex({'v#x#y.grb', 'v#x#z.grb'}, 'v2x3', '.grb') == r'v\d+x.*\.grb$',
+          'inner digit run of the shared prefix')
+    print('ok')
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+"""
+Offline check of the NcML aggregation generator in src/ncml_aggregation.py.
+
+Writes small netCDF classic sample files (standard library only, no
+netCDF4 needed) in a temporary dataset directory, runs
+`scan_aggregations` on them twice and checks the aggregations:
+
+    ts/T/T.2000.nc ...   record time, same units     -> joinExisting with coordValue
+    ts/Q/Q.2000.nc ...   a time per file as units    -> timeUnitsChange, ncoords only
+    ovl/x.1.nc ...       overlapping times           -> skipped
+    mix/m.1.nc ...       same names, T or Q          -> one aggregation per variable
+    const/c.1.nc ...     no time coordinate          -> skipped
+    nc4/n.1.nc ...       netCDF-4, netCDF4 missing   -> skipped, not cached
+
+The second run must read no file but the netCDF-4 ones (coordinate cache)
+and `load_aggregations` must give the same aggregations. A third run with a
+netCDF-4 reader then reads them and aggregates the group.
+
+Usage:
+    ./check_ncml_aggregation.py             # checks, exit 1 on failure
+    ./check_ncml_aggregation.py [out dir]   # also keep the sample files in [out dir]
+"""
+import os
+import sys
+import struct
+import tempfile
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'src'))
+import ncml_aggregation  # noqa: E402
+
+DSID = 'd999999'
+NC_CHAR, NC_FLOAT, NC_DOUBLE = 2, 5, 6
+HDF5_SIGNATURE = b'\x89HDF\r\n\x1a\n'
+
+
+def _name(name):
+    data = name.encode('ascii')
+    return struct.pack('>I', len(data)) + data + b'\0' * (-len(data) % 4)
+
+
+def _attributes(attributes):
+    if not attributes:
+        return struct.pack('>II', 0, 0)
+    data = struct.pack('>II', 12, len(attributes))
+    for name, value in attributes.items():
+        data += _name(name) + struct.pack('>I', NC_CHAR) + _name(value)
+    return data
+
+
+def write_classic(path, times, units, variables=('T',), with_time=True, streaming=False):
+    """Write a CDF1 file with a record time, a lat(2) coordinate and float variables (time, lat)."""
+    dims = [('time', 0), ('lat', 2)]
+    # (name, dim ids, attributes, type, vsize, is record)
+    var_defs = [('lat', [1], {'units': 'degrees_north'}, NC_FLOAT, 8, False)]
+    if with_time:
+        var_defs.append(('time', [0], {'units': units, 'calendar': 'standard'}, NC_DOUBLE, 8, True))
+    var_defs += [(name, [0, 1], {'units': 'K'}, NC_FLOAT, 8, True) for name in variables]
+
+    def header(begins):
+        data = b'CDF\x01' + struct.pack('>I', 0xFFFFFFFF if streaming else len(times))
+        data += struct.pack('>II', 10, len(dims))
+        for name, length in dims:
+            data += _name(name) + struct.pack('>I', length)
+        data += _attributes({})
+        data += struct.pack('>II', 11, len(var_defs))
+        for (name, dim_ids, attributes, nc_type, vsize, _), begin in zip(var_defs, begins):
+            data += _name(name) + struct.pack('>I', len(dim_ids)) + b''.join(struct.pack('>I', d) for d in dim_ids)
+            data += _attributes(attributes) + struct.pack('>III', nc_type, vsize, begin)
+        return data
+
+    header_size = len(header([0] * len(var_defs)))
+    begins, offset = [], header_size
+    for _, _, _, _, vsize, is_record in var_defs:  # fixed variables first
+        if not is_record:
+            begins.append(offset)
+            offset += vsize
+    record_begin = offset
+    for _, _, _, _, vsize, is_record in var_defs:
+        if is_record:
+            begins.append(offset)
+            offset += vsize
+    recsize = offset - record_begin
+
+    with open(path, 'wb') as f:
+        f.write(header(begins))
+        f.write(struct.pack('>2f', -45.0, 45.0))
+        for i, value in enumerate(times):
+            record = b''
+            for name, _, _, _, _, is_record in var_defs:
+                if name == 'time':
+                    record += struct.pack('>d', value)
+                elif is_record:
+                    record += struct.pack('>2f', 280.0 + i, 281.0 + i)
+            assert len(record) == recsize
+            f.write(record)
+
+
+def write_samples(data_dir):
+    """The sample dataset of the module docstring."""
+    for sub in ('ts/T', 'ts/Q', 'ovl', 'mix', 'const', 'nc4'):
+        os.makedirs(os.path.join(data_dir, sub), exist_ok=True)
+    for i, year in enumerate((2000, 2001, 2002)):
+        write_classic(os.path.join(data_dir, f'ts/T/T.{year}.nc'), [i * 12 + m for m in range(12)],
+                      'months since 2000-01-01', streaming=year == 2001)
+        write_classic(os.path.join(data_dir, f'ts/Q/Q.{year}.nc'), [0.0, 6.0, 12.5],
+                      f'hours since {year}-01-01', variables=('Q',))
+    write_classic(os.path.join(data_dir, 'ovl/x.1.nc'), [0, 1, 2], 'days since 2000-01-01')
+    write_classic(os.path.join(data_dir, 'ovl/x.2.nc'), [2, 3], 'days since 2000-01-01')
+    for i in range(4):
+        write_classic(os.path.join(data_dir, f'mix/m.{i}.nc'), [i * 2, i * 2 + 1], 'days since 2000-01-01',
+                      variables=('T',) if i % 2 else ('Q',))
+        write_classic(os.path.join(data_dir, f'const/c.{i}.nc'), [0], '', with_time=False)
+    for i in range(2):
+        with open(os.path.join(data_dir, f'nc4/n.{i}.nc'), 'wb') as f:
+            f.write(HDF5_SIGNATURE + b'\0' * 8)
+
+
+def check(condition, message):
+    if not condition:
+        print(f'FAILED: {message}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        data_root = sys.argv[1] if len(sys.argv) > 1 else os.path.join(tmp, 'data')
+        content_dir = os.path.join(tmp, 'content')
+        write_samples(os.path.join(data_root, DSID))
+        # no netCDF-4 reader, whether or not netCDF4 is installed here
+        ncml_aggregation.netCDF4 = None
+
+        aggregations = ncml_aggregation.scan_aggregations(DSID, content_dir, data_root=data_root)
+        by_name = {aggregation.name: aggregation for aggregation in aggregations}
+        for aggregation in aggregations:
+            print(f'{aggregation.name}: {len(aggregation.files)} files, {aggregation.n_coords} time steps')
+
+        t = by_name.get(f'{DSID} ts/T (T)')
+        check(t is not None and [f[1] for f in t.files] == [12, 12, 12], 'T series of 3 x 12 months')
+        check(t.files[1][2] == ','.join(str(v) for v in range(12, 24)), 'coordValue of T.2001.nc (streaming numrecs)')
+        check(t.files[0][0] == f'/data/rda/data/{DSID}/ts/T/T.2000.nc', 'TDS location')
+        q = by_name.get(f'{DSID} ts/Q (Q)')
+        check(q is not None and q.time_units_change and all(f[2] == '' for f in q.files), 'Q timeUnitsChange')
+        check(sorted(by_name) == sorted([f'{DSID} ts/T (T)', f'{DSID} ts/Q (Q)', f'{DSID} mix (Q)', f'{DSID} mix (T)']),
+              'overlapping and time less groups skipped, mixed group split by variable')
+        check(by_name[f'{DSID} mix (T)'].files[0][2] == '2,3', 'coordValue of mix/m.1.nc')
+
+        # second run from the cache, only the netCDF-4 files (never read) are tried again
+        read = ncml_aggregation._read_time
+        n_read = []
+        ncml_aggregation._read_time = lambda path: n_read.append(os.path.relpath(path, data_root)) or read(path)
+        again = ncml_aggregation.scan_aggregations(DSID, content_dir, data_root=data_root)
+        check(again == aggregations and sorted(n_read) == [f'{DSID}/nc4/n.0.nc', f'{DSID}/nc4/n.1.nc'],
+              f'cached re-run read {n_read}')
+        check(ncml_aggregation.load_aggregations(DSID, content_dir) == aggregations, 'load_aggregations')
+
+        # netCDF4 installed: the netCDF-4 group is read and aggregated
+        ncml_aggregation.netCDF4 = object()
+        ncml_aggregation.read_netcdf4_time = lambda path: ncml_aggregation.TimeCoordinate(
+            'time', 'time', 'days since 2000-01-01', variables=['T'], values=[int(path[-4])])
+        n_read.clear()
+        with_nc4 = ncml_aggregation.scan_aggregations(DSID, content_dir, data_root=data_root)
+        check(len(n_read) == 2 and [a.name for a in with_nc4 if a not in aggregations] == [f'{DSID} nc4 (T)'],
+              'netCDF-4 group read once a reader is available')
+    print('ok')